@@ -0,0 +1,83 @@
+import logging
+from bitbot import NAME, batchrunner
+import sys
+import getopt
+
+logging.basicConfig(format='[%(asctime)s] [%(levelname)s]: %(message)s', level=logging.INFO)
+
+
+HELP_STR = f"""
+{'[-h, --help]':<24} this help page
+
+{'[-c, --config]':<24} the config files whose backtest bots to run, seperated by ';' or repeated
+{24*' '}     e.g.: -c "./myconfig.yml;./nightly.yml"
+
+{'[-b, --bots]':<24} the backtest bots to run, seperated by ';'; defaults to all of them
+{24*' '}     e.g.: -b "MyFavBot;My2ndFavBot"
+
+{'[-w, --workers]':<24} the number of worker processes, defaults to all cores
+
+{'[-o, --output]':<24} a file to write the results to, as CSV if it ends with .csv, as JSON otherwise
+
+{'[-n, --no-prefetch]':<24} do not download the history before the backtests
+"""
+
+
+def main(argv: list[str]):
+    print(NAME)
+
+    configs = []
+    bot_names = None
+    workers = None
+    output = ""
+    prefetch = True
+
+    try:
+        opts, _ = getopt.getopt(argv, "hc:b:w:o:n", ["help", "config=", "bots=", "workers=", "output=", "no-prefetch"])
+    except getopt.GetoptError as e:
+        print(e)
+        print(HELP_STR)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            print(HELP_STR)
+            sys.exit()
+        elif opt in ("-c", "--config"):
+            configs.extend(fp for fp in arg.split(";") if fp)
+        elif opt in ("-b", "--bots"):
+            bot_names = [name for name in arg.split(";") if name]
+        elif opt in ("-w", "--workers"):
+            workers = int(arg)
+        elif opt in ("-o", "--output"):
+            output = arg
+        elif opt in ("-n", "--no-prefetch"):
+            prefetch = False
+
+    if not configs:
+        configs = [r".\example_config.yml"]
+
+    runner = batchrunner.BatchRunner(configs, bot_names, workers, prefetch)
+    if not runner.jobs:
+        print("No backtest bots found in the configs")
+        sys.exit(2)
+
+    rows = runner.run()
+
+    print("\n\n### Backtests ###\n")
+    for row in rows:
+        if row["error"] is not None:
+            print(f"{row['bot'] + ' ' + row['market'] + ':':<48}ERROR {row['error']}")
+        else:
+            print(f"{row['bot'] + ' ' + row['market'] + ':':<48}{row['transactions']:>6} transactions "
+                  f"{round(row['success_rate']*100, 4):>10} % success {round(row['profit_increase']*100, 4):>10} %")
+
+    if output:
+        batchrunner.write_rows(rows, output)
+
+    # a failed bot fails scripted runs
+    if any(row["error"] is not None for row in rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,91 @@
+import logging
+import json
+from bitbot import NAME, benchmark
+import sys
+import getopt
+
+logging.basicConfig(format='[%(asctime)s] [%(levelname)s]: %(message)s', level=logging.INFO)
+
+
+HELP_STR = f"""
+{'[-h, --help]':<24} this help page
+
+{'[-n, --candles]':<24} the number of synthetic candles, defaults to 500000
+
+{'[-r, --repeat]':<24} the number of measurements of every benchmark, defaults to 5
+
+{'[-s, --seed]':<24} the seed of the synthetic candles, defaults to 0
+
+{'[-k, --only]':<24} the benchmarks to run, separated by ";"
+{24*' '}     e.g.: -k "backtest;parse", defaults to all of {';'.join(benchmark.BENCHMARKS)}
+
+{'[-p, --payloads]':<24} a directory with recorded recent.json and history.json candle responses
+
+{'[-o, --output]':<24} a file to write the results to as JSON
+
+{'[-b, --baseline]':<24} the JSON results of an earlier run to compare with
+{24*' '}     exits with status 1 if a benchmark is more than 10 % slower
+"""
+
+
+def main(argv: list[str]):
+    print(NAME)
+
+    candles = 500_000
+    repeat = 5
+    seed = 0
+    only = None
+    payloads = None
+    output = ""
+    baseline = ""
+
+    try:
+        opts, _ = getopt.getopt(argv, "hn:r:s:k:p:o:b:", ["help", "candles=", "repeat=", "seed=", "only=", "payloads=",
+                                                          "output=", "baseline="])
+    except getopt.GetoptError as e:
+        print(e)
+        print(HELP_STR)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            print(HELP_STR)
+            sys.exit()
+        elif opt in ("-n", "--candles"):
+            candles = int(arg)
+        elif opt in ("-r", "--repeat"):
+            repeat = int(arg)
+        elif opt in ("-s", "--seed"):
+            seed = int(arg)
+        elif opt in ("-k", "--only"):
+            only = arg.split(";")
+        elif opt in ("-p", "--payloads"):
+            payloads = arg
+        elif opt in ("-o", "--output"):
+            output = arg
+        elif opt in ("-b", "--baseline"):
+            baseline = arg
+
+    report = benchmark.run_benchmarks(candles, repeat, seed, payloads, only)
+
+    print(f"\n\n### Benchmarks {report['commit'] or ''} ###\n")
+    for res in report["results"]:
+        print(f"{res['name'] + ':':<40}{res['value']:>16.3f} {res['unit']}")
+
+    if output:
+        with open(output, "w", encoding="utf8") as f:
+            json.dump(report, f, indent=2)
+
+    if baseline:
+        with open(baseline, "r", encoding="utf8") as f:
+            changes = benchmark.compare(json.load(f), report)
+
+        print(f"\n\n### Compared to {baseline} ###\n")
+        for change in changes:
+            flag = "  REGRESSED" if change["regressed"] else ""
+            print(f"{change['name'] + ':':<40}{change['change'] * 100:>+9.1f} %{flag}")
+        if any(change["regressed"] for change in changes):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
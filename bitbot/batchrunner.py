@@ -0,0 +1,188 @@
+import contextlib
+import csv
+import datetime as dt
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+import yaml
+from bitbot import services
+from bitbot.botmanager import bot_class
+from bitbot.services.candlestore import to_timestamp
+
+
+#### worker processes
+
+# the services of the worker process by name and parameters, shared by the bots it runs like in the BotManager
+_SERVICES = {}
+
+
+def service_key(cfg: dict[str, any]) -> tuple[str, str]:
+    return cfg["service"], json.dumps(cfg.get("service_params", {}), sort_keys=True, default=str)
+
+
+def _get_service(cfg: dict[str, any]) -> services.ServiceInterface:
+    key = service_key(cfg)
+    if key not in _SERVICES:
+        _SERVICES[key] = getattr(services, cfg["service"])(**cfg.get("service_params", {}))
+    return _SERVICES[key]
+
+
+def _backtest(config: str, name: str, cfg: dict[str, any]) -> list[dict[str, any]]:
+    """
+    Backtests one bot, see ``BacktestBot.report``. Errors are returned in the ``error`` column instead of raised, so
+    one broken bot does not stop the batch.
+
+    """
+    backtest_cfg = cfg["backtest"]
+    row = {
+        "config": config,
+        "bot": name,
+        "type": None,
+        "start": str(backtest_cfg.get("start")),
+        "end": str(backtest_cfg.get("end")),
+    }
+    # the batch keeps every core busy already, the bots evaluate their own windows or markets one at a time
+    cfg = dict(cfg, backtest=dict(backtest_cfg))
+    cfg["backtest"].setdefault("max_workers", 1)
+
+    started = time.perf_counter()
+    try:
+        bot_type = bot_class(cfg)
+        row["type"] = bot_type.__name__
+        # progress bars of the workers would only garble each other
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            reports = bot_type(name, cfg, _get_service(cfg)).report()
+        error = None
+    except Exception as e:
+        reports = [{"market": cfg.get("market", ";".join(cfg.get("markets", [])))}]
+        error = f"{type(e).__name__}: {e}"
+    seconds = time.perf_counter() - started
+
+    return [{**row, **report, "seconds": seconds, "error": error} for report in reports]
+
+
+def write_rows(rows: list[dict[str, any]], fp: str):
+    """
+    Writes result rows as CSV if ``fp`` ends with ``.csv``, as JSON otherwise. The CSV has a column for every key of
+    any row.
+
+    """
+    if fp.lower().endswith(".csv"):
+        columns = list(dict.fromkeys(key for row in rows for key in row))
+        with open(fp, "w", encoding="utf8", newline="") as f:
+            writer = csv.DictWriter(f, columns)
+            writer.writeheader()
+            writer.writerows(rows)
+    else:
+        with open(fp, "w", encoding="utf8") as f:
+            json.dump(rows, f, indent=2, default=str)
+
+
+class BatchRunner:
+    """
+    Runs the backtest bots of one or more config files on a pool of worker processes without printing summaries or
+    waiting for any input, e.g.: for nightly runs or CI. Every bot with a ``backtest`` section is run the way the
+    ``BotManager`` would run it: as a ``BacktestBot``, ``WalkForwardBot`` or ``PortfolioBacktestBot``.
+
+    The history candles are downloaded once in this process before the backtests start, within the rate limit of a
+    single service instance, and cached in the ``CandleStore`` of the service. The workers then read
+    the cached days from disk, where their memory maps share the pages of the same files, instead of downloading
+    the same candles once per bot. Bots with the same service and ``service_params`` share one service instance per
+    worker process.
+
+    Attributes:
+        jobs (list[tuple[str, str, dict[str, any]]]): the config file, the name and the config of every bot to run
+
+    Args:
+        configs (list[str]): the paths of the config files
+        bot_names (list[str]=None): the bots to run; every backtest bot of the configs if ``None``
+        max_workers (int=None): the number of worker processes; all cores if ``None``
+        prefetch (bool=True): whether to download the history candles before the backtests
+
+    """
+
+    #: the number of days of history downloaded at a time by ``prefetch``
+    PREFETCH_DAYS = 30
+
+    def __init__(self, configs: list[str], bot_names: list[str] = None, max_workers: int = None, prefetch: bool = True):
+        self.jobs = []
+        for fp in configs:
+            with open(fp, "r") as stream:
+                config = yaml.safe_load(stream) or {}
+            for name, cfg in config.items():
+                if isinstance(cfg, dict) and "backtest" in cfg and (bot_names is None or name in bot_names):
+                    self.jobs.append((fp, name, cfg))
+
+        self.max_workers = max_workers or os.cpu_count()
+        self.prefetch_history = prefetch
+
+    def history_requests(self) -> dict[tuple[str, str], tuple[dict[str, any], set[tuple[str, pd.Timestamp, pd.Timestamp]]]]:
+        """
+        Method to collect the distinct history requests of all bots
+
+        Returns:
+            dict[tuple[str, str], tuple[dict[str, any], set[tuple[str, pandas.Timestamp, pandas.Timestamp]]]]: the
+            config of the service and the market, start and end of every request, by service name and parameters
+
+        """
+        requests = {}
+        for _, _, cfg in self.jobs:
+            backtest_cfg = cfg["backtest"]
+            markets = cfg.get("markets") or [cfg["market"]]
+            _, timeframes = requests.setdefault(service_key(cfg), (cfg, set()))
+            for market in markets:
+                timeframes.add((market, to_timestamp(backtest_cfg["start"]), to_timestamp(backtest_cfg["end"])))
+        return requests
+
+    def prefetch(self):
+        """
+        Method to download the history candles of all bots into the ``CandleStore`` of their services. Services
+        without a ``candle_store`` are skipped, they have nothing the workers could share. Gaps are left to the
+        backtests, which report them.
+
+        """
+        step = dt.timedelta(days=self.PREFETCH_DAYS)
+        chunks = []
+        for cfg, timeframes in self.history_requests().values():
+            service = getattr(services, cfg["service"])(**cfg.get("service_params", {}))
+            if not hasattr(service, "candle_store"):
+                continue
+            for market, start, end in sorted(timeframes):
+                while start < end:
+                    chunks.append((service, market, start, min(start + step, end)))
+                    start += step
+
+        for i, (service, market, start, end) in enumerate(chunks):
+            services.printProgressBar(i, len(chunks), f"{'Downloading history':<32}")
+            try:
+                service.get_history_data(market, services.CandleInterval.MINUTE_1, start, end)
+            except services.HistoryGapError as e:
+                logging.warning(e)
+        if chunks:
+            services.printProgressBar(len(chunks), len(chunks), f"{'Downloading history':<32}")
+
+    def run(self) -> list[dict[str, any]]:
+        """
+        Runs all bots
+
+        Returns:
+            list[dict[str, any]]: the rows of all bots in the order of the configs, see ``BacktestBot.report``: the
+            ``config``, ``bot``, ``type``, ``start`` and ``end`` of the bot, the ``market``, the ``backtest_stats``,
+            the ``seconds`` the bot took and the ``error`` it failed with, ``None`` if it did not
+
+        """
+        if self.prefetch_history:
+            self.prefetch()
+
+        results = [None] * len(self.jobs)
+        with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(_backtest, fp, name, cfg): i
+                       for i, (fp, name, cfg) in enumerate(self.jobs)}
+            services.printProgressBar(0, max(len(futures), 1), f"{'Backtesting':<32}")
+            for done, future in enumerate(as_completed(futures), 1):
+                results[futures[future]] = future.result()
+                services.printProgressBar(done, len(futures), f"{'Backtesting':<32}")
+        return [row for rows in results for row in rows]
@@ -0,0 +1,471 @@
+import datetime as dt
+import json
+import logging
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from bitbot import bots, services, strategy
+from bitbot.services.candlestore import to_timestamp
+from bitbot.services.simulated import synthetic_candles
+from bitbot.strategy import cache, indicators
+
+#: the strategy configurations the backtests are run with; strategies missing here are skipped
+STRATEGY_CONFIGS = {
+    "MacdRsiAlgorithm": {
+        "name": "MacdRsiAlgorithm",
+        "ta_params": {"macd": {"window_slow": 26, "window_fast": 12, "window_sign": 9}, "rsi": {"window": 14}},
+        "trigger_params": {"rsi_buy": 25, "rsi_sell": 75, "macd_trigger_diff": 5},
+    },
+    "TrendFollowing": {
+        "name": "TrendFollowing",
+        "ta_params": {"roc": {"window": 14}},
+        "trigger_params": {"sell_high": 0.3, "sell_low": -0.2, "buy_percentage": 0.2},
+    },
+}
+
+#: the indicators whose calculation is measured, with their parameters
+INDICATOR_PARAMS = {
+    "rsi": {"window": 14},
+    "macd": {"window_slow": 26, "window_fast": 12, "window_sign": 9},
+    "roc": {"window": 14},
+}
+
+#: the tolerance of the numpy kernels compared to ta; they differ by rounding only
+KERNEL_RTOL = 1e-9
+KERNEL_ATOL = 1e-9
+
+#: the number of candles of a recent candles response
+RECENT_CANDLES = 1440
+
+MARKET = "BTC-EUR"
+
+
+def candle_payload(candles: pd.DataFrame) -> bytes:
+    """
+    Encodes candles as the BitTrex api responds with them
+
+    Args:
+        candles (pandas.DataFrame): the candles, see ``synthetic_candles``
+
+    Returns:
+        bytes: the JSON response
+
+    """
+    columns = {"startsAt": candles["startsat"].dt.strftime("%Y-%m-%dT%H:%M:%SZ").to_numpy()}
+    for col in services.CandleStore.COLUMNS:
+        columns[col] = np.char.mod("%.8f", candles[col.lower()].to_numpy(dtype=np.float64))
+    payload = [dict(zip(columns, values)) for values in zip(*columns.values())]
+    return json.dumps(payload).encode()
+
+
+class StubService(services.ServiceInterface):
+    """
+    Offline service serving synthetic candles. Every request of recent candles advances the clock by one candle,
+    so every iteration of a bot loop sees exactly one new closed candle. Orders are filled at the last close.
+
+    Args:
+        candles (pandas.DataFrame): the candles to serve, see ``synthetic_candles``
+        visible (int=1440): the number of candles that have closed when the service is created
+
+    """
+    def __init__(self, candles: pd.DataFrame, visible: int = RECENT_CANDLES):
+        super().__init__()
+        self.candles = candles
+        self.times = candles["startsat"].dt.tz_convert(None).to_numpy().astype("datetime64[ns]").view(np.int64)
+        self.visible = visible
+
+    def get_available_balance(self, currency: str) -> float:
+        return float("inf")
+
+    def get_market_ticker(self, market: str) -> dict[str, str]:
+        return {"symbol": market, "lastTradeRate": str(self.candles["close"].iloc[self.visible - 1])}
+
+    def get_candles(self, market: str, candleinterval: services.CandleInterval) -> pd.DataFrame:
+        return self.candles.iloc[max(0, self.visible - RECENT_CANDLES):self.visible].reset_index(drop=True)
+
+    def get_recent_candles(self, market: str, candleinterval: services.CandleInterval, since: int = None) -> dict[str, np.ndarray]:
+        self.visible = min(self.visible + 1, len(self.times))
+        start = max(0, self.visible - RECENT_CANDLES)
+        if since is not None:
+            start = max(start, int(np.searchsorted(self.times, since, side="right")))
+        out = {"startsat": self.times[start:self.visible]}
+        for col in ("open", "high", "low", "close", "volume", "quotevolume"):
+            out[col] = self.candles[col].to_numpy()[start:self.visible]
+        return out
+
+    def place_order(self, order: services.Order) -> dict[str, str]:
+        close = float(self.candles["close"].iloc[self.visible - 1])
+        return {"id": order.client_order_id, "clientOrderId": order.client_order_id, "status": "CLOSED",
+                "fillQuantity": str(order.quantity), "proceeds": str(order.quantity * close), "commission": "0"}
+
+    def get_history_data(self, market: str, candleinterval: services.CandleInterval, start: dt.datetime, end: dt.datetime) -> pd.DataFrame:
+        lo, hi = np.searchsorted(self.times, [to_timestamp(start).value, to_timestamp(end).value])
+        return self.candles.iloc[lo:hi].reset_index(drop=True)
+
+
+class RecordedBitTrex(services.BitTrex):
+    """
+    BitTrex service that answers every request with a recorded response instead of requesting the api, to measure
+    the parsing of the responses offline
+
+    Args:
+        responses (dict[str, bytes]): the ``recent`` and the ``history`` candles response
+        candle_store (services.CandleStore): the store history candles are cached in
+
+    """
+    def __init__(self, responses: dict[str, bytes], candle_store: services.CandleStore):
+        # without api credentials
+        services.ServiceInterface.__init__(self)
+        self.service_name = "bittrex"
+        self.candle_store = candle_store
+        self.max_workers = 1
+        self.responses = responses
+
+    def api_request(self, url: str, method: str = None, params: dict = None, body: dict or str = None,
+                    headers: dict[str, str] = None, raw: bool = False):
+        response = self.responses["history" if "/historical/" in url else "recent"]
+        return response if raw else json.loads(response)
+
+
+class StubMarkets(services.ServiceInterface):
+    """
+    Offline service serving the history candles of many markets, each from its own ``StubService``
+
+    Args:
+        candles (dict[str, pandas.DataFrame]): the candles to serve by market
+
+    """
+    def __init__(self, candles: dict[str, pd.DataFrame]):
+        super().__init__()
+        self.markets = {market: StubService(frame) for market, frame in candles.items()}
+
+    def get_history_data(self, market: str, candleinterval: services.CandleInterval, start: dt.datetime, end: dt.datetime) -> pd.DataFrame:
+        return self.markets[market].get_history_data(market, candleinterval, start, end)
+
+
+def measure(func: callable, repeat: int = 5, setup: callable = None) -> list[float]:
+    """
+    Measures the seconds ``func`` takes, ``repeat`` times
+
+    Args:
+        func (callable): the function to measure
+        repeat (int=5): the number of measurements
+        setup (callable=None): called before every measurement, not measured
+
+    Returns:
+        list[float]
+
+    """
+    seconds = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+def result(name: str, seconds: list[float], count: int, unit: str) -> dict[str, any]:
+    """
+    Builds the result of a benchmark from its measurements
+
+    Args:
+        name (str): the name of the benchmark
+        seconds (list[float]): the measured seconds
+        count (int): the number of items processed per measurement, e.g.: candles
+        unit (str): ``"<item>/s"`` for throughputs, higher is better; ``"us/<item>"`` for costs, lower is better
+
+    Returns:
+        dict[str, any]: the ``name``, ``unit``, ``value`` of the fastest measurement, ``median``, ``count`` and
+        ``seconds`` of all measurements
+
+    """
+    if unit.endswith("/s"):
+        values = [count / s for s in seconds]
+        best = max(values)
+    else:
+        values = [s / count * 1e6 for s in seconds]
+        best = min(values)
+    return {
+        "name": name,
+        "unit": unit,
+        "value": best,
+        "median": float(np.median(values)),
+        "count": count,
+        "seconds": seconds,
+    }
+
+
+#### benchmarks
+
+def bench_backtests(candles: pd.DataFrame, repeat: int = 5) -> list[dict[str, any]]:
+    """
+    Measures the backtest throughput of every strategy in ``bitbot.strategy``: applying the indicators, generating
+    the orders and calculating the transactions. The indicator cache is cleared before every measurement.
+
+    """
+    start = candles["startsat"].iloc[0]
+    end = candles["startsat"].iloc[-1] + pd.Timedelta(minutes=1)
+    service = StubService(candles)
+
+    out = []
+    for name, cls in vars(strategy).items():
+        if not isinstance(cls, type) or not issubclass(cls, strategy.TradingStrategyInterface) \
+                or cls is strategy.TradingStrategyInterface:
+            continue
+        if name not in STRATEGY_CONFIGS:
+            logging.warning(f"* benchmark: no configuration for {name}, skipping it")
+            continue
+
+        bot = bots.BacktestBot(name, {"market": MARKET, "quantity": 1, "backtest": {"start": start, "end": end},
+                                      "strat": STRATEGY_CONFIGS[name]}, service=service)
+
+        def backtest():
+            frame = bot.load_candles()
+            orders = bot.generate_orders(frame)
+            bots.backtestbot.calc_transactions(frame["close"].to_numpy(), orders, 1)
+
+        def setup():
+            cache.INDICATOR_CACHE.clear()
+            bot.strat.next_action = services.OrderDirection.BUY
+
+        out.append(result(f"backtest.{name}", measure(backtest, repeat, setup), len(candles), "candles/s"))
+    return out
+
+
+def bench_portfolio(candles: pd.DataFrame, repeat: int = 5, markets: int = 10, seed: int = 0) -> list[dict[str, any]]:
+    """
+    Measures the throughput of the portfolio backtest of every strategy in ``STRATEGY_CONFIGS`` on ``markets``
+    markets of synthetic candles, as many candles in total as the other backtests
+
+    """
+    start = candles["startsat"].iloc[0]
+    frames = {f"M{i}-EUR": synthetic_candles(len(candles) // markets, start.to_pydatetime(), seed + i)
+              for i in range(markets)}
+    end = start + pd.Timedelta(minutes=len(candles) // markets)
+    service = StubMarkets(frames)
+
+    out = []
+    for name, strat_cfg in STRATEGY_CONFIGS.items():
+        bot = bots.PortfolioBacktestBot(name, {"markets": list(frames), "quantity": 1, "strat": strat_cfg,
+                                               "backtest": {"start": start, "end": end}}, service=service)
+        out.append(result(f"portfolio.{name}", measure(bot.backtest, repeat), len(frames) * (len(candles) // markets),
+                          "candles/s"))
+    return out
+
+
+def bench_indicators(candles: pd.DataFrame, repeat: int = 5) -> list[dict[str, any]]:
+    """
+    Measures the cost of the indicators: calculating them over all candles, as backtests do, and updating the
+    streaming indicators of the live loop with a single candle
+
+    """
+    strat = strategy.TradingStrategyInterface(None, {"trigger_params": {}}, MARKET)
+    numpy_strat = strategy.TradingStrategyInterface(None, {"trigger_params": {}, "indicators": "numpy"}, MARKET)
+    closes = candles["close"].to_numpy(dtype=np.float64)
+
+    out = []
+    for name, params in INDICATOR_PARAMS.items():
+        calc = getattr(strat, f"calc_{name}")
+        seconds = measure(lambda: calc(candles, **params), repeat, cache.INDICATOR_CACHE.clear)
+        out.append(result(f"indicator.{name}", seconds, len(candles), "us/candle"))
+
+        calc_numpy = getattr(numpy_strat, f"calc_{name}")
+        seconds = measure(lambda: calc_numpy(candles, **params), repeat, cache.INDICATOR_CACHE.clear)
+        out.append(result(f"indicator.{name}.numpy", seconds, len(candles), "us/candle"))
+        # the kernels have to match ta
+        expected, actual = calc(candles, **params), calc_numpy(candles, **params)
+        for col in actual.columns.difference(candles.columns):
+            if not np.allclose(actual[col], expected[col], rtol=KERNEL_RTOL, atol=KERNEL_ATOL, equal_nan=True):
+                logging.warning(f"* benchmark: the numpy kernel of {col} deviates from ta")
+
+        ind = indicators.INDICATORS[name](**params)
+        ind.seed(closes[:RECENT_CANDLES])
+        updates = closes[RECENT_CANDLES:RECENT_CANDLES + 100_000].tolist()
+
+        def update():
+            for close in updates:
+                ind.update(close)
+
+        out.append(result(f"indicator.{name}.update", measure(update, repeat), len(updates), "us/update"))
+    return out
+
+
+def bench_parsing(candles: pd.DataFrame, repeat: int = 5, payloads: str = None) -> list[dict[str, any]]:
+    """
+    Measures the conversion of candle responses into frames: ``get_candles`` and ``get_recent_candles`` with a recent
+    candles response and ``get_history_data`` with a response of one day, once downloaded into an empty candle
+    store and once read from the store
+
+    Args:
+        payloads (str=None): a directory with recorded ``recent.json`` and ``history.json`` responses; synthetic
+            responses are measured if ``None``
+
+    """
+    day = candles.iloc[:RECENT_CANDLES]
+    responses = {"recent": candle_payload(day), "history": candle_payload(day)}
+    if payloads is not None:
+        for name in responses:
+            with open(os.path.join(payloads, f"{name}.json"), "rb") as f:
+                responses[name] = f.read()
+    recent = len(json.loads(responses["recent"]))
+    history = json.loads(responses["history"])
+    start = pd.Timestamp(history[0]["startsAt"]).normalize()
+    end = start + pd.Timedelta(days=1)
+
+    out = []
+    with tempfile.TemporaryDirectory() as root:
+        store = services.CandleStore(root)
+        service = RecordedBitTrex(responses, store)
+
+        seconds = measure(lambda: service.get_candles(MARKET, services.CandleInterval.MINUTE_1), repeat)
+        out.append(result("parse.get_candles", seconds, recent, "candles/s"))
+        seconds = measure(lambda: service.get_recent_candles(MARKET, services.CandleInterval.MINUTE_1), repeat)
+        out.append(result("parse.get_recent_candles", seconds, recent, "candles/s"))
+
+        def empty_store():
+            store.root = tempfile.mkdtemp(dir=root)
+
+        get_history = lambda: service.get_history_data(MARKET, services.CandleInterval.MINUTE_1, start, end)
+        out.append(result("parse.get_history_data.download", measure(get_history, repeat, empty_store),
+                          len(history), "candles/s"))
+        out.append(result("parse.get_history_data.store", measure(get_history, repeat), len(history), "candles/s"))
+    return out
+
+
+def bench_bot_loop(iterations: int = 1000, repeat: int = 5, seed: int = 0) -> list[dict[str, any]]:
+    """
+    Measures the cost of an iteration of ``Bot.run`` against a ``StubService``, without the wait between the
+    iterations: requesting the market data, updating the streaming indicators with the new candle, evaluating the
+    strategy and submitting the orders of its signals
+
+    """
+    # candles that have all closed by now
+    n = RECENT_CANDLES + repeat * iterations + 1
+    start = pd.Timestamp.now("UTC").floor("min") - pd.Timedelta(minutes=n + 2)
+    candles = synthetic_candles(n, start.to_pydatetime(), seed)
+
+    out = []
+    with tempfile.TemporaryDirectory() as root:
+        for name, strat_cfg in STRATEGY_CONFIGS.items():
+            config = {"market": MARKET, "quantity": 1, "lookback": RECENT_CANDLES, "update_interval": 0,
+                      "strat": strat_cfg, "journal": {"path": os.path.join(root, f"{name}.trades")}}
+            bot = bots.Bot(name, config, service=StubService(candles))
+            try:
+                # seeds the indicators
+                bot.step()
+
+                def loop():
+                    for _ in range(iterations):
+                        bot.step()
+
+                out.append(result(f"bot.step.{name}", measure(loop, repeat), iterations, "us/iteration"))
+            finally:
+                bot.orders.close()
+                bot.journal.flush()
+    return out
+
+
+def git_commit() -> str or None:
+    """
+    Returns the commit of the working tree or ``None`` if it is not a git checkout
+
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+#: the benchmark groups by name
+BENCHMARKS = ["backtest", "portfolio", "indicator", "parse", "bot"]
+
+
+def run_benchmarks(candles: int = 500_000, repeat: int = 5, seed: int = 0, payloads: str = None,
+                   only: list[str] = None) -> dict[str, any]:
+    """
+    Runs the benchmarks. Needs no network access.
+
+    Args:
+        candles (int=500000): the number of synthetic candles of the backtests and indicators
+        repeat (int=5): the number of measurements of every benchmark
+        seed (int=0): the seed of the synthetic candles
+        payloads (str=None): a directory with recorded responses, see ``bench_parsing``
+        only (list[str]=None): the ``BENCHMARKS`` groups to run; all if ``None``
+
+    Returns:
+        dict[str, any]: the environment of the run and the ``results``, see ``result``
+
+    """
+    only = only or BENCHMARKS
+    data = synthetic_candles(candles, seed=seed)
+
+    # logging of the bots slows down the loops that are measured
+    logger = logging.getLogger()
+    disabled, logger.disabled = logger.disabled, True
+    try:
+        results = []
+        if "backtest" in only:
+            results += bench_backtests(data, repeat)
+        if "portfolio" in only:
+            results += bench_portfolio(data, repeat, seed=seed)
+        if "indicator" in only:
+            results += bench_indicators(data, repeat)
+        if "parse" in only:
+            results += bench_parsing(data, repeat, payloads)
+        if "bot" in only:
+            results += bench_bot_loop(repeat=repeat, seed=seed)
+    finally:
+        logger.disabled = disabled
+
+    return {
+        "commit": git_commit(),
+        "time": dt.datetime.utcnow().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "candles": candles,
+        "repeat": repeat,
+        "seed": seed,
+        "results": results,
+    }
+
+
+def compare(baseline: dict[str, any], current: dict[str, any], threshold: float = 0.1) -> list[dict[str, any]]:
+    """
+    Compares the results of two benchmark runs, e.g.: of two commits
+
+    Args:
+        baseline (dict[str, any]): the earlier run, see ``run_benchmarks``
+        current (dict[str, any]): the later run
+        threshold (float=0.1): the relative slowdown from which a benchmark counts as regressed
+
+    Returns:
+        list[dict[str, any]]: the ``name``, ``unit``, ``baseline`` and ``current`` value, relative ``change`` and
+        whether it ``regressed`` of every benchmark in both runs. A positive change is an improvement.
+
+    """
+    before = {res["name"]: res for res in baseline["results"]}
+    out = []
+    for res in current["results"]:
+        if res["name"] not in before or before[res["name"]]["unit"] != res["unit"]:
+            continue
+        old = before[res["name"]]["value"]
+        change = res["value"] / old - 1 if res["unit"].endswith("/s") else old / res["value"] - 1
+        out.append({
+            "name": res["name"],
+            "unit": res["unit"],
+            "baseline": old,
+            "current": res["value"],
+            "change": change,
+            "regressed": change < -threshold,
+        })
+    return out
@@ -1,31 +1,279 @@
+import asyncio
+import datetime as dt
+import json
 import logging
-from bitbot import bots
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from bitbot import metrics, scheduler
 import yaml
 import subprocess
 
 
+def bot_class(cfg: dict[str, any]) -> type:
+    """
+    Returns the class of the bot a config section defines: a ``PortfolioBacktestBot`` for a ``backtest`` of several
+    ``markets``, a ``WalkForwardBot`` for a ``walk_forward`` backtest, a ``BacktestBot`` for any other ``backtest``
+    and a live ``Bot`` otherwise
+
+    """
+    from bitbot import bots
+
+    if "backtest" in cfg and "markets" in cfg:
+        return bots.PortfolioBacktestBot
+    if "backtest" in cfg and "walk_forward" in cfg["backtest"]:
+        return bots.WalkForwardBot
+    if "backtest" in cfg:
+        return bots.BacktestBot
+    return bots.Bot
+
+
 class BotManager:
-    def __init__(self, fp: str):
+    """
+    Loads the bots of a config file and runs them, either one blocking bot at a time or all as cooperative tasks
+    in a single event loop. Bots are built when they are started, so starting one bot of a large config neither
+    builds the others nor imports the modules only they need. Bots with the same service and ``service_params``
+    share one service instance, with one session, rate limit and market data stream.
+
+    Attributes:
+        config (dict[str, any]): the loaded configuration
+        bots (dict[str, bots.Bot]): the bots built so far by name
+        services (dict[tuple[str, str], services.ServiceInterface]): the services built so far by name and parameters
+        tasks (dict[str, asyncio.Task]): the tasks of the bots running in the event loop
+        scheduler (scheduler.CandleScheduler): the timer wheel waking all bots with a ``schedule`` in the event loop
+
+    Args:
+        fp (str): the path of the config file
+        max_workers (int=32): the number of threads for the blocking service calls of bots running in the event loop
+
+    """
+    def __init__(self, fp: str, max_workers: int = 32):
 
         with open(fp, "r") as stream:
             self.config = yaml.safe_load(stream)
-        
+
         self.bots = {}
-        
-        for name, cfg in self.config.items():
-            # initialize service class from imports
-            if "backtest" in cfg:
-                bot = bots.BacktestBot(name, cfg)
-            else:
-                bot = bots.Bot(name, cfg)
-
-            self.bots[name] = bot
-    
-    def start_bot(self, name: str):
-        if name not in self.bots:
+        self.services = {}
+        self._lock = threading.Lock()
+
+        self.tasks = {}
+        self.publishers = {}
+        self.max_workers = max_workers
+        self.executor = None
+        self.scheduler = scheduler.CandleScheduler()
+        self.loop = None
+        self._thread = None
+
+    def _get_service(self, cfg: dict[str, any]) -> "services.ServiceInterface":
+        from bitbot import services
+
+        params = cfg.get("service_params", {})
+        key = (cfg["service"], json.dumps(params, sort_keys=True, default=str))
+        if key not in self.services:
+            self.services[key] = getattr(services, cfg["service"])(**params)
+        return self.services[key]
+
+    def _get_bot(self, name: str) -> "bots.Bot":
+        if name not in self.config:
             raise ValueError(f"{name} not defined in config")
 
+        with self._lock:
+            if name not in self.bots:
+                cfg = self.config[name]
+                self.bots[name] = bot_class(cfg)(name, cfg, self._get_service(cfg))
+            return self.bots[name]
+
+    def start_bot(self, name: str):
+        bot = self._get_bot(name)
+        self.start_feed(name)
+        self.start_metrics(name)
+
         print(f"Starting {name} ...")
-        self.bots[name].run()
+        bot.run()
+
+    def start_metrics(self, name: str):
+        """
+        Starts exporting the metrics of the process, if the bot has a ``metrics`` section and is no backtest. All
+        bots of a process share the exporters, so bots configuring the same port or file export together.
+
+        ::
+
+            metrics:
+              port: 9464 # serves http://127.0.0.1:9464/metrics
+              host: 127.0.0.1 # optional
+              file: ./metrics/bitbot.prom # optional, written every interval seconds
+              interval: 15
+
+        Args:
+            name (str): the name of the bot
+
+        """
+        cfg = self.config[name].get("metrics")
+        if not cfg or "backtest" in self.config[name]:
+            return
+        if "port" in cfg:
+            metrics.REGISTRY.serve(cfg["port"], cfg.get("host", "127.0.0.1"))
+        if "file" in cfg:
+            metrics.REGISTRY.write_every(cfg["file"], cfg.get("interval", 15))
+
+    def start_feed(self, name: str):
+        """
+        Starts the publisher process of the shared market feed of a bot, if it has ``shared_feed`` enabled and no
+        other process publishes the market yet. Bots on the same market, service and candle interval share one
+        publisher, which requests the service once per interval for all of them.
+
+        Args:
+            name (str): the name of the bot
+
+        """
+        cfg = self.config[name]
+        if not cfg.get("shared_feed") or "backtest" in cfg:
+            return
+
+        from bitbot.services import feed
+
+        candleinterval = self._get_bot(name).service.determine_candle_interval(dt.timedelta(minutes=cfg["lookback"]))
+        key = feed.feed_name(cfg["service"], cfg["market"], candleinterval)
+        if key in self.publishers and self.publishers[key].is_alive():
+            return
+
+        # poll as often as the most frequently updated bot of the market needs it
+        update_interval = min(
+            other["update_interval"] for other in self.config.values()
+            if other.get("shared_feed") and "backtest" not in other and other["market"] == cfg["market"]
+            and other["service"] == cfg["service"]
+        )
+        process = feed.start_publisher(cfg["service"], cfg.get("service_params", {}), cfg["market"], candleinterval, update_interval)
+        if process is not None:
+            self.publishers[key] = process
+
+    #### event loop
+
+    def _create_task(self, name: str) -> asyncio.Task:
+        bot = self._get_bot(name)
+        if name in self.tasks and not self.tasks[name].done():
+            raise ValueError(f"{name} is already running")
+
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="bitbot")
+
+        self.start_feed(name)
+        self.start_metrics(name)
+        print(f"Starting {name} ...")
+        bot.scheduler = self.scheduler
+        task = asyncio.get_running_loop().create_task(bot.run_async(self.executor), name=name)
+        self.tasks[name] = task
+        return task
+
+    async def run_async(self, names: list[str]):
+        """
+        Runs the bots as tasks in the running event loop until all of them have stopped
+
+        Args:
+            names (list[str]): the names of the bots to run
+
+        """
+        tasks = [self._create_task(name) for name in names]
+        for name, res in zip(names, await asyncio.gather(*tasks, return_exceptions=True)):
+            if isinstance(res, Exception):
+                logging.error(f"* {name}: {res.__class__.__name__}: {str(res)}")
+
+    def run_bots(self, names: list[str]):
+        """
+        Runs the bots as tasks in a new event loop in the current thread until all of them have stopped or the
+        process is interrupted
+
+        Args:
+            names (list[str]): the names of the bots to run
+
+        """
+        try:
+            asyncio.run(self.run_async(names))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.tasks = {}
+            if self.executor is not None:
+                self.executor.shutdown(wait=False)
+                self.executor = None
+            self.stop_feeds()
+            metrics.REGISTRY.close()
+
+    def start_background(self):
+        """
+        Starts an event loop in a background thread, to which bots can be added with ``start_bot_background``
+
+        """
+        if self._thread is not None:
+            return
+
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="bitbot-loop", daemon=True)
+        self._thread.start()
+
+    def start_bot_background(self, name: str):
+        """
+        Starts a bot as a task in the background event loop
+
+        Args:
+            name (str): the name of the bot
+
+        """
+        self._get_bot(name)
+        self.start_background()
+
+        async def create():
+            self._create_task(name)
+
+        asyncio.run_coroutine_threadsafe(create(), self.loop).result()
+
+    def stop_bot(self, name: str):
+        """
+        Cancels the task of a bot running in the background event loop
+
+        Args:
+            name (str): the name of the bot
+
+        """
+        if name not in self.tasks or self.tasks[name].done():
+            raise ValueError(f"{name} is not running")
+
+        self.loop.call_soon_threadsafe(self.tasks.pop(name).cancel)
+
+    def stop_all(self):
+        """
+        Cancels all bots, waits for them to stop and stops the background event loop
+
+        """
+        if self._thread is None:
+            return
+
+        async def cancel():
+            tasks = [task for task in self.tasks.values() if not task.done()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        asyncio.run_coroutine_threadsafe(cancel(), self.loop).result()
+        self.tasks = {}
+
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+        self._thread = None
+        self.loop = None
+
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+        self.stop_feeds()
+        metrics.REGISTRY.close()
+
+    def stop_feeds(self):
+        """
+        Stops the publisher processes of the shared market feeds
 
-        
\ No newline at end of file
+        """
+        for process in self.publishers.values():
+            process.terminate()
+            process.join()
+        self.publishers = {}
@@ -1,2 +1,6 @@
+from .journal import TradeJournal
 from .bot import Bot
-from .backtestbot import BacktestBot
\ No newline at end of file
+from .fillsimulator import FillSimulator
+from .backtestbot import BacktestBot
+from .walkforwardbot import WalkForwardBot
+from .portfoliobot import PortfolioBacktestBot
@@ -1,9 +1,67 @@
+import asyncio
 import json
-import logging
 import time
 import datetime as dt
-from bitbot import services, strategy, bots
+from bitbot import services, strategy, bots, optimizer
+from bitbot.services.candlestore import to_timestamp
+from bitbot.strategy import cache
 import numpy as np
+import pandas as pd
+
+
+def calc_transactions(close: np.ndarray, orders: np.ndarray, quantity: float) -> tuple[np.ndarray, np.ndarray] or None:
+    """
+    Calculates the win or loss of every completed buy and sell pair
+
+    Args:
+        close (numpy.ndarray): the close of every candle
+        orders (numpy.ndarray): ``1`` for buys, ``-1`` for sells and ``0`` otherwise, see ``BacktestBot.generate_orders``
+        quantity (float): the quantity bought and sold
+
+    Returns:
+        tuple[numpy.ndarray, numpy.ndarray] or None: the absolute win and the input of every transaction; ``None`` if
+        nothing was bought and sold
+
+    """
+    buys = close[orders == 1]
+    sells = close[orders == -1]
+
+    if len(buys) == 0 or len(sells) == 0:
+        return None
+
+    if len(buys) > len(sells):
+        buys = buys[:-1]
+
+    transactions = (sells * quantity) - (buys * quantity)
+    return transactions, buys * quantity
+
+
+def backtest_stats(transactions: tuple[np.ndarray, np.ndarray]) -> dict[str, float]:
+    """
+    Calculates the key figures of a backtest
+
+    Args:
+        transactions (tuple[numpy.ndarray, numpy.ndarray]): the absolute wins and the inputs, see ``calc_transactions``
+
+    Returns:
+        dict[str, float]: ``transactions``, ``wins``, ``losses``, ``profit``, ``success_rate``, ``profit_increase``
+        and ``max_drawdown``, the last three relative
+
+    """
+    wins, inputs = transactions
+    rel_win = wins / inputs
+    equity = (rel_win + 1).cumprod()
+    peak = np.maximum.accumulate(np.concatenate(([1.0], equity)))[1:]
+
+    return {
+        "transactions": len(wins),
+        "wins": int((wins > 0).sum()),
+        "losses": int((wins <= 0).sum()),
+        "profit": float(wins.sum()),
+        "success_rate": float((wins > 0).sum() / len(wins)),
+        "profit_increase": float(equity[-1] - 1),
+        "max_drawdown": float((1 - equity / peak).max()),
+    }
 
 
 class BacktestBot(bots.Bot):
@@ -13,17 +71,325 @@ class BacktestBot(bots.Bot):
     Attributes:
         config (dict[str, any]): the loaded configuration
         next_action (services.OrderDirection): the next action; wether to sell or to buy
-        history (pandas.DataFrame): a history of all transactions the bot has made
+        first_close (float): the close of the first candle of the last backtest
+        last_close (float): the close of the last candle of the last backtest
 
     Args:
         config (str or dict[str,any]): the configuration that the bot should use
+        service (services.ServiceInterface=None): the service to use instead of the configured one
 
     """    
+
+    #: number of candles handed to the strategy for every signal
+    WINDOW = 100
+
+    #: warm-up candles of a chunked backtest per candle of the largest indicator window, see ``warmup_rows``
+    WARMUP_FACTOR = 50
+
+    async def run_async(self, executor=None):
+        """
+        Runs ``report`` on ``executor``, so the backtest does not block the event loop of other bots, and prints its
+        rows with ``print_report``. Unlike ``run``, it never waits for any input.
+
+        """
+        try:
+            rows = await asyncio.get_running_loop().run_in_executor(executor, self.report)
+        except (services.HistoryGapError, ValueError) as e:
+            self.err(str(e))
+            return
+        self.print_report(rows)
+
+    def print_report(self, rows: list[dict[str, any]]):
+        """
+        Prints a short summary of the rows of ``report``, one line per market
+
+        Args:
+            rows (list[dict[str, any]]): the rows of ``report``
+
+        """
+        print(f"\n### {self.name} ###")
+        for row in rows:
+            print(f"{str(row['market']) + ':':<32}"
+                  f"{row.get('transactions', 0)} transactions, "
+                  f"success rate {round(row.get('success_rate', 0.0)*100, 4)} %, "
+                  f"profit increase {round(row.get('profit_increase', 0.0)*100, 4)} %, "
+                  f"profit {row.get('profit', 0.0)}")
     
+    def load_candles(self) -> pd.DataFrame:
+        """
+        Method to download the history data of the timeframe specified in the config file and apply the
+        technical indicators to it
+
+        Returns:
+            pandas.DataFrame
+
+        Raises:
+            services.HistoryGapError: if parts of the timeframe are not available
+
+        """
+        backtest_cfg = self.config["backtest"]
+        candles = self.service.get_history_data(self.config["market"], services.CandleInterval.MINUTE_1,
+                                                backtest_cfg["start"], backtest_cfg["end"])
+        candles = self.apply_tas(candles)
+        return candles.reset_index()
+
+    def generate_orders(self, candles: pd.DataFrame) -> np.ndarray:
+        """
+        Method to apply the strategy to every candle. Uses the vectorized ``generate_signals`` of the strategy if
+        it provides one, ``generate_signal`` row by row otherwise.
+
+        Args:
+            candles (pandas.DataFrame): the candles with all technical indicators applied
+
+        Returns:
+            numpy.ndarray: ``1`` for buys, ``-1`` for sells and ``0`` otherwise
+
+        """
+        orders = self.strat.generate_signals(candles, self.WINDOW)
+        if orders is None:
+            # strategy has no vectorized implementation, apply it row by row
+            orders = self.apply_strategy(candles)
+        return orders
+
+    def apply_strategy(self, candles: pd.DataFrame, start: int = 0) -> np.ndarray:
+        """
+        Method to apply ``generate_signal`` of the strategy row by row
+
+        Args:
+            candles (pandas.DataFrame): the candles with all technical indicators applied
+            start (int=0): the first row to apply the strategy to; earlier rows only fill the windows
+
+        Returns:
+            numpy.ndarray: ``1`` for buys, ``-1`` for sells and ``0`` otherwise
+
+        """
+        # the strategy would log every row, which slows down this fast process
+        def quiet(msg):
+            pass
+
+        def apply_strat(index): 
+            services.printProgressBar(index, len(candles.index), prefix=f"{'Applying strategy':<32}")
+            if index < start:
+                return services.OrderDirection.NONE.value
+            sig = self.strat.generate_signal(candles.iloc[index-self.WINDOW:index], quiet)
+            if sig != services.OrderDirection.NONE:
+                self.strat.next_action = services.OrderDirection.BUY if sig == services.OrderDirection.SELL else services.OrderDirection.SELL
+            return sig.value
+
+        orders = pd.RangeIndex(len(candles.index)).map(apply_strat).to_numpy()
+        return np.where(orders == "BUY", 1, np.where(orders == "SELL", -1, 0))
+
+    def signal_rows(self, candles: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Method to get the rows of the buy and sell signals for the ``FillSimulator``. Uses ``signal_rows`` of the
+        strategy if it provides one, the alternating orders of ``generate_orders`` otherwise.
+
+        Returns:
+            tuple[numpy.ndarray, numpy.ndarray]: the sorted buy rows and sell rows
+
+        """
+        rows = self.strat.signal_rows(candles, self.WINDOW)
+        if rows is None:
+            orders = self.generate_orders(candles)
+            rows = np.flatnonzero(orders == 1), np.flatnonzero(orders == -1)
+        return rows
+
+    def simulate(self, candles: pd.DataFrame) -> tuple[tuple[np.ndarray, np.ndarray] or None, dict[str, np.ndarray]]:
+        """
+        Method to simulate the fills of the signals with the ``execution`` settings of the ``backtest`` section,
+        see ``FillSimulator``
+
+        Returns:
+            tuple[tuple[numpy.ndarray, numpy.ndarray] or None, dict[str, numpy.ndarray]]: the transactions, see
+            ``calc_transactions``, and the fills
+
+        """
+        simulator = bots.FillSimulator(**self.config["backtest"]["execution"])
+        fills = simulator.run(candles, *self.signal_rows(candles), self.config["quantity"], self.config["market"],
+                              self.strat.min_hold)
+        return simulator.transactions(fills), fills
+
+    def warmup_rows(self, simulator: "bots.FillSimulator" = None) -> int:
+        """
+        Method to get the number of candles every chunk of a chunked backtest repeats from the end of the previous
+        chunk. They fill the strategy window, let the exponentially smoothed indicators converge, as their values
+        depend on all earlier candles, and contain the candles the fill of a signal depends on.
+        Defaults to ``WARMUP_FACTOR`` times the largest indicator window; ``backtest.warmup`` overrides it.
+
+        Args:
+            simulator (bots.FillSimulator=None): the simulator of the fills
+
+        Returns:
+            int
+
+        """
+        windows = [value for params in self.strat.indicator_params(self.config["strat"].get("ta_params", {})).values()
+                   for value in params.values() if isinstance(value, int) and not isinstance(value, bool)]
+        warmup = self.config["backtest"].get("warmup", self.WARMUP_FACTOR * max(windows, default=0))
+        lookahead = simulator.lookahead(simulator.latency_rows()) if simulator is not None else 0
+        return max(warmup, self.WINDOW, lookahead + 1)
+
+    def candle_chunks(self, warmup: int):
+        """
+        Generator over the candles of the backtest timeframe in chunks of ``backtest.chunk_days`` days. Each chunk
+        starts with the last ``warmup`` candles of the previous one, so only a chunk and its warm-up are in memory
+        at a time, no matter how long the timeframe is. The indicators of a chunk are evicted from the
+        ``INDICATOR_CACHE`` once they are applied.
+
+        Args:
+            warmup (int): the number of candles repeated from the previous chunk, see ``warmup_rows``
+
+        Yields:
+            tuple[pandas.DataFrame, int, int]: the candles of the chunk with all technical indicators applied, the
+            row of its first candle in the whole timeframe and the number of warm-up candles
+
+        Raises:
+            services.HistoryGapError: if parts of the timeframe are not available
+
+        """
+        backtest_cfg = self.config["backtest"]
+        end = to_timestamp(backtest_cfg["end"])
+        step = dt.timedelta(days=backtest_cfg["chunk_days"])
+
+        tail = None
+        offset = 0
+        chunk_start = to_timestamp(backtest_cfg["start"])
+        while chunk_start < end:
+            chunk_end = min(chunk_start + step, end)
+            chunk = self.service.get_history_data(self.config["market"], services.CandleInterval.MINUTE_1,
+                                                  chunk_start, chunk_end)
+            chunk_start = chunk_end
+            if chunk.empty:
+                continue
+
+            warm = 0 if tail is None else len(tail)
+            candles = chunk if tail is None else pd.concat([tail, chunk], ignore_index=True)
+            if tail is None:
+                self.first_close = float(candles["close"].iloc[0])
+            self.last_close = float(candles["close"].iloc[-1])
+            applied = self.apply_tas(candles)
+            # the chunk holds copies of its indicators, in the cache they would outlive it
+            cache.INDICATOR_CACHE.evict(cache.fingerprint(candles["close"]))
+            yield applied, offset, warm
+
+            offset += len(candles) - min(warmup, len(candles))
+            tail = candles.iloc[-warmup:].reset_index(drop=True)
+
+    def backtest_chunked(self):
+        """
+        Generator to backtest the timeframe chunk by chunk, see ``candle_chunks``. Signals are replayed by the
+        ``FillSimulator`` configured in ``backtest.execution``; without it, orders fill at the close of their signal
+        candle without fees, like in the regular backtest. The signals in the last candles of a chunk, whose fills
+        depend on candles of the next chunk, are replayed with the next chunk.
+
+        Yields:
+            dict[str, any]: the ``signal_time`` and ``signal_close`` of the signal and the ``time``, ``direction``
+            (``1`` for buys, ``-1`` for sells), ``price``, ``quantity`` and ``fee`` of every fill
+
+        Raises:
+            services.HistoryGapError: if parts of the timeframe are not available
+
+        """
+        execution = self.config["backtest"].get("execution", {"taker_fee": 0, "maker_fee": 0})
+        simulator = bots.FillSimulator(**execution)
+        latency_rows = simulator.latency_rows()
+        lookahead = simulator.lookahead(latency_rows)
+
+        buys = sells = np.empty(0, dtype=np.int64)
+        chunks = self.candle_chunks(self.warmup_rows(simulator))
+        chunk = next(chunks, None)
+        while chunk is not None:
+            candles, offset, warm = chunk
+            chunk = next(chunks, None)
+
+            rows = self.strat.signal_rows(candles, self.WINDOW)
+            if rows is None:
+                orders = self.apply_strategy(candles, warm)
+                rows = np.flatnonzero(orders == 1), np.flatnonzero(orders == -1)
+            # the rows of the warm-up were already replayed with the previous chunk
+            buys, sells = (np.concatenate((carried[carried >= simulator.next_row], new[new >= warm] + offset))
+                           for carried, new in zip((buys, sells), rows))
+
+            # the last chunk has no candles after it to wait for
+            stop = None if chunk is None else offset + len(candles) - lookahead
+            times = candles["startsat"]
+            columns = simulator.columns(candles)
+            for signal, row, direction, price, quantity, fee in simulator.replay(
+                    columns, buys, sells, self.config["quantity"], self.config["market"], self.strat.min_hold,
+                    latency_rows, offset, stop):
+                yield {
+                    "signal_time": times.iloc[signal - offset],
+                    "signal_close": columns["close"][signal - offset],
+                    "time": times.iloc[row - offset],
+                    "direction": direction,
+                    "price": price,
+                    "quantity": quantity,
+                    "fee": fee,
+                }
+
+    def evaluate(self) -> tuple[tuple[np.ndarray, np.ndarray] or None, float or None]:
+        """
+        Method to backtest the timeframe of the config, see ``run``. Sets ``first_close`` and ``last_close``.
+
+        Returns:
+            tuple[tuple[numpy.ndarray, numpy.ndarray] or None, float or None]: the transactions, see
+            ``calc_transactions``, and the fees paid; the fees are ``None`` without ``execution`` settings
+
+        Raises:
+            services.HistoryGapError: if parts of the timeframe are not available
+
+        """
+        backtest_cfg = self.config["backtest"]
+
+        fees = None
+        if "chunk_days" in backtest_cfg:
+            trades = pd.DataFrame(list(self.backtest_chunked()), columns=["direction", "price", "quantity", "fee"])
+            fills = {col: trades[col].to_numpy() for col in trades.columns}
+            result = bots.FillSimulator.transactions(fills)
+            if "execution" in backtest_cfg:
+                fees = float(fills["fee"].sum())
+        else:
+            candles = self.load_candles()
+            self.first_close = float(candles["close"].iloc[0])
+            self.last_close = float(candles["close"].iloc[-1])
+            if "execution" in backtest_cfg:
+                result, fills = self.simulate(candles)
+                fees = float(fills["fee"].sum())
+            else:
+                orders = self.generate_orders(candles)
+                result = calc_transactions(candles["close"].values, orders, self.config["quantity"])
+        return result, fees
+
+    def report(self) -> list[dict[str, any]]:
+        """
+        Method to backtest without printing a summary or waiting for any input, e.g.: in scripts or by the
+        ``BatchRunner``
+
+        Returns:
+            list[dict[str, any]]: one row with the ``market``, the ``backtest_stats``, the ``fees`` and the estimated
+            ``input`` and ``holding`` profit
+
+        Raises:
+            services.HistoryGapError: if parts of the timeframe are not available
+
+        """
+        result, fees = self.evaluate()
+
+        qty = self.config["quantity"]
+        stats = backtest_stats(result) if result is not None else optimizer.NO_TRANSACTIONS
+        return [{
+            "market": self.config["market"],
+            **stats,
+            "fees": fees,
+            "input": qty * self.first_close,
+            "holding": (self.last_close - self.first_close) * qty,
+        }]
+
     def run(self):
         """
         Method to start the Bot. Downloads history data in timeframe specified in the config file. Applies the ``generate_signal``
-        method of the desired strategy. Calculates wins and losses based on quantity given in template. Calculates values based on close.
+        method of the desired strategy, or its vectorized ``generate_signals`` counterpart if the strategy provides one. Calculates wins and losses based on quantity given in template. Calculates values based on close.
+        With ``chunk_days`` in the ``backtest`` section, the timeframe is backtested chunk by chunk, see ``backtest_chunked``.
         
         
         Outputs a Summary like so:
@@ -51,48 +417,26 @@ class BacktestBot(bots.Bot):
 
   
         """
-        # diable logging, because it slows down this fast process
-        logger = logging.getLogger()
-        logger.disabled = True
-
         backtest_cfg = self.config["backtest"]
 
-        candles = self.service.get_history_data(self.config["market"], services.CandleInterval.MINUTE_1,
-                                                backtest_cfg["start"], backtest_cfg["end"])
-        if candles is None:
+        try:
+            result, fees = self.evaluate()
+        except services.HistoryGapError as e:
+            print(f"\n### ERROR: {e}")
             return
 
-        candles = self.apply_tas(candles)
-        candles = candles.reset_index()
-
-        def apply_strat(index): 
-            services.printProgressBar(index, len(candles.index), prefix=f"{'Applying strategy':<32}")
-            sig = self.strat.generate_signal(candles.iloc[index-100:index], self.log)
-            if sig != services.OrderDirection.NONE:
-                self.strat.next_action = services.OrderDirection.BUY if sig == services.OrderDirection.SELL else services.OrderDirection.SELL
-            return sig.value
-
-        candles["order"] = candles.index.map(apply_strat)
-        buys = candles[candles["order"] == "BUY"]
-        sells = candles[candles["order"] == "SELL"]
-
-        if len(buys) == 0 or len(sells) == 0:
+        if result is None:
             print("\n\nNo transactions would have been made in this timeframe!")
             return
 
-        if len(buys) > len(sells):
-            buys = buys.iloc[:-1]
-
         qty = self.config["quantity"]
+        transactions, _ = result
+        stats = backtest_stats(result)
+        profits = transactions[transactions > 0]
+        losses = transactions[transactions <= 0]
 
-        transactions = (sells["close"].values * qty ) - (buys["close"].values * qty)
-        profits = np.array([i for i in transactions if i > 0])
-        losses = np.array([i for i in transactions if i <= 0])
-
-        success_rate = len(profits)/len(transactions)
-
-        rel_win = transactions/(buys["close"].values * qty)
-        winning_rate = ((rel_win + 1).cumprod() -1)[-1]
+        success_rate = stats["success_rate"]
+        winning_rate = stats["profit_increase"]
 
         currency = self.config["market"].split("-")[1]
 
@@ -121,14 +465,16 @@ class BacktestBot(bots.Bot):
             print("/// No losses made\n")
         
         
-        print(f"{'Est. input:':<32}{qty*candles['close'].iloc[0]} {currency}\n"
+        if fees is not None:
+            print(f"{'Fees paid:':<32}{fees} {currency}\n")
+
+        print(f"{'Est. input:':<32}{qty*self.first_close} {currency}\n"
               f"{'Est. profit gain:':<32}{profits.sum() + losses.sum()} {currency}\n"
-              f"{'Est. profit w/ holding:':<32}{(candles['close'].iloc[-1] - candles['close'].iloc[0]) * qty} {currency}\n"
-              f"{'Total outcome:':<32}{(profits.sum() + losses.sum()) + (qty*candles['close'].iloc[0])} {currency}\n"
+              f"{'Est. profit w/ holding:':<32}{(self.last_close - self.first_close) * qty} {currency}\n"
+              f"{'Total outcome:':<32}{(profits.sum() + losses.sum()) + (qty*self.first_close)} {currency}\n"
               "\n"
               f"{'Success rate:':<32}{round(success_rate*100, 4)} %\n"
               f"{'Profit increase:':<32}{round(winning_rate*100, 4)} %\n"
               )
 
-        logger.disabled = False
         input("Press any key to close ...")
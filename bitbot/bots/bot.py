@@ -1,8 +1,13 @@
+import asyncio
 import json
 import logging
 import time
+from concurrent.futures import Executor, Future
 import datetime as dt
-from bitbot import services, strategy
+from bitbot import metrics, scheduler, services, strategy
+from bitbot.services import feed
+from bitbot.bots.journal import TRADE_DTYPE, TradeJournal, trades_frame
+import numpy as np
 import pandas as pd
 
 
@@ -13,13 +18,25 @@ class Bot:
     Attributes:
         config (dict[str, any]): the loaded configuration
         next_action (services.OrderDirection): the next action; wether to sell or to buy
-        history (pandas.DataFrame): a history of all transactions the bot has made
+        orders (services.OrderPipeline): the pipeline the orders are placed with; ``None`` for backtests
+        journal (bots.TradeJournal): the journal of all transactions the bot has made; ``None`` for backtests
+        history (pandas.DataFrame): a history of all transactions the bot has made, read from the ``journal``
+        candles (services.CandleWindow): the most recent closed candles, ``candle_window`` of them at most
+        phases (dict[str, metrics.Histogram]): the seconds spent in each of the ``PHASES`` of the bot loop
+        new_candles (int): the number of candles the last iteration appended to the candle window
+        scheduler (scheduler.CandleScheduler): the timer wheel waking the bot with a ``schedule``, shared by the bots
+            of a ``BotManager``; a private one is created if ``None``
 
     Args:
         config (str or dict[str,any]): the configuration that the bot should use
+        service (services.ServiceInterface=None): the service to use instead of the configured one
 
     """
-    def __init__(self,name: str, config: str or dict[str, any]):
+    #: the phases of the bot loop whose durations are measured; ``order`` is the placement of an order including its
+    #: retries, ``iteration`` a whole iteration without the wait for the next one
+    PHASES = ("ticker", "candles", "balance", "indicators", "signal", "order", "iteration")
+
+    def __init__(self,name: str, config: str or dict[str, any], service: services.ServiceInterface = None):
         if isinstance(config, str):
             with open(config, encoding="utf8") as f:
                 self.config = json.load(f)
@@ -29,37 +46,142 @@ class Bot:
         self.name = name
 
         # initialize service class from imports
-        self.service : services.ServiceInterface = getattr(services, self.config["service"])()
+        if service is None:
+            service = getattr(services, self.config["service"])(**self.config.get("service_params", {}))
+        self.service : services.ServiceInterface = service
         # initialze strategy class from imports
         self.strat : strategy.TradingStrategyInterface = getattr(strategy, self.config["strat"]["name"])(self.service, self.config["strat"], self.config["market"])
 
-        self.history = pd.DataFrame()
+        self.journal = None
+        self.orders = None
+        self.pending = None
+        if "backtest" not in self.config:
+            self.orders = services.OrderPipeline(self.service, **self.config.get("order_params", {}))
+            journal_cfg = self.config.get("journal", {})
+            self.journal = TradeJournal(journal_cfg.get("path", f"./journals/{name}.trades"), journal_cfg.get("batch_size", 1))
+            # continue where the bot stopped
+            if self.journal.last_direction == services.OrderDirection.BUY:
+                self.strat.next_action = services.OrderDirection.SELL
+
+        if self.config.get("stream") and not hasattr(type(self.service), "stream"):
+            raise ValueError(f"{self.config['service']} has no market data stream")
+
+        # the closed candles of the live loop, which the streaming indicators have seen
+        self.candles = services.CandleWindow(self.config.get("candle_window", 1440))
+        self.strat.window = self.candles
+        self.latest = None
+        self.new_candles = 0
+        self.scheduler = None
+        # the start time of the candle not published yet and the number of retries, see ``next_wake``
+        self._retries = (None, 0)
+
+        # shared market feed of a publisher process, see ``services.feed``
+        self.feed = None
+
+        self.phases = {phase: metrics.REGISTRY.histogram("bitbot_loop_phase_seconds", "Seconds per phase of the bot loop",
+                                                         bot=name, phase=phase) for phase in self.PHASES}
+        self.close_to_signal = metrics.REGISTRY.histogram("bitbot_close_to_signal_seconds",
+                                                          "Seconds from the close of a candle until the strategy evaluated it",
+                                                          bot=name)
     
-    def apply_tas(self, candles: pd.DataFrame) -> pd.DataFrame:
+    @property
+    def history(self) -> pd.DataFrame:
+        if self.journal is None:
+            return trades_frame(np.empty(0, dtype=TRADE_DTYPE))
+        return self.journal.to_frame()
+
+    def apply_tas(self, candles: pd.DataFrame, ta_params: dict[str, dict[str, any]] = None) -> pd.DataFrame:
         """
         Method to apply technical indicators specified in the template
 
         Args:
             candles (pd.DataFrame): the candles to apply the technical indicators to
+            ta_params (dict[str, dict[str, any]]=None): the indicators to apply instead of the ones in the template
 
         Returns:
             pd.DataFrame
 
         """
+        if ta_params is None:
+            if "ta_params" not in self.config["strat"]:
+                return candles
+            ta_params = self.config["strat"]["ta_params"]
 
-        if "ta_params" not in self.config["strat"]:
-            return candles
+        # only the indicators the strategy needs
+        for name, params in self.strat.indicator_params(ta_params).items():
+            candles = getattr(self.strat, f"calc_{name}")(candles, **params)
 
-        cfg = self.config["strat"]["ta_params"] 
-        if "macd" in cfg:
-            candles = self.strat.calc_macd(candles, **cfg["macd"])
-        if "rsi" in cfg:
-            candles = self.strat.calc_rsi(candles, **cfg["rsi"])
-        if "roc" in cfg:
-            candles = self.strat.calc_roc(candles, **cfg["roc"])
-            
         return candles
+
+    def apply_tas_grid(self, candles: pd.DataFrame, ta_grid: list[dict[str, dict[str, any]]]) -> list[pd.DataFrame]:
+        """
+        Method to apply every set of technical indicators of a parameter grid, see ``optimizer.parameter_grid``.
+        If the strategy uses the NumPy ``kernels``, all windows of an indicator are calculated in one call.
+
+        Args:
+            candles (pd.DataFrame): the candles to apply the technical indicators to
+            ta_grid (list[dict[str, dict[str, any]]]): the indicators to apply, one frame per entry
+
+        Returns:
+            list[pd.DataFrame]
+
+        """
+        if not self.strat.kernels:
+            return [self.apply_tas(candles.copy(), ta_params) for ta_params in ta_grid]
+
+        close = candles["close"].to_numpy()
+        grid = [self.strat.indicator_params(ta_params) for ta_params in ta_grid]
+        columns = [{} for _ in grid]
+        for name in dict.fromkeys(name for params in grid for name in params):
+            # the distinct parameter sets, batched by the parameters they set
+            variants = {}
+            for i, params in enumerate(grid):
+                if name in params:
+                    key = json.dumps(params[name], sort_keys=True)
+                    variants.setdefault(key, (params[name], []))[1].append(i)
+            groups = {}
+            for params, rows in variants.values():
+                windows = tuple(sorted(key for key in params if key != "fillna"))
+                groups.setdefault((windows, params.get("fillna", False)), []).append((params, rows))
+
+            for (windows, fillna), members in groups.items():
+                values = strategy.kernels.INDICATORS[name](
+                    close, fillna=fillna, **{key: [params[key] for params, _ in members] for key in windows})
+                for k, (_, rows) in enumerate(members):
+                    for i in rows:
+                        columns[i].update({col: pd.Series(v[:, k] if windows else v, index=candles.index)
+                                           for col, v in values.items()})
+        return [candles.assign(**cols) for cols in columns]
     
+    def update_indicators(self, candles: dict[str, np.ndarray], candleinterval: services.CandleInterval) -> dict[str, any] or None:
+        """
+        Method to append the new closed candles to the candle window and feed them to the streaming indicators of the
+        strategy. Seeds the indicators with the whole window on the first call.
+
+        Args:
+            candles (dict[str, numpy.ndarray]): the candles since the last call, see ``ServiceInterface.get_recent_candles``
+            candleinterval (services.CandleInterval): the interval of the candles
+
+        Returns:
+            dict[str, any] or None: the latest indicator values or ``None`` if no candle has closed yet
+
+        """
+        # candles starting before this have closed
+        closed_before = time.time_ns() - pd.Timedelta(candleinterval.timedelta).value + 1
+        appended = self.candles.append(candles, closed_before)
+        self.new_candles = appended
+        if not appended:
+            return self.latest
+
+        if self.latest is None:
+            self.latest = self.strat.seed_indicators(self.candles)
+        else:
+            times = self.candles["startsat"][-appended:].tolist()
+            closes = self.candles["close"][-appended:].tolist()
+            for start, close in zip(times, closes):
+                self.latest = self.strat.update_indicators(pd.Timestamp(start), close)
+        return self.latest
+
     def log(self, msg: str):
         logging.info(f"* {self.name}: {msg}")
     
@@ -69,46 +191,286 @@ class Bot:
     def err(self, msg: str):
         logging.error(f"* {self.name}: {msg}")
     
+    @property
+    def candleinterval(self) -> services.CandleInterval:
+        return self.service.determine_candle_interval(dt.timedelta(minutes=self.config["lookback"]))
+
+    def fetch_market_data(self) -> tuple[dict[str, np.ndarray], services.CandleInterval]:
+        """
+        Method to request the market data a loop iteration needs from the stream, the shared feed or the service
+
+        Returns:
+            tuple[dict[str, numpy.ndarray], services.CandleInterval]: the candles newer than the candle window and
+            their interval
+
+        """
+        candleinterval = self.candleinterval
+
+        start = time.perf_counter()
+        market_data = self.read_stream(candleinterval)
+        if market_data is None:
+            market_data = self.read_feed(candleinterval)
+        if market_data is not None:
+            self.phases["candles"].observe(time.perf_counter() - start)
+            ticker, candles = market_data
+        else:
+            with self.phases["ticker"].time():
+                ticker = self.service.get_market_ticker(self.config["market"])
+            with self.phases["candles"].time():
+                candles = self.service.get_recent_candles(self.config["market"], candleinterval, since=self.candles.last)
+
+        self.log(f"## {self.config['market']} ## Last Price: {ticker['lastTradeRate']}")
+        return candles, candleinterval
+
+    def read_stream(self, candleinterval: services.CandleInterval) -> tuple[dict[str, str], dict[str, np.ndarray]] or None:
+        """
+        Method to read the ticker and the candles newer than the candle window from the websocket stream of the
+        service, if ``stream`` is enabled in the config
+
+        Returns:
+            tuple[dict[str, str], dict[str, numpy.ndarray]] or None: ``None`` if the service has to be requested instead
+
+        """
+        if not self.config.get("stream"):
+            return None
+
+        stream = self.service.stream
+        stream.subscribe(self.config["market"], candleinterval)
+        if not stream.connected.is_set():
+            self.warn("Market data stream is disconnected, requesting the service")
+            return None
+
+        ticker, candles = stream.read_since(self.config["market"], candleinterval, self.candles.last)
+        if ticker is None:
+            ticker = self.service.get_market_ticker(self.config["market"])
+        return ticker, candles
+
+    def next_wake(self) -> int:
+        """
+        Method to get the time of the next loop iteration of the ``schedule``: ``settle_delay`` seconds after the
+        next candle closes, so the exchange has published it. If the candle that closed last was not published yet,
+        it is requested again every ``retry_delay`` seconds, ``retries`` times at most. The schedule follows the wall
+        clock, like the candles of the exchanges.
+
+        ::
+
+            schedule:
+              settle_delay: 1 # seconds
+              retry_delay: 1 # seconds
+              retries: 3
+
+        Returns:
+            int: the time in nanoseconds since epoch
+
+        """
+        schedule = self.config["schedule"] or {}
+        interval = pd.Timedelta(self.candleinterval.timedelta).value
+        settle = int(schedule.get("settle_delay", 1) * 1e9)
+        now = time.time_ns()
+        due = scheduler.next_close(now, interval, settle)
+
+        # the candle that closed at the boundary before ``due`` starts one interval before it
+        expected = due - settle - 2 * interval
+        if self.candles.last is not None and self.candles.last < expected:
+            candle, retries = self._retries if self._retries[0] == expected else (expected, 0)
+            if retries < schedule.get("retries", 3):
+                self._retries = (candle, retries + 1)
+                # counted from the close like the wake-ups, so the bots waiting for the same candle share their slots
+                woke, retry_delay = due - interval, int(schedule.get("retry_delay", 1) * 1e9)
+                return min(due, woke + ((now - woke) // retry_delay + 1) * retry_delay)
+        return due
+
+    def wait(self):
+        """
+        Method to wait for the next loop iteration: until the next candle has closed if the market data is streamed,
+        until ``next_wake`` with a ``schedule``, ``update_interval`` seconds otherwise
+
+        """
+        if self.config.get("stream") and self.service.stream.connected.is_set():
+            self.service.stream.wait_for_candle(self.config["market"], self.candleinterval, self.candles.last,
+                                                self.config["update_interval"])
+        elif "schedule" in self.config:
+            time.sleep(max(0, self.next_wake() - time.time_ns()) / 1e9)
+        else:
+            time.sleep(self.config["update_interval"])
+
+    def read_feed(self, candleinterval: services.CandleInterval) -> tuple[dict[str, float], np.ndarray] or None:
+        """
+        Method to read the ticker and the candles newer than the candle window from the shared market feed, if
+        ``shared_feed`` is enabled in the config and a publisher process keeps the feed up to date
+
+        Returns:
+            tuple[dict[str, float], numpy.ndarray] or None: ``None`` if the service has to be requested instead
+
+        """
+        if not self.config.get("shared_feed"):
+            return None
+
+        if self.feed is None:
+            try:
+                self.feed = feed.MarketFeed(feed.feed_name(self.config["service"], self.config["market"], candleinterval))
+            except FileNotFoundError:
+                return None
+
+        if time.time() - self.feed.updated > 2 * self.config["update_interval"]:
+            self.warn("Shared market feed is outdated, requesting the service")
+            return None
+        return self.feed.read_since(self.candles.last)
+
+    def decide(self, candles: dict[str, np.ndarray], candleinterval: services.CandleInterval) -> services.OrderDirection:
+        """
+        Method to update the indicators with the most recent candles and generate a signal from them. The strategy
+        is only evaluated if a new candle has closed, as it has seen the indicators of the older ones already.
+
+        Returns:
+            services.OrderDirection
+
+        """
+        with self.phases["indicators"].time():
+            latest = self.update_indicators(candles, candleinterval)
+        if latest is None or not self.new_candles:
+            return services.OrderDirection.NONE
+        with self.phases["signal"].time():
+            signal = self.strat.evaluate(latest, self.log)
+        closed = self.candles.last + pd.Timedelta(candleinterval.timedelta).value
+        self.close_to_signal.observe(max(0.0, (time.time_ns() - closed) / 1e9))
+        return signal
+
+    def execute(self, signal: services.OrderDirection, available_balance: float = None, signal_time: float = None) -> Future or None:
+        """
+        Method to submit a market order for a signal to the order pipeline. Returns right away; once the order is
+        filled, it is recorded in the ``journal`` and the next action of the strategy is toggled. Signals are skipped
+        while the previous order is in flight.
+
+        Args:
+            signal (services.OrderDirection): the direction of the order
+            available_balance (float=None): the available balance of the traded currency; requested if ``None``
+            signal_time (float=None): the ``time.monotonic`` of the signal; now if ``None``
+
+        Returns:
+            concurrent.futures.Future or None: the future of the order, see ``services.OrderPipeline.submit``;
+            ``None`` if the signal was skipped
+
+        """
+        if self.pending is not None and not self.pending.done():
+            self.warn(f"Skipping {signal.value} signal, the previous order is still in flight")
+            return None
+
+        def prepare(order: services.Order):
+            balance = available_balance
+            if balance is None:
+                with self.phases["balance"].time():
+                    balance = self.service.get_available_balance(self.config["market"].split("-")[0])
+            order.quantity = min(order.quantity, balance)
+
+        order = services.Order(self.config["market"], signal, services.OrderType.MARKET, 
+                                   services.TimeInForce.IMMEDIATE_OR_CANCEL, self.config["quantity"])
+        self.pending = self.orders.submit(order, signal_time, prepare)
+        self.pending.add_done_callback(self.on_order)
+        return self.pending
+
+    def on_order(self, future: Future):
+        """
+        Callback of a submitted order, see ``execute``
+
+        """
+        try:
+            submission = future.result()
+        except Exception as e:
+            metrics.REGISTRY.counter("bitbot_orders_total", "Submitted orders", bot=self.name, status="failed").inc()
+            self.err(f"Could not place Order: {e.__class__.__name__}: {str(e)}")
+            return
+
+        self.phases["order"].observe(submission.done - submission.sent)
+        res = submission.response
+        metrics.REGISTRY.counter("bitbot_orders_total", "Submitted orders", bot=self.name, status=res["status"]).inc()
+        if res["status"] != "CLOSED":
+            self.warn(f'Could not place Order: Status: {res["status"]}')
+            return
+
+        metrics.REGISTRY.histogram("bitbot_signal_to_fill_seconds", "Seconds from a signal until its order was filled",
+                                   bot=self.name).observe(submission.latency)
+
+        self.log(f'Placed Order: {res} ({submission.signal_to_order * 1000:.1f} ms after the signal, '
+                 f'{submission.attempts} attempt(s))')
+        direction = submission.order.direction
+        self.journal.append(direction, float(res.get("fillQuantity", submission.order.quantity)), float(res["proceeds"]),
+                            float(res.get("commission", 0)))
+        self.strat.next_action = services.OrderDirection.SELL if direction == services.OrderDirection.BUY else services.OrderDirection.BUY
+
+    def step(self):
+        """
+        Method to run a single iteration of the bot loop
+
+        """
+        with self.phases["iteration"].time():
+            candles, candleinterval = self.fetch_market_data()
+            signal = self.decide(candles, candleinterval)
+            if signal != services.OrderDirection.NONE:
+                self.execute(signal, signal_time=time.monotonic())
+
+    async def step_async(self, executor: Executor = None):
+        """
+        Coroutine counterpart of ``step``. The blocking service calls run on ``executor``, so the event loop
+        stays free for other bots while a request is in flight.
+
+        Args:
+            executor (concurrent.futures.Executor=None): the executor for the service calls; the loop's default if ``None``
+
+        """
+        loop = asyncio.get_running_loop()
+        with self.phases["iteration"].time():
+            candles, candleinterval = await loop.run_in_executor(executor, self.fetch_market_data)
+            signal = self.decide(candles, candleinterval)
+            if signal != services.OrderDirection.NONE:
+                # the order is placed on the thread of the order pipeline
+                self.execute(signal, signal_time=time.monotonic())
+
     def run(self):
         """
         Method to start the Bot. Runs in an endless loop and alternates between buying and selling, based on the signal 
-        generated by the strategy used. Always executes market orders. Sleeps for the ``update_interval`` Seconds at the end of 
-        every loop iteration.
+        generated by the strategy used. The indicators are kept as streaming indicators that are updated with every
+        closed candle. Always executes market orders. Sleeps for the ``update_interval`` Seconds at the end of 
+        every loop iteration, until the next candle closes if the market data is streamed, or until just after it
+        closes with a ``schedule``, see ``next_wake``.
 
-        Saves buying time, buying proceeds and order direction in an attribute called ``history``
+        Records every filled order in the ``journal``
         """
-        while True:
-            last_price = self.service.get_market_ticker(self.config["market"])["lastTradeRate"]
-            self.log(f"## {self.config['market']} ## Last Price: {last_price}")
-            available_balance = self.service.get_available_balance(self.config["market"].split("-")[0])
+        try:
+            while True:
+                self.step()
+                self.wait()
+        finally:
+            self.journal.flush()
 
-            candles = self.service.get_candles(self.config["market"], 
-                                               self.service.determine_candle_interval(dt.timedelta(minutes=self.config["lookback"])))
-            candles = candles.rename(columns={"startsAt": "time"})
-            candles["rsi"] = self.strat.calc_rsi(candles)
+    async def run_async(self, executor: Executor = None):
+        """
+        Coroutine counterpart of ``run``, to run many bots as tasks in one event loop. Cancelling the task stops the
+        bot after the service call in flight has returned. Bots with a ``schedule`` wait on the timer wheel of the
+        ``scheduler``, bots with a ``stream`` are woken by the stream when the next candle has closed.
 
-            candles = self.strat.calc_macd(candles)
-            signal = self.strat.generate_signal(candles, self.log)
-            
-            if signal != services.OrderDirection.NONE:
-                order = services.Order(self.config["market"], signal, services.OrderType.MARKET, 
-                                           services.TimeInForce.IMMEDIATE_OR_CANCEL, 
-                                           self.config["quantity"] if self.config["quantity"] <= available_balance else available_balance)
+        Args:
+            executor (concurrent.futures.Executor=None): the executor for the service calls; the loop's default if ``None``
 
+        """
+        try:
+            while True:
                 try:
-                    res = self.service.place_order(order)
+                    await self.step_async(executor)
                 except Exception as e:
-                    logging.error(f"{e.__class__.__name__}: {str(e)}")
-
-                    time.sleep(self.config["update_interval"])
-                    continue
-                
-                if res["status"] != "CLOSED":
-                    self.warn(f'Could not place Order: Status: {res["status"]}')
+                    self.err(f"{e.__class__.__name__}: {str(e)}")
+                if self.config.get("stream") and self.service.stream.connected.is_set():
+                    # the stream wakes the loop when the candle has closed, no thread waits for it
+                    await self.service.stream.wait_for_candle_async(self.config["market"], self.candleinterval,
+                                                                    self.candles.last, self.config["update_interval"])
+                elif "schedule" in self.config:
+                    if self.scheduler is None:
+                        self.scheduler = scheduler.CandleScheduler()
+                    await self.scheduler.sleep_until(self.next_wake())
                 else:
-                    self.log(f'Placed Order: {res}')
-
-                    self.history = self.history.append({"time": dt.datetime.utcnow(), "value": res["proceeds"], "direction": self.next_action}, ignore_index=True)
-                    self.next_action = services.OrderDirection.SELL if self.next_action == services.OrderDirection.BUY else services.OrderDirection.BUY
-
-            time.sleep(self.config["update_interval"])
+                    await asyncio.sleep(self.config["update_interval"])
+        except asyncio.CancelledError:
+            self.log("Stopped")
+            raise
+        finally:
+            self.journal.flush()
@@ -0,0 +1,300 @@
+import math
+import numpy as np
+import pandas as pd
+from bitbot import services
+
+
+class FillSimulator:
+    """
+    Simulates how the orders of a backtest would have been filled, instead of assuming every signal fills at the
+    close of its candle without fees. Each signal is turned into a ``services.Order`` as the live bot would place
+    it and replayed against the candles after it:
+
+    - the order arrives ``latency`` seconds after the close of the signal candle, in the candle that is open by then
+    - market orders and marketable limit orders fill at the price of their arrival, moved against the order by the
+      ``slippage`` and the ``impact`` of its quantity on the volume of the arrival candle; they pay the ``taker_fee``.
+      The price of an arrival within a candle is interpolated between its open and its close, e.g.: halfway for
+      ``0.5`` seconds of latency on ``1`` second candles; whole candles of latency fill at the close
+    - other limit orders rest in the book and fill at their limit in the first candle whose low (buys) or high
+      (sells) reaches it, paying the ``maker_fee``. ``IMMEDIATE_OR_CANCEL`` and ``FILL_OR_KILL`` orders are cancelled
+      instead; resting orders are cancelled after ``timeout`` candles
+    - ceiling orders buy for a fixed amount of the quote currency, fees included; the bought quantity is sold again
+
+    Orders fill completely. Only the signals are replayed one by one, the candles in between are searched with NumPy,
+    so the simulation costs about as much as the vectorized backtest itself.
+
+    Configured in the ``backtest`` section:
+
+    ::
+
+        backtest:
+          execution:
+            order_type: LIMIT # MARKET, LIMIT, CEILING_MARKET or CEILING_LIMIT
+            time_in_force: GOOD_TIL_CANCELLED
+            limit_offset: 0.001 # limits 0.1 % below (buys) or above (sells) the close
+            ceiling: 50 # quote currency per buy of ceiling orders
+            taker_fee: 0.0035
+            maker_fee: 0.0035
+            slippage: 0.0005
+            impact: 0.1
+            latency: 0.5 # seconds
+            timeout: 60 # candles
+
+    Args:
+        order_type (str="MARKET"): the ``services.OrderType`` of the orders
+        time_in_force (str=None): the ``services.TimeInForce`` of the orders; ``IMMEDIATE_OR_CANCEL`` for market
+            orders and ``GOOD_TIL_CANCELLED`` for limit orders if ``None``
+        taker_fee (float=0.0035): the relative fee of orders that fill immediately
+        maker_fee (float=0.0035): the relative fee of orders that rest in the book
+        slippage (float=0.0): the relative price slippage of orders that fill immediately
+        impact (float=0.0): the coefficient of the square root market impact ``impact * sqrt(quantity / volume)``
+        latency (float=0.0): the seconds between a signal and the arrival of its order
+        limit_offset (float=0.0): the relative distance of the limit to the close of the signal candle
+        ceiling (float=None): the amount of the quote currency spent by each ceiling order
+        timeout (int=60): the number of candles a resting order waits to be filled
+
+    """
+    def __init__(self, order_type: str = "MARKET", time_in_force: str = None, taker_fee: float = 0.0035,
+                 maker_fee: float = 0.0035, slippage: float = 0.0, impact: float = 0.0, latency: float = 0.0,
+                 limit_offset: float = 0.0, ceiling: float = None, timeout: int = 60):
+        self.order_type = services.OrderType(order_type)
+        self.limited = self.order_type in (services.OrderType.LIMIT, services.OrderType.CEILING_LIMIT)
+        self.ceiled = self.order_type in (services.OrderType.CEILING_MARKET, services.OrderType.CEILING_LIMIT)
+        if time_in_force is None:
+            time_in_force = "GOOD_TIL_CANCELLED" if self.limited else "IMMEDIATE_OR_CANCEL"
+        self.time_in_force = services.TimeInForce(time_in_force)
+        if self.ceiled and not ceiling:
+            raise ValueError(f"{self.order_type.value} orders need a ceiling")
+
+        self.taker_fee = taker_fee
+        self.maker_fee = maker_fee
+        self.slippage = slippage
+        self.impact = impact
+        self.latency = latency
+        self.limit_offset = limit_offset
+        self.ceiling = ceiling
+        self.timeout = timeout
+        self.reset()
+
+    def create_order(self, market: str, direction: services.OrderDirection, quantity: float, price: float) -> services.Order:
+        """
+        Method to create the order of a signal, as the live bot would place it
+
+        Args:
+            market (str): the market name, e.g.: ``"BTC-EUR"``
+            direction (services.OrderDirection): the direction of the signal
+            quantity (float): the quantity to buy or sell; ignored by ceiling buys
+            price (float): the close of the signal candle
+
+        Returns:
+            services.Order
+
+        """
+        buy = direction == services.OrderDirection.BUY
+        order_type = self.order_type
+        if self.ceiled and not buy:
+            # ceiling orders can only buy
+            order_type = services.OrderType.LIMIT if self.limited else services.OrderType.MARKET
+
+        order = services.Order(market, direction, order_type, self.time_in_force, quantity)
+        if self.ceiled and buy:
+            order.quantity = 0
+            order.ceiling = self.ceiling
+        if self.limited:
+            order.limit = price * (1 - self.limit_offset if buy else 1 + self.limit_offset)
+        return order
+
+    def fill(self, order: services.Order, row: int, candles: dict[str, np.ndarray], latency_rows: float = 0) -> tuple[int, float, float, float] or tuple[int, None, None, None]:
+        """
+        Method to simulate the fill of an order
+
+        Args:
+            order (services.Order): the order
+            row (int): the row of the signal
+            candles (dict[str, numpy.ndarray]): the ``open``, ``high``, ``low``, ``close`` and ``volume`` columns
+            latency_rows (float=0): the number of candles the order arrives after the signal, see ``latency_rows``
+
+        Returns:
+            tuple[int, float, float, float] or tuple[int, None, None, None]: the row, price, quantity and fee of the
+            fill, or the row in which the order was cancelled and ``None``
+
+        """
+        close = candles["close"]
+        # the part of the arrival candle that has passed when the order arrives; ``0`` arrives at its close
+        passed = latency_rows % 1
+        arrival = row + math.ceil(latency_rows)
+        if arrival >= len(close):
+            return len(close) - 1, None, None, None
+
+        buy = order.direction == services.OrderDirection.BUY
+        sign = 1 if buy else -1
+        price = close[arrival]
+        if passed:
+            price = candles["open"][arrival] + passed * (price - candles["open"][arrival])
+        limited = order.type in (services.OrderType.LIMIT, services.OrderType.CEILING_LIMIT)
+        marketable = not limited or (order.limit >= price if buy else order.limit <= price)
+
+        if marketable:
+            quantity = order.quantity or order.ceiling / price
+            slip = self.slippage
+            volume = candles["volume"][arrival]
+            if self.impact and volume > 0:
+                slip += self.impact * math.sqrt(quantity / volume)
+            price = price * (1 + sign * slip)
+            if limited:
+                price = min(price, order.limit) if buy else max(price, order.limit)
+            fee_rate = self.taker_fee
+            fill_row = arrival
+        else:
+            if order.time_in_force in (services.TimeInForce.IMMEDIATE_OR_CANCEL, services.TimeInForce.FILL_OR_KILL):
+                return arrival, None, None, None
+            end = min(len(close), arrival + 1 + self.timeout)
+            reached = candles["low"][arrival + 1:end] <= order.limit if buy else candles["high"][arrival + 1:end] >= order.limit
+            k = int(np.argmax(reached)) if len(reached) else 0
+            if not len(reached) or not reached[k]:
+                return end - 1, None, None, None
+            price = order.limit
+            fee_rate = self.maker_fee
+            fill_row = arrival + 1 + k
+
+        if order.ceiling and not order.quantity:
+            # the ceiling includes the fee
+            quantity = order.ceiling / (price * (1 + fee_rate))
+        else:
+            quantity = order.quantity
+        return fill_row, float(price), float(quantity), float(price * quantity * fee_rate)
+
+    def reset(self):
+        """
+        Method to start a new replay without a position
+
+        """
+        #: the quantity held, ``None`` while no position is held
+        self.position = None
+        #: the first row in which the next signal is followed
+        self.next_row = 0
+
+    def latency_rows(self, candleinterval: services.CandleInterval = services.CandleInterval.MINUTE_1) -> float:
+        """
+        Returns the number of candles an order arrives after its signal, fractions of a candle included
+
+        """
+        return self.latency / candleinterval.timedelta.total_seconds()
+
+    def lookahead(self, latency_rows: float = 0) -> int:
+        """
+        Returns the number of candles after a signal its fill may depend on
+
+        """
+        return math.ceil(latency_rows) + (self.timeout if self.limited else 0)
+
+    @staticmethod
+    def columns(candles: pd.DataFrame) -> dict[str, np.ndarray]:
+        """
+        Returns the ``open``, ``high``, ``low``, ``close`` and ``volume`` columns the fills are simulated with
+
+        """
+        return {col: candles[col].to_numpy(dtype=np.float64) for col in ["open", "high", "low", "close", "volume"]}
+
+    def replay(self, columns: dict[str, np.ndarray], buys: np.ndarray, sells: np.ndarray, quantity: float,
+               market: str = "", min_hold: int = 0, latency_rows: float = 0, offset: int = 0, stop: int = None):
+        """
+        Generator to replay signals, continuing with the ``position`` and ``next_row`` of the previous replay. Alternates
+        between buying and selling like the live bot: a buy signal is only followed while no position is held, a sell
+        signal only while one is held. Signals during which an order is pending are skipped.
+
+        Args:
+            columns (dict[str, numpy.ndarray]): the candles, see ``columns``
+            buys (numpy.ndarray): the sorted rows of the buy signals, see ``TradingStrategyInterface.signal_rows``
+            sells (numpy.ndarray): the sorted rows of the sell signals
+            quantity (float): the quantity to buy
+            market (str=""): the market name, e.g.: ``"BTC-EUR"``
+            min_hold (int=0): the number of candles after a buy in which sell signals are skipped
+            latency_rows (float=0): the number of candles an order arrives after its signal, see ``latency_rows``
+            offset (int=0): the row of the first candle of ``columns``; signal rows and yielded rows are relative to it
+            stop (int=None): the replay stops at the first signal in this or a later row, e.g.: because its fill
+                depends on candles after ``columns``
+
+        Yields:
+            tuple[int, int, int, float, float, float]: the ``signal`` row, ``row``, ``direction`` (``1`` for buys,
+            ``-1`` for sells), ``price``, ``quantity`` and ``fee`` of every fill
+
+        """
+        close = columns["close"]
+        while True:
+            buy = self.position is None
+            rows = buys if buy else sells
+            k = np.searchsorted(rows, self.next_row)
+            if k == len(rows) or (stop is not None and rows[k] >= stop):
+                return
+            signal = int(rows[k])
+
+            direction = services.OrderDirection.BUY if buy else services.OrderDirection.SELL
+            order = self.create_order(market, direction, quantity if buy else self.position, close[signal - offset])
+            row, price, filled, fee = self.fill(order, signal - offset, columns, latency_rows)
+            row += offset
+            self.next_row = row + 1
+            if price is None:
+                continue
+
+            if buy:
+                self.position = filled
+                self.next_row += min_hold
+            else:
+                self.position = None
+            yield signal, row, 1 if buy else -1, price, filled, fee
+
+    def run(self, candles: pd.DataFrame, buys: np.ndarray, sells: np.ndarray, quantity: float, market: str = "",
+            min_hold: int = 0, candleinterval: services.CandleInterval = services.CandleInterval.MINUTE_1) -> dict[str, np.ndarray]:
+        """
+        Method to replay the signals of a whole backtest, see ``replay``
+
+        Args:
+            candles (pandas.DataFrame): the candles
+            buys (numpy.ndarray): the sorted rows of the buy signals, see ``TradingStrategyInterface.signal_rows``
+            sells (numpy.ndarray): the sorted rows of the sell signals
+            quantity (float): the quantity to buy
+            market (str=""): the market name, e.g.: ``"BTC-EUR"``
+            min_hold (int=0): the number of candles after a buy in which sell signals are skipped
+            candleinterval (services.CandleInterval=MINUTE_1): the interval of the candles
+
+        Returns:
+            dict[str, numpy.ndarray]: the ``row``, ``direction`` (``1`` for buys, ``-1`` for sells), ``price``,
+            ``quantity`` and ``fee`` of every fill
+
+        """
+        self.reset()
+        fills = list(self.replay(self.columns(candles), buys, sells, quantity, market, min_hold,
+                                 self.latency_rows(candleinterval)))
+        _, row, direction, price, filled, fee = zip(*fills) if fills else ((),) * 6
+
+        return {
+            "row": np.array(row, dtype=np.int64),
+            "direction": np.array(direction, dtype=np.int8),
+            "price": np.array(price, dtype=np.float64),
+            "quantity": np.array(filled, dtype=np.float64),
+            "fee": np.array(fee, dtype=np.float64),
+        }
+
+    @staticmethod
+    def transactions(fills: dict[str, np.ndarray]) -> tuple[np.ndarray, np.ndarray] or None:
+        """
+        Calculates the win or loss of every completed buy and sell pair, fees included
+
+        Args:
+            fills (dict[str, numpy.ndarray]): the fills, see ``run``
+
+        Returns:
+            tuple[numpy.ndarray, numpy.ndarray] or None: the absolute win and the input of every transaction, see
+            ``calc_transactions``; ``None`` if nothing was bought and sold
+
+        """
+        value = fills["price"] * fills["quantity"]
+        buys = fills["direction"] == 1
+        sells = fills["direction"] == -1
+        if not sells.any():
+            return None
+
+        inputs = (value + fills["fee"])[buys][:sells.sum()]
+        outputs = (value - fills["fee"])[sells]
+        return outputs - inputs, inputs
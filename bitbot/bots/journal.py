@@ -0,0 +1,224 @@
+import os
+import threading
+import datetime as dt
+import numpy as np
+import pandas as pd
+from bitbot import services
+from bitbot.services.candlestore import to_timestamp
+
+
+TRADE_DTYPE = np.dtype([
+    # nanoseconds since epoch
+    ("time", "<i8"),
+    # 1 for a buy, -1 for a sell
+    ("direction", "<i1"),
+    ("quantity", "<f8"),
+    # the quote currency spent by a buy or received by a sell
+    ("proceeds", "<f8"),
+    ("commission", "<f8"),
+])
+
+DIRECTIONS = {services.OrderDirection.BUY: 1, services.OrderDirection.SELL: -1}
+
+
+def trades_frame(records: np.ndarray) -> pd.DataFrame:
+    """
+    Returns trades as a DataFrame with ``time``, ``direction``, ``quantity``, ``proceeds`` and ``commission`` columns
+
+    Args:
+        records (numpy.ndarray): a structured array of ``TRADE_DTYPE``
+
+    """
+    df = pd.DataFrame({col: records[col] for col in TRADE_DTYPE.names[1:]})
+    df.insert(0, "time", records["time"].view("datetime64[ns]"))
+    return df
+
+
+class TradeJournal:
+    """
+    Append-only journal of the filled orders of a bot. New trades are collected in a preallocated in-memory
+    buffer and appended to a log file of raw ``TRADE_DTYPE`` records every ``batch_size`` trades. The log is
+    memory-mapped when the journal is opened, so even a long history is available right after a restart without
+    parsing it.
+
+    Trades are appended in chronological order, so time ranges are looked up with a binary search.
+
+    Attributes:
+        path (str): the path of the log file
+        batch_size (int): the number of trades collected before they are written to the log
+
+    Args:
+        path (str): the path of the log file; created with the first flush
+        batch_size (int=1): the number of trades collected before they are written to the log
+
+    """
+    def __init__(self, path: str, batch_size: int = 1):
+        self.path = path
+        self.batch_size = batch_size
+        self._pending = np.empty(batch_size, dtype=TRADE_DTYPE)
+        self._count = 0
+        self._lock = threading.RLock()
+        self._records = self._map()
+
+    def _map(self) -> np.ndarray:
+        if not os.path.exists(self.path):
+            return np.empty(0, dtype=TRADE_DTYPE)
+        size = os.path.getsize(self.path)
+        count = size // TRADE_DTYPE.itemsize
+        if size != count * TRADE_DTYPE.itemsize:
+            # a record cut off by a crash while writing would shift all following ones; cut off before the log is
+            # mapped, as mapped files cannot be truncated on Windows
+            with open(self.path, "r+b") as f:
+                f.truncate(count * TRADE_DTYPE.itemsize)
+        if not count:
+            return np.empty(0, dtype=TRADE_DTYPE)
+        return np.memmap(self.path, dtype=TRADE_DTYPE, mode="r", shape=(count,))
+
+    def append(self, direction: services.OrderDirection, quantity: float, proceeds: float, commission: float = 0.0,
+               time: dt.datetime = None):
+        """
+        Method to record a filled order in O(1). Writes the collected trades to the log once ``batch_size`` are pending.
+
+        Args:
+            direction (services.OrderDirection): the direction of the order
+            quantity (float): the filled quantity
+            proceeds (float): the quote currency spent by a buy or received by a sell
+            commission (float=0.0): the commission paid
+            time (datetime.datetime=None): the UTC time of the fill; now if ``None``
+
+        """
+        time = pd.Timestamp.now("UTC") if time is None else to_timestamp(time)
+        with self._lock:
+            self._pending[self._count] = (time.value, DIRECTIONS[direction], quantity, proceeds, commission)
+            self._count += 1
+            if self._count == self.batch_size:
+                self.flush()
+
+    def flush(self):
+        """
+        Method to append the pending trades to the log file
+
+        """
+        with self._lock:
+            if not self._count:
+                return
+
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "ab") as f:
+                f.write(self._pending[:self._count].tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            self._count = 0
+            self._records = self._map()
+
+    def __len__(self) -> int:
+        return len(self._records) + self._count
+
+    #### queries
+
+    def records(self) -> np.ndarray:
+        """
+        Returns all trades, the flushed ones without copying if none are pending
+
+        Returns:
+            numpy.ndarray: a read-only structured array of ``TRADE_DTYPE``
+
+        """
+        with self._lock:
+            if not self._count:
+                return self._records
+            records = np.concatenate([self._records, self._pending[:self._count]])
+        records.flags.writeable = False
+        return records
+
+    @property
+    def last_direction(self) -> services.OrderDirection or None:
+        """
+        services.OrderDirection or None: the direction of the most recent trade, ``None`` without trades
+
+        """
+        if not len(self):
+            return None
+        last = self._pending[self._count - 1] if self._count else self._records[-1]
+        return services.OrderDirection.BUY if last["direction"] == 1 else services.OrderDirection.SELL
+
+    def between(self, start: dt.datetime = None, end: dt.datetime = None) -> np.ndarray:
+        """
+        Returns the trades made in ``[start, end)``
+
+        Args:
+            start (datetime.datetime=None): UTC start of the range; the first trade if ``None``
+            end (datetime.datetime=None): UTC end of the range; after the last trade if ``None``
+
+        Returns:
+            numpy.ndarray: a structured array of ``TRADE_DTYPE``
+
+        """
+        records = self.records()
+        lo = 0 if start is None else np.searchsorted(records["time"], to_timestamp(start).value)
+        hi = len(records) if end is None else np.searchsorted(records["time"], to_timestamp(end).value)
+        return records[lo:hi]
+
+    def round_trips(self) -> pd.DataFrame:
+        """
+        Returns every buy that was followed by a sell
+
+        Returns:
+            pandas.DataFrame: the ``buy_time``, ``sell_time``, ``input``, ``output`` and ``profit`` after commissions
+            of every round trip
+
+        """
+        records = self.records()
+        # the bot alternates between buying and selling, so every sell closes the buy right before it
+        sells = np.flatnonzero(records["direction"][1:] == -1) + 1
+        sells = sells[records["direction"][sells - 1] == 1]
+        buys = records[sells - 1]
+        sells = records[sells]
+        return pd.DataFrame({
+            "buy_time": buys["time"].view("datetime64[ns]"),
+            "sell_time": sells["time"].view("datetime64[ns]"),
+            "input": buys["proceeds"],
+            "output": sells["proceeds"],
+            "profit": sells["proceeds"] - buys["proceeds"] - buys["commission"] - sells["commission"],
+        })
+
+    def pnl(self, start: dt.datetime = None, end: dt.datetime = None) -> float:
+        """
+        Returns the realized profit of the round trips closed in ``[start, end)``
+
+        Args:
+            start (datetime.datetime=None): UTC start of the range; the first trade if ``None``
+            end (datetime.datetime=None): UTC end of the range; after the last trade if ``None``
+
+        Returns:
+            float: the profit after commissions, in the quote currency
+
+        """
+        trips = self.round_trips()
+        times = trips["sell_time"].to_numpy().view(np.int64)
+        lo = 0 if start is None else np.searchsorted(times, to_timestamp(start).value)
+        hi = len(times) if end is None else np.searchsorted(times, to_timestamp(end).value)
+        return float(trips["profit"].to_numpy()[lo:hi].sum())
+
+    def pnl_by(self, freq: str = "D") -> pd.Series:
+        """
+        Returns the realized profit per period, e.g.: per day or per week
+
+        Args:
+            freq (str="D"): a pandas offset alias
+
+        Returns:
+            pandas.Series: the profit of the round trips closed in every period, indexed by its start
+
+        """
+        trips = self.round_trips()
+        return trips.set_index("sell_time")["profit"].resample(freq).sum()
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Returns all trades as a DataFrame, see ``trades_frame``
+
+        """
+        return trades_frame(self.records())
@@ -0,0 +1,369 @@
+import itertools
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from bitbot import services, strategy, bots, optimizer
+from bitbot.strategy import batch, kernels
+import numpy as np
+import pandas as pd
+
+
+def align(frames: dict[str, pd.DataFrame]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Aligns the closes of many markets on the union of their candle times
+
+    Args:
+        frames (dict[str, pandas.DataFrame]): the candles by market
+
+    Returns:
+        tuple[numpy.ndarray, numpy.ndarray]: the times in nanoseconds since epoch and the closes shaped [time, market],
+        ``nan`` where a market has no candle
+
+    """
+    times = [frame["startsat"].to_numpy(dtype="datetime64[ns]").view(np.int64) for frame in frames.values()]
+    index = times[0]
+    if any(len(market_times) != len(index) or (market_times != index).any() for market_times in times[1:]):
+        index = np.unique(np.concatenate(times))
+    dtype = np.result_type(*(frame["close"].dtype for frame in frames.values()))
+    close = np.full((len(index), len(frames)), np.nan, dtype=dtype)
+    for col, (frame, market_times) in enumerate(zip(frames.values(), times)):
+        close[np.searchsorted(index, market_times), col] = frame["close"].to_numpy()
+    return index, close
+
+
+def pack(values: np.ndarray, valid: np.ndarray) -> tuple[np.ndarray, np.ndarray or None]:
+    """
+    Moves the valid rows of every column to its top, so every column holds the candles of its market without gaps
+
+    Returns:
+        tuple[numpy.ndarray, numpy.ndarray or None]: the packed values and the rows they came from, see ``unpack``;
+        ``None`` if all rows are valid
+
+    """
+    if valid.all():
+        return values, None
+    order = np.argsort(~valid, axis=0, kind="stable")
+    return np.take_along_axis(values, order, axis=0), order
+
+
+def unpack(packed: np.ndarray, order: np.ndarray or None) -> np.ndarray:
+    if order is None:
+        return packed
+    values = np.empty_like(packed)
+    np.put_along_axis(values, order, packed, axis=0)
+    return values
+
+
+def resolve_orders(buy_mask: np.ndarray, sell_mask: np.ndarray, min_hold: int) -> np.ndarray:
+    """
+    Resolves the alternation of buying and selling of every column at once, starting with a buy, as
+    ``TradingStrategyInterface.generate_signals`` does for a single market. Every iteration searches the next buy and
+    the next sell of all columns, so the number of iterations is the largest number of trades of a column.
+
+    Args:
+        buy_mask (numpy.ndarray): the rows with buy signals, shaped [candle, market]
+        sell_mask (numpy.ndarray): the rows with sell signals, shaped [candle, market]
+        min_hold (int): the number of candles after a buy in which no sell can be triggered
+
+    Returns:
+        numpy.ndarray: ``1`` for buys, ``-1`` for sells and ``0`` otherwise, shaped [candle, market]
+
+    """
+    rows, markets = buy_mask.shape
+    orders = np.zeros((rows, markets), dtype=np.int8)
+    # the signals of all columns one column after the other, so a search from a row finds the next signal of its
+    # column, or one of a later column if there is none
+    buys, sells = (np.append(np.flatnonzero(mask.T), rows * markets) for mask in (buy_mask, sell_mask))
+
+    cols = np.arange(markets)
+    pos = np.zeros(markets, dtype=np.int64)
+    for signals, direction, hold in itertools.cycle(((buys, 1, min_hold), (sells, -1, 0))):
+        if not len(cols):
+            break
+        start = cols * rows
+        found = signals[np.searchsorted(signals, start + pos)] - start
+        cols, pos = cols[found < rows], found[found < rows]
+        orders[pos, cols] = direction
+        pos = np.minimum(pos + 1 + hold, rows)
+    return orders
+
+
+def portfolio_stats(times: np.ndarray, sell_rows: np.ndarray, wins: np.ndarray, capital: float) -> tuple[dict[str, float], np.ndarray]:
+    """
+    Calculates the key figures of a portfolio, see ``backtest_stats``. The profits are relative to the capital, the
+    drawdown to the peak of the equity on the common time index.
+
+    Args:
+        times (numpy.ndarray): the common time index
+        sell_rows (numpy.ndarray): the row of the sell of every transaction of all markets
+        wins (numpy.ndarray): the absolute win of every transaction
+        capital (float): the input of all markets together
+
+    Returns:
+        tuple[dict[str, float], numpy.ndarray]: the stats and the equity at every time
+
+    """
+    profits = np.zeros(len(times))
+    np.add.at(profits, sell_rows, wins)
+    equity = capital + np.cumsum(profits)
+    peak = np.maximum.accumulate(np.concatenate(([capital], equity)))[1:]
+
+    return {
+        "transactions": len(wins),
+        "wins": int((wins > 0).sum()),
+        "losses": int((wins <= 0).sum()),
+        "profit": float(wins.sum()),
+        "success_rate": float((wins > 0).sum() / len(wins)) if len(wins) else 0.0,
+        "profit_increase": float(equity[-1] / capital - 1),
+        "max_drawdown": float((1 - equity / peak).max()),
+    }, equity
+
+
+class PortfolioBacktestBot(bots.BacktestBot):
+    """
+    A bot that backtests a strategy on many markets at once. The closes of all markets are aligned on the union of
+    their candle times in 2-D arrays shaped [time, market]; the indicators, the signal masks and the alternation of
+    buying and selling are computed for all markets in one pass of array operations, on blocks of markets in
+    parallel. Every market gets the orders a regular backtest of it would generate, filled at the close of the signal
+    candle without fees.
+
+    Configured with ``markets`` instead of ``market``:
+
+    ::
+
+        markets: [BTC-EUR, ETH-EUR, ADA-EUR]
+        quantity: # one quantity for all markets, or one per market
+          BTC-EUR: 0.0012
+          ETH-EUR: 0.02
+          ADA-EUR: 40
+        backtest:
+          start: 2021-05-01
+          end: 2021-05-30
+          max_workers: 4 # optional, threads downloading and evaluating blocks of markets; all cores by default
+          output: ./portfolio.csv # optional, the stats of every market and of the portfolio
+
+    All markets must be traded in the same currency, as the portfolio sums their profits.
+
+    Attributes:
+        markets (list[str]): the markets of the portfolio
+        portfolio (dict[str, float]): the stats of the whole portfolio of the last backtest, see ``portfolio_stats``
+        equity (pandas.DataFrame): the ``time`` and ``equity`` of the portfolio of the last backtest
+
+    """
+    def __init__(self, name: str, config: str or dict[str, any], service: services.ServiceInterface = None):
+        if isinstance(config, str):
+            with open(config, encoding="utf8") as f:
+                config = json.load(f)
+
+        self.markets = list(config["markets"])
+        currencies = {market.split("-")[1] for market in self.markets}
+        if len(currencies) != 1:
+            raise ValueError(f"{name}: the markets of a portfolio must be traded in one currency, not {', '.join(sorted(currencies))}")
+
+        # the strategy logs all markets under one name
+        super().__init__(name, dict(config, market=";".join(self.markets)), service)
+        if type(self.strat).signal_masks is strategy.TradingStrategyInterface.signal_masks:
+            raise ValueError(f"{config['strat']['name']} has no vectorized signal path and can not be backtested as a portfolio")
+
+        self.max_workers = self.config["backtest"].get("max_workers") or os.cpu_count()
+        self.portfolio = None
+        self.equity = None
+
+    def quantities(self) -> np.ndarray:
+        quantity = self.config["quantity"]
+        if isinstance(quantity, dict):
+            return np.array([quantity[market] for market in self.markets], dtype=np.float64)
+        return np.full(len(self.markets), quantity, dtype=np.float64)
+
+    def load_markets(self) -> dict[str, pd.DataFrame]:
+        """
+        Method to get the candles of every market in the backtest timeframe, on ``max_workers`` threads
+
+        Returns:
+            dict[str, pandas.DataFrame]: the candles by market
+
+        Raises:
+            services.HistoryGapError: if parts of the timeframe are not available for a market
+
+        """
+        backtest_cfg = self.config["backtest"]
+
+        def load(market: str) -> pd.DataFrame:
+            return self.service.get_history_data(market, services.CandleInterval.MINUTE_1,
+                                                 backtest_cfg["start"], backtest_cfg["end"])
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(self.markets))) as executor:
+            return dict(zip(self.markets, executor.map(load, self.markets)))
+
+    def apply_batch_tas(self, close: np.ndarray) -> dict[str, np.ndarray]:
+        """
+        Method to apply the technical indicators specified in the template to the closes of many markets, see
+        ``strategy.batch``, or ``strategy.kernels`` if the strategy uses them
+
+        Args:
+            close (numpy.ndarray): the closes shaped [candle, market], every column padded with ``nan`` at the end
+
+        Returns:
+            dict[str, numpy.ndarray]: the ``close`` and the indicator columns, shaped like ``close``
+
+        """
+        source = kernels.INDICATORS if self.strat.kernels else batch.INDICATORS
+        columns = {"close": close}
+        for name, params in self.strat.indicator_params(self.config["strat"].get("ta_params", {})).items():
+            columns.update(source[name](close, **params))
+        return columns
+
+    def generate_orders(self, close: np.ndarray) -> np.ndarray:
+        """
+        Method to apply the strategy to every candle of many markets, as ``BacktestBot.generate_orders`` does for one
+
+        Args:
+            close (numpy.ndarray): the closes shaped [time, market], ``nan`` where a market has no candle
+
+        Returns:
+            numpy.ndarray: ``1`` for buys, ``-1`` for sells and ``0`` otherwise, shaped [time, market]
+
+        """
+        valid = ~np.isnan(close)
+        # the indicators and the windows of the strategy count the candles of a market, not the time
+        packed, order = pack(close, valid)
+        valid = np.take_along_axis(valid, order, axis=0) if order is not None else valid
+
+        buy_mask, sell_mask = self.strat.signal_masks(self.apply_batch_tas(packed))
+        # the signal of row i is based on the candles up to row i-1, see ``TradingStrategyInterface.signal_rows``
+        masks = []
+        for mask in (buy_mask, sell_mask):
+            shifted = np.zeros(valid.shape, dtype=bool)
+            shifted[self.WINDOW:] = np.asarray(mask, dtype=bool)[self.WINDOW - 1:-1]
+            # the rows after the last candle of a market are only padding
+            masks.append(shifted & valid)
+        if self.strat.min_hold >= self.WINDOW:
+            # the candles since the buy never fill the window
+            masks[1][:] = False
+
+        return unpack(resolve_orders(*masks, self.strat.min_hold), order)
+
+    def backtest(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Method to backtest all markets, ``max_workers`` blocks of markets in parallel
+
+        Returns:
+            tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]: the common time index, the closes and the orders,
+            see ``generate_orders``
+
+        Raises:
+            services.HistoryGapError: if parts of the timeframe are not available for a market
+
+        """
+        times, close = align(self.load_markets())
+
+        bounds = np.linspace(0, len(self.markets), min(self.max_workers, len(self.markets)) + 1).astype(int)
+        with ThreadPoolExecutor(max_workers=len(bounds) - 1) as executor:
+            blocks = executor.map(lambda b: self.generate_orders(close[:, b[0]:b[1]]), zip(bounds[:-1], bounds[1:]))
+            orders = np.concatenate(list(blocks), axis=1)
+        return times, close, orders
+
+    def run(self) -> pd.DataFrame or None:
+        """
+        Method to start the Bot. Backtests all markets, prints a summary of every market and of the portfolio and
+        writes it to ``backtest.output``, if configured. Does not wait for any input.
+
+        Returns:
+            pandas.DataFrame or None: the ``backtest_stats``, ``input`` and ``holding`` profit of every market and of
+            the ``portfolio``
+
+        """
+        backtest_cfg = self.config["backtest"]
+        try:
+            results = self.results()
+        except services.HistoryGapError as e:
+            print(f"\n### ERROR: {e}")
+            return
+
+        capital = self.portfolio["input"]
+        currency = self.markets[0].split("-")[1]
+        print(f"\n\n\n### Portfolio summary {self.name} ###\n\n"
+              f"{'Timeframe:':<32}{backtest_cfg['start'].strftime('%Y-%m-%d %H:%M:%S') + ' - ' + backtest_cfg['end'].strftime('%Y-%m-%d %H:%M:%S')}\n")
+        for market, res in results.iloc[:-1].iterrows():
+            print(f"{market + ':':<32}{int(res['transactions']):>6} transactions {res['profit']:>16.6f} {currency} "
+                  f"{round(res['profit_increase']*100, 4):>10} %")
+        print(f"\n{'Markets:':<32}{len(self.markets)}\n"
+              f"{'Transactions made:':<32}{self.portfolio['transactions']}\n"
+              f"{'Est. input:':<32}{capital} {currency}\n"
+              f"{'Est. profit gain:':<32}{self.portfolio['profit']} {currency}\n"
+              f"{'Est. profit w/ holding:':<32}{self.portfolio['holding']} {currency}\n"
+              "\n"
+              f"{'Success rate:':<32}{round(self.portfolio['success_rate']*100, 4)} %\n"
+              f"{'Profit increase:':<32}{round(self.portfolio['profit_increase']*100, 4)} %\n"
+              f"{'Max drawdown:':<32}{round(self.portfolio['max_drawdown']*100, 4)} %\n")
+
+        output = backtest_cfg.get("output")
+        if output:
+            results.to_csv(output)
+        return results
+
+    def results(self) -> pd.DataFrame:
+        """
+        Method to backtest all markets. Sets ``portfolio`` and ``equity``.
+
+        Returns:
+            pandas.DataFrame: the ``backtest_stats``, ``input`` and ``holding`` profit of every market and of the
+            ``portfolio``
+
+        Raises:
+            services.HistoryGapError: if parts of the timeframe of a market are not available
+
+        """
+        times, close, orders = self.backtest()
+
+        quantity = self.quantities()
+        valid = ~np.isnan(close)
+        first = close[valid.argmax(axis=0), np.arange(len(self.markets))]
+        last = close[len(close) - 1 - valid[::-1].argmax(axis=0), np.arange(len(self.markets))]
+
+        # the buys and sells of every market, market by market; a last buy without a sell is left out
+        buy_cols, buy_rows = np.nonzero(orders.T == 1)
+        sell_cols, sell_rows = np.nonzero(orders.T == -1)
+        sells = np.bincount(sell_cols, minlength=len(self.markets))
+        buy_starts = np.searchsorted(buy_cols, np.arange(len(self.markets)))
+        matched = np.arange(len(buy_cols)) - buy_starts[buy_cols] < sells[buy_cols]
+        buy_rows = buy_rows[matched]
+
+        # the quantity is multiplied in the dtype of the closes, like ``calc_transactions`` does
+        qty = quantity.astype(close.dtype)[sell_cols]
+        inputs = close[buy_rows, sell_cols] * qty
+        wins = close[sell_rows, sell_cols] * qty - inputs
+
+        stats = []
+        ends = np.cumsum(sells)
+        for col, market in enumerate(self.markets):
+            start, end = ends[col] - sells[col], ends[col]
+            market_stats = dict(bots.backtestbot.backtest_stats((wins[start:end], inputs[start:end])) if end > start
+                                else optimizer.NO_TRANSACTIONS)
+            market_stats["input"] = float(quantity[col] * first[col])
+            market_stats["holding"] = float((last[col] - first[col]) * quantity[col])
+            stats.append(market_stats)
+
+        capital = float((quantity * first).sum())
+        # the transactions of all markets in the order of their sells
+        by_time = np.argsort(sell_rows, kind="stable")
+        self.portfolio, equity = portfolio_stats(times, sell_rows[by_time], wins[by_time].astype(np.float64), capital)
+        self.portfolio["input"] = capital
+        self.portfolio["holding"] = sum(s["holding"] for s in stats)
+        self.equity = pd.DataFrame({"time": times.view("datetime64[ns]"), "equity": equity})
+
+        return pd.DataFrame(stats + [self.portfolio], index=pd.Index(self.markets + ["portfolio"], name="market"))
+
+    def report(self) -> list[dict[str, any]]:
+        """
+        Method to backtest without printing a summary, see ``BacktestBot.report``
+
+        Returns:
+            list[dict[str, any]]: the ``market``, the ``backtest_stats`` and the estimated ``input`` and ``holding``
+            profit of every market and of the ``portfolio``
+
+        Raises:
+            services.HistoryGapError: if parts of the timeframe of a market are not available
+
+        """
+        return self.results().reset_index().to_dict("records")
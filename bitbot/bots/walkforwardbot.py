@@ -0,0 +1,240 @@
+import copy
+import os
+import datetime as dt
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from bitbot import services, strategy, bots, optimizer
+from bitbot.services.candlestore import to_timestamp
+import numpy as np
+import pandas as pd
+
+
+def _walk_forward(strat_config: dict[str, any], ta_grid: list[dict[str, any]], trigger_grid: list[dict[str, any]],
+                  market: str, quantity: float, window: int, train_rows: tuple[int, int], test_rows: tuple[int, int]) -> dict[str, any]:
+    """
+    Optimizes the parameters on the train rows of the shared indicator frames and backtests the best ones on the test rows.
+    Both ranges start ``window`` rows early, so the strategy sees full windows from their first candle on.
+
+    """
+    train_start = max(0, train_rows[0] - window)
+    results = []
+    for index, ta_params in enumerate(ta_grid):
+        cfg = dict(strat_config, ta_params=ta_params)
+        for res in optimizer._evaluate(cfg, market, quantity, window, index, trigger_grid, (train_start, train_rows[1])):
+            res["frame"] = index
+            results.append(res)
+    best = optimizer.rank(results)[0]
+
+    test_start = max(0, test_rows[0] - window)
+    candles = optimizer._FRAMES[best["frame"]].iloc[test_start:test_rows[1]]
+    cfg = dict(strat_config, ta_params=best["ta_params"], trigger_params=best["trigger_params"])
+    strat = getattr(strategy, cfg["name"])(None, cfg, market)
+    orders = strat.generate_signals(candles, window)
+
+    out = {
+        "train_rows": train_rows,
+        "test_rows": test_rows,
+        "ta_params": best["ta_params"],
+        "trigger_params": best["trigger_params"],
+        "train_stats": {key: best[key] for key in optimizer.NO_TRANSACTIONS},
+        "test_stats": optimizer.NO_TRANSACTIONS,
+        "sell_rows": np.empty(0, dtype=np.int64),
+        "wins": np.empty(0),
+        "inputs": np.empty(0),
+    }
+    result = bots.backtestbot.calc_transactions(candles["close"].to_numpy(), orders, quantity)
+    if result is not None:
+        wins, inputs = result
+        out["test_stats"] = bots.backtestbot.backtest_stats(result)
+        out["sell_rows"] = np.flatnonzero(orders == -1)[:len(wins)] + test_start
+        out["wins"], out["inputs"] = wins, inputs
+    return out
+
+
+def transactions(results: list[dict[str, any]]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the absolute wins and the inputs of the out-of-sample transactions of all windows, see ``calc_transactions``
+
+    """
+    return np.concatenate([res["wins"] for res in results]), np.concatenate([res["inputs"] for res in results])
+
+
+class WalkForwardBot(bots.BacktestBot):
+    """
+    A bot that evaluates a strategy walk-forward: the backtest timeframe is split into rolling train and test windows.
+    The parameters of the ``optimize`` grid are optimized on every train window and backtested on the test window
+    that follows it. The out-of-sample results of all test windows are stitched into one equity curve.
+
+    The indicators are computed once over the whole timeframe and shared with the worker processes, which evaluate
+    the windows in parallel. Configured in the ``backtest`` section:
+
+    ::
+
+        backtest:
+          start: 2021-01-01
+          end: 2021-06-30
+          max_workers: 4 # optional, the worker processes evaluating the windows; all cores by default
+          walk_forward:
+            train: 28 # days
+            test: 7 # days
+            step: 7 # days, defaults to test; at least test, so the test windows do not overlap
+            output: ./walk_forward.csv # optional, the stitched equity curve
+
+    """
+    def windows(self, candles: pd.DataFrame) -> list[tuple[tuple[int, int], tuple[int, int]]]:
+        """
+        Method to split the candles into train and test windows. The test windows must not overlap, or the
+        transactions in the overlap would be counted once per window in the stitched results.
+
+        Returns:
+            list[tuple[tuple[int, int], tuple[int, int]]]: the start and stop rows of every train and test window
+
+        Raises:
+            ValueError: if the ``step`` is shorter than the ``test`` window
+
+        """
+        backtest_cfg = self.config["backtest"]
+        wf_cfg = backtest_cfg["walk_forward"]
+        train = dt.timedelta(days=wf_cfg["train"])
+        test = dt.timedelta(days=wf_cfg["test"])
+        step = dt.timedelta(days=wf_cfg.get("step", wf_cfg["test"]))
+        if step < test:
+            raise ValueError(f"The walk-forward step ({step.days} days) is shorter than the test window "
+                             f"({test.days} days), the test windows would overlap!")
+
+        times = candles["startsat"].to_numpy().astype("datetime64[ns]").view(np.int64)
+        end = to_timestamp(backtest_cfg["end"])
+        start = to_timestamp(backtest_cfg["start"])
+
+        windows = []
+        while start + train + test <= end:
+            bounds = [start, start + train, start + train + test]
+            first, split, stop = np.searchsorted(times, [b.value for b in bounds])
+            windows.append(((int(first), int(split)), (int(split), int(stop))))
+            start += step
+        return windows
+
+    def run(self):
+        """
+        Method to start the Bot. Downloads history data in timeframe specified in the config file, runs the walk-forward
+        evaluation and prints a summary of the out-of-sample results. Does not wait for any input.
+
+        Returns:
+            pandas.DataFrame or None: the stitched out-of-sample equity curve, one row per transaction
+
+        """
+        try:
+            candles, results, equity = self.walk_forward()
+        except (ValueError, services.HistoryGapError) as e:
+            print(f"\n### ERROR: {e}")
+            return
+
+        backtest_cfg = self.config["backtest"]
+        wins, inputs = transactions(results)
+
+        print(f"\n\n\n### Walk-forward summary {self.name} ###\n")
+        for i, res in enumerate(results):
+            test_start, test_stop = res["test_rows"]
+            timeframe = f"{candles['startsat'].iloc[test_start].strftime('%Y-%m-%d')} - {candles['startsat'].iloc[test_stop - 1].strftime('%Y-%m-%d')}"
+            print(f"{'Test window ' + str(i) + ':':<32}{timeframe}\n"
+                  f"{'Parameters:':<32}{res['trigger_params']} {res['ta_params']}\n"
+                  f"{'In-sample profit increase:':<32}{round(res['train_stats']['profit_increase']*100, 4)} %\n"
+                  f"{'Out-of-sample profit increase:':<32}{round(res['test_stats']['profit_increase']*100, 4)} %\n")
+
+        currency = self.config["market"].split("-")[1]
+        if len(wins) == 0:
+            print("No out-of-sample transactions would have been made in this timeframe!")
+        else:
+            stats = bots.backtestbot.backtest_stats((wins, inputs))
+            print(f"{'Transactions made:':<32}{stats['transactions']}\n"
+                  f"{'Est. profit gain:':<32}{stats['profit']} {currency}\n"
+                  f"{'Success rate:':<32}{round(stats['success_rate']*100, 4)} %\n"
+                  f"{'Profit increase:':<32}{round(stats['profit_increase']*100, 4)} %\n"
+                  f"{'Max drawdown:':<32}{round(stats['max_drawdown']*100, 4)} %\n")
+
+        output = backtest_cfg["walk_forward"].get("output")
+        if output:
+            equity.to_csv(output, index=False)
+        return equity
+
+    def walk_forward(self) -> tuple[pd.DataFrame, list[dict[str, any]], pd.DataFrame]:
+        """
+        Method to optimize and backtest every window on ``backtest.max_workers`` worker processes, all cores by default
+
+        Returns:
+            tuple[pandas.DataFrame, list[dict[str, any]], pandas.DataFrame]: the candles, the parameters and stats of
+            every window and the stitched out-of-sample equity curve, one row per transaction
+
+        Raises:
+            ValueError: if the bot has no ``optimize`` section, the timeframe is shorter than a train and a test window
+                or the ``step`` is shorter than the ``test`` window
+            services.HistoryGapError: if parts of the timeframe are not available
+
+        """
+        if "optimize" not in self.config:
+            raise ValueError(f"{self.name} has no optimize section")
+
+        backtest_cfg = self.config["backtest"]
+        candles = self.service.get_history_data(self.config["market"], services.CandleInterval.MINUTE_1,
+                                                backtest_cfg["start"], backtest_cfg["end"])
+
+        windows = self.windows(candles)
+        if not windows:
+            raise ValueError("Timeframe is shorter than a train and a test window!")
+
+        ta_grid, trigger_grid = optimizer.parameter_grid(self.config)
+        blocks, shms = optimizer.share_frames(self.apply_tas_grid(candles, ta_grid))
+        try:
+            results = [None] * len(windows)
+            max_workers = min(len(windows), backtest_cfg.get("max_workers") or os.cpu_count())
+            with ProcessPoolExecutor(max_workers=max_workers, initializer=optimizer._attach, initargs=(blocks,)) as executor:
+                futures = {
+                    executor.submit(_walk_forward, copy.deepcopy(self.config["strat"]), ta_grid, trigger_grid, self.config["market"],
+                                    self.config["quantity"], self.WINDOW, train_rows, test_rows): i
+                    for i, (train_rows, test_rows) in enumerate(windows)
+                }
+                services.printProgressBar(0, len(futures), f"{'Walking forward':<32}")
+                for done, future in enumerate(as_completed(futures), 1):
+                    results[futures[future]] = future.result()
+                    services.printProgressBar(done, len(futures), f"{'Walking forward':<32}")
+        finally:
+            optimizer.release_frames(shms)
+
+        sell_rows = np.concatenate([res["sell_rows"] for res in results])
+        wins, inputs = transactions(results)
+        equity = pd.DataFrame({
+            "time": candles["startsat"].to_numpy()[sell_rows],
+            "window": np.repeat(np.arange(len(results)), [len(res["wins"]) for res in results]),
+            "profit": wins,
+            "rel_win": wins / inputs,
+            "equity": np.cumprod(1 + wins / inputs),
+        })
+        return candles, results, equity
+
+    def report(self) -> list[dict[str, any]]:
+        """
+        Method to walk forward without printing a summary, see ``BacktestBot.report``
+
+        Returns:
+            list[dict[str, any]]: one row with the ``market``, the ``backtest_stats`` of all test windows together,
+            the number of ``windows`` and the estimated ``input`` and ``holding`` profit
+
+        Raises:
+            ValueError: if the bot has no ``optimize`` section, the timeframe is shorter than a train and a test window
+                or the ``step`` is shorter than the ``test`` window
+            services.HistoryGapError: if parts of the timeframe are not available
+
+        """
+        candles, results, equity = self.walk_forward()
+
+        qty = self.config["quantity"]
+        first_close = float(candles["close"].iloc[0])
+        last_close = float(candles["close"].iloc[-1])
+        wins, inputs = transactions(results)
+        stats = bots.backtestbot.backtest_stats((wins, inputs)) if len(wins) else optimizer.NO_TRANSACTIONS
+        return [{
+            "market": self.config["market"],
+            **stats,
+            "windows": len(results),
+            "input": qty * first_close,
+            "holding": (last_close - first_close) * qty,
+        }]
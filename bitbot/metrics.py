@@ -0,0 +1,273 @@
+import bisect
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+#: the upper bounds of the histogram buckets in seconds, from 100 µs to 1 min
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+           30.0, 60.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Counter:
+    """
+    A monotonically increasing count, e.g.: of errors
+
+    """
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+
+class Timer:
+    """
+    Context manager observing the seconds its block takes in a ``Histogram``
+
+    """
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram: "Histogram"):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class Histogram:
+    """
+    Distribution of observed values in fixed buckets, e.g.: of durations. Observing a value costs a binary search
+    over the bucket bounds, so histograms can stay enabled in the hot paths.
+
+    Args:
+        buckets (tuple[float]=BUCKETS): the sorted upper bounds of the buckets
+
+    """
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets: tuple[float] = BUCKETS):
+        self.buckets = tuple(buckets)
+        # the last count is of the values above all bounds
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self) -> Timer:
+        """
+        Returns a context manager that observes the seconds its block takes
+
+        ::
+
+            with histogram.time():
+                service.get_candles(market, candleinterval)
+
+        """
+        return Timer(self)
+
+    def snapshot(self) -> tuple[list[int], float, int]:
+        """
+        Returns the counts per bucket, the sum and the count of the observed values at once
+
+        """
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+
+class Registry:
+    """
+    The metrics of a process by name and labels. The metrics are rendered in the Prometheus text format, which can
+    be served on a local http endpoint, see ``serve``, or written to a file periodically, see ``write_every``, e.g.:
+    for the textfile collector of the node exporter.
+
+    """
+    def __init__(self):
+        self._metrics = {}
+        self._types = {}
+        self._lock = threading.Lock()
+        self._servers = {}
+        self._writers = {}
+
+    def _get(self, kind: type, name: str, help: str, labels: dict[str, str], *args) -> Counter or Histogram:
+        key = (name, tuple(sorted(labels.items())))
+        metric = self._metrics.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(key)
+                if metric is None:
+                    self._types.setdefault(name, (kind, help))
+                    metric = self._metrics[key] = kind(*args)
+        return metric
+
+    def counter(self, name: str, help: str = "", **labels: str) -> Counter:
+        """
+        Returns the counter of a name and labels, created on first use
+
+        """
+        return self._get(Counter, name, help, labels)
+
+    def histogram(self, name: str, help: str = "", buckets: tuple[float] = BUCKETS, **labels: str) -> Histogram:
+        """
+        Returns the histogram of a name and labels, created on first use. Callers in hot paths should keep the
+        returned histogram instead of looking it up every time.
+
+        """
+        return self._get(Histogram, name, help, labels, buckets)
+
+    def render(self) -> str:
+        """
+        Renders all metrics in the Prometheus text format
+
+        Returns:
+            str
+
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.items(), key=lambda item: item[0])
+            types = dict(self._types)
+
+        lines = []
+        last = None
+        for (name, labels), metric in metrics:
+            kind, help = types[name]
+            if name != last:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {'counter' if kind is Counter else 'histogram'}")
+                last = name
+
+            if kind is Counter:
+                lines.append(f"{name}{format_labels(labels)} {metric.value}")
+                continue
+
+            counts, total, count = metric.snapshot()
+            cumulative = 0
+            for bound, bucket in zip(metric.buckets + ("+Inf",), counts):
+                cumulative += bucket
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labels)} {total}")
+            lines.append(f"{name}_count{format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str):
+        """
+        Writes all metrics to a file. The file is replaced at once, so readers never see a partial file.
+
+        Args:
+            path (str): the path of the file
+
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf8") as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+    def write_every(self, path: str, interval: float = 15):
+        """
+        Starts a daemon thread that writes all metrics to a file every ``interval`` seconds, unless one is already
+        writing to the path
+
+        Args:
+            path (str): the path of the file
+            interval (float=15): the seconds between two writes
+
+        """
+        stop = threading.Event()
+
+        def write():
+            while not stop.wait(interval):
+                try:
+                    self.write(path)
+                except OSError as e:
+                    logging.warning(f"* metrics: could not write {path}: {str(e)}")
+            self.write(path)
+
+        with self._lock:
+            if path in self._writers:
+                return
+            thread = threading.Thread(target=write, name="bitbot-metrics-writer", daemon=True)
+            self._writers[path] = (stop, thread)
+        thread.start()
+
+    def serve(self, port: int, host: str = "127.0.0.1"):
+        """
+        Starts a daemon thread that serves all metrics on ``http://<host>:<port>/metrics``, unless they are already
+        served there
+
+        Args:
+            port (int): the port
+            host (str="127.0.0.1"): the address to listen on; local only by default
+
+        """
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # scrapes are no news
+                pass
+
+        with self._lock:
+            if (host, port) in self._servers:
+                return
+            server = ThreadingHTTPServer((host, port), Handler)
+            server.daemon_threads = True
+            self._servers[(host, port)] = server
+        threading.Thread(target=server.serve_forever, name="bitbot-metrics-server", daemon=True).start()
+
+    def close(self):
+        """
+        Stops the http endpoints and writes the metrics files a last time
+
+        """
+        with self._lock:
+            servers, self._servers = list(self._servers.values()), {}
+            writers, self._writers = list(self._writers.values()), {}
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+        for stop, thread in writers:
+            stop.set()
+            thread.join()
+
+
+def format_labels(labels: tuple[tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+
+#: the registry shared by all bots and services of the process
+REGISTRY = Registry()
@@ -0,0 +1,235 @@
+import copy
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+from bitbot import bots, services, strategy
+
+
+def expand_grid(grid: dict[str, any]) -> list[dict[str, any]]:
+    """
+    Expands a (nested) parameter grid into every combination of its values. Lists are the values to choose from,
+    everything else is a fixed value.
+
+    ::
+
+        >>> expand_grid({"rsi": {"window": [14, 21]}, "rsi_buy": [5, 10]})
+        [{"rsi": {"window": 14}, "rsi_buy": 5}, {"rsi": {"window": 14}, "rsi_buy": 10},
+         {"rsi": {"window": 21}, "rsi_buy": 5}, {"rsi": {"window": 21}, "rsi_buy": 10}]
+
+    Args:
+        grid (dict[str, any]): the grid
+
+    Returns:
+        list[dict[str, any]]
+
+    """
+    keys = list(grid)
+    options = []
+    for key in keys:
+        value = grid[key]
+        if isinstance(value, dict):
+            options.append(expand_grid(value))
+        elif isinstance(value, list):
+            options.append(value)
+        else:
+            options.append([value])
+    return [dict(zip(keys, values)) for values in itertools.product(*options)]
+
+
+def parameter_grid(config: dict[str, any]) -> tuple[list[dict[str, any]], list[dict[str, any]]]:
+    """
+    Expands the ``optimize`` section of a bot config. Indicators and trigger parameters missing in it are taken from
+    the strategy config.
+
+    Args:
+        config (dict[str, any]): the bot config
+
+    Returns:
+        tuple[list[dict[str, any]], list[dict[str, any]]]: every ``ta_params`` and every ``trigger_params`` combination
+
+    """
+    strat_cfg = config["strat"]
+    grid_cfg = config["optimize"]
+    ta_grid = [dict(strat_cfg.get("ta_params", {}), **params) for params in expand_grid(grid_cfg.get("ta_params", {}))]
+    trigger_grid = [dict(strat_cfg["trigger_params"], **params) for params in expand_grid(grid_cfg.get("trigger_params", {}))]
+    return ta_grid, trigger_grid
+
+
+#### worker processes
+
+# the indicator frames of the worker process, by index of their ta_params
+_FRAMES = {}
+_SHARED = []
+
+
+def _attach(blocks: list[tuple[str, tuple[int, int], list[str]]]):
+    """
+    Initializer of the worker processes. Attaches the shared indicator frames without copying them.
+
+    """
+    for index, (name, shape, columns) in enumerate(blocks):
+        shm = shared_memory.SharedMemory(name=name)
+        data = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        _SHARED.append(shm)
+        _FRAMES[index] = pd.DataFrame({col: data[i] for i, col in enumerate(columns)}, copy=False)
+
+
+#: the stats of a backtest without transactions
+NO_TRANSACTIONS = {
+    "transactions": 0, "wins": 0, "losses": 0, "profit": 0.0, "success_rate": 0.0,
+    "profit_increase": 0.0, "max_drawdown": 0.0,
+}
+
+
+def _evaluate(strat_config: dict[str, any], market: str, quantity: float, window: int,
+              frame_index: int, trigger_params: list[dict[str, any]], rows: tuple[int, int] = None) -> list[dict[str, any]]:
+    """
+    Backtests the strategy with every trigger parameter set on a shared indicator frame
+
+    Args:
+        rows (tuple[int, int]=None): the start and stop row of the frame to backtest on; the whole frame if ``None``
+
+    """
+    candles = _FRAMES[frame_index]
+    if rows is not None:
+        candles = candles.iloc[rows[0]:rows[1]]
+    close = candles["close"].to_numpy()
+
+    results = []
+    for params in trigger_params:
+        cfg = dict(strat_config, trigger_params=params)
+        strat = getattr(strategy, cfg["name"])(None, cfg, market)
+        orders = strat.generate_signals(candles, window)
+
+        result = bots.backtestbot.calc_transactions(close, orders, quantity)
+        stats = bots.backtestbot.backtest_stats(result) if result is not None else NO_TRANSACTIONS
+        results.append({"ta_params": cfg["ta_params"], "trigger_params": params, **stats})
+    return results
+
+
+def rank(results: list[dict[str, any]]) -> list[dict[str, any]]:
+    """
+    Sorts backtest results best first: by profit, then success rate, then the smallest drawdown
+
+    """
+    return sorted(results, key=lambda res: (-res["profit"], -res["success_rate"], res["max_drawdown"]))
+
+
+def share_frames(frames: list[pd.DataFrame]) -> tuple[list[tuple[str, tuple[int, int], list[str]]], list[shared_memory.SharedMemory]]:
+    """
+    Copies the numeric columns of indicator frames into shared memory blocks, one contiguous float64 row per column
+
+    Args:
+        frames (list[pandas.DataFrame]): the frames
+
+    Returns:
+        tuple[list[tuple[str, tuple[int, int], list[str]]], list[multiprocessing.shared_memory.SharedMemory]]: the
+        arguments of the worker initializer and the blocks, which have to be released with ``release_frames``
+
+    """
+    blocks = []
+    shms = []
+    try:
+        for frame in frames:
+            frame = frame.select_dtypes("number")
+            shm = shared_memory.SharedMemory(create=True, size=max(frame.size, 1) * 8)
+            shms.append(shm)
+            data = np.ndarray((len(frame.columns), len(frame.index)), dtype=np.float64, buffer=shm.buf)
+            data[:] = frame.to_numpy(dtype=np.float64).T
+            blocks.append((shm.name, data.shape, list(frame.columns)))
+    except BaseException:
+        release_frames(shms)
+        raise
+    return blocks, shms
+
+
+def release_frames(shms: list[shared_memory.SharedMemory]):
+    for shm in shms:
+        shm.close()
+        shm.unlink()
+
+
+class Optimizer:
+    """
+    Searches the ``trigger_params`` (and optionally ``ta_params``) of a backtest bot for the most profitable
+    combination. The candles are downloaded once and the indicators are computed once per distinct ``ta_params``
+    set. The indicator frames are placed in shared memory, from which a pool of worker processes evaluates the
+    trigger combinations with the vectorized signal path of the strategy.
+
+    The grid is defined in the ``optimize`` section of the bot config:
+
+    ::
+
+        optimize:
+          ta_params: # optional, defaults to the ta_params of the strategy
+            rsi:
+              window: [14, 21]
+          trigger_params:
+            rsi_buy: [5, 10, 15, 20]
+            rsi_sell: [70, 80]
+
+    Trigger parameters missing in the grid are taken from the strategy config.
+
+    Attributes:
+        bot (bots.BacktestBot): the bot whose strategy is optimized
+
+    Args:
+        name (str): the name of the bot
+        config (dict[str, any]): the bot config, with ``backtest`` and ``optimize`` sections
+        max_workers (int=None): the number of worker processes; all cores if ``None``
+
+    """
+    def __init__(self, name: str, config: dict[str, any], max_workers: int = None):
+        if "optimize" not in config:
+            raise ValueError(f"{name} has no optimize section")
+
+        self.bot = bots.BacktestBot(name, config)
+        if type(self.bot.strat).signal_masks is strategy.TradingStrategyInterface.signal_masks:
+            raise ValueError(f"{config['strat']['name']} has no vectorized signal path and can not be optimized")
+        self.config = config
+        self.max_workers = max_workers or os.cpu_count()
+
+    def grid(self) -> tuple[list[dict[str, any]], list[dict[str, any]]]:
+        return parameter_grid(self.config)
+
+    def run(self) -> list[dict[str, any]]:
+        """
+        Evaluates the whole grid
+
+        Returns:
+            list[dict[str, any]]: the ``ta_params``, ``trigger_params`` and ``backtest_stats`` of every combination,
+            best first: by profit, then success rate, then the smallest drawdown
+
+        Raises:
+            services.HistoryGapError: if parts of the backtest timeframe are not available
+
+        """
+        backtest_cfg = self.config["backtest"]
+        candles = self.bot.service.get_history_data(self.config["market"], services.CandleInterval.MINUTE_1,
+                                                    backtest_cfg["start"], backtest_cfg["end"])
+
+        ta_grid, trigger_grid = self.grid()
+        blocks, shms = share_frames(self.bot.apply_tas_grid(candles, ta_grid))
+        try:
+            # a few chunks per worker keep them busy without sending every combination on its own
+            chunk_size = max(1, len(trigger_grid) // (self.max_workers * 4))
+            results = []
+            with ProcessPoolExecutor(max_workers=self.max_workers, initializer=_attach, initargs=(blocks,)) as executor:
+                futures = []
+                for index, ta_params in enumerate(ta_grid):
+                    strat_cfg = dict(copy.deepcopy(self.config["strat"]), ta_params=ta_params)
+                    for start in range(0, len(trigger_grid), chunk_size):
+                        futures.append(executor.submit(_evaluate, strat_cfg, self.config["market"], self.config["quantity"],
+                                                       self.bot.WINDOW, index, trigger_grid[start:start + chunk_size]))
+
+                services.printProgressBar(0, len(futures), f"{'Optimizing':<32}")
+                for i, future in enumerate(as_completed(futures), 1):
+                    results.extend(future.result())
+                    services.printProgressBar(i, len(futures), f"{'Optimizing':<32}")
+        finally:
+            release_frames(shms)
+
+        return rank(results)
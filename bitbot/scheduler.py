@@ -0,0 +1,97 @@
+import asyncio
+import heapq
+import time
+
+
+def next_close(now: int, interval: int, settle: int = 0) -> int:
+    """
+    Returns the first time after ``now`` that is ``settle`` nanoseconds after the close of a candle. Candles of an
+    interval start at the multiples of it since epoch, so the boundaries are the same for all markets.
+
+    ::
+
+        >>> next_close(90, 60, 2)  # in seconds for brevity: the candle of 00:01:00 closes at 00:02:00
+        122
+
+    Args:
+        now (int): the time in nanoseconds since epoch
+        interval (int): the candle interval in nanoseconds
+        settle (int=0): the delay after the close in nanoseconds
+
+    Returns:
+        int: the time in nanoseconds since epoch
+
+    """
+    return ((now - settle) // interval + 1) * interval + settle
+
+
+class CandleScheduler:
+    """
+    A timer wheel that wakes the bots of an event loop at their scheduled times, e.g.: just after their candles close.
+    Bots waking at the same time wait in one slot of the wheel, and a single timer of the event loop is armed for the
+    earliest slot. Bots on the same candle interval share their slots, so hundreds of bots cost one timer and one
+    wake-up per candle instead of a sleeping timer each.
+
+    The times are wall clock nanoseconds since epoch, like the start times of the candles; the timer of the event
+    loop runs on its monotonic clock and is re-armed if the wall clock has not reached the slot yet.
+
+    Args:
+        clock (callable=time.time_ns): the wall clock in nanoseconds since epoch
+
+    """
+    def __init__(self, clock: callable = time.time_ns):
+        self.clock = clock
+        self._slots = {}
+        self._due = []
+        self._timer = None
+        self._timer_due = None
+        self._loop = None
+
+    def __len__(self) -> int:
+        """
+        The number of slots bots are waiting in
+
+        """
+        return len(self._due)
+
+    async def sleep_until(self, due: int):
+        """
+        Sleeps until the wall clock reaches ``due``
+
+        Args:
+            due (int): the time to wake up in nanoseconds since epoch
+
+        """
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # a new event loop, the timer of the previous one never fires
+            self._slots, self._due, self._timer, self._loop = {}, [], None, loop
+        if due <= self.clock():
+            return
+
+        future = loop.create_future()
+        if due not in self._slots:
+            self._slots[due] = []
+            heapq.heappush(self._due, due)
+        self._slots[due].append(future)
+        self._arm()
+        await future
+
+    def _arm(self):
+        if self._timer is not None:
+            if self._timer_due <= self._due[0]:
+                return
+            self._timer.cancel()
+        self._timer_due = self._due[0]
+        self._timer = self._loop.call_later(max(0, self._timer_due - self.clock()) / 1e9, self._fire)
+
+    def _fire(self):
+        self._timer = None
+        now = self.clock()
+        while self._due and self._due[0] <= now:
+            for future in self._slots.pop(heapq.heappop(self._due)):
+                # cancelled bots leave their futures behind
+                if not future.done():
+                    future.set_result(None)
+        if self._due:
+            self._arm()
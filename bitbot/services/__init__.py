@@ -1,2 +1,15 @@
-from .service import ServiceInterface, Order, OrderDirection, OrderType, CandleInterval, TimeInForce, now_milliseconds, date_time_milliseconds, printProgressBar
-from .bittrex import BitTrex
\ No newline at end of file
+from .service import ServiceInterface, Order, OrderDirection, OrderType, CandleInterval, TimeInForce, now_milliseconds, date_time_milliseconds, printProgressBar, HistoryGapError, ApiError, RateLimiter, load_secrets
+from .candlestore import CandleStore
+from .decoder import decode_candles
+from .candlewindow import CandleWindow
+from .feed import MarketFeed
+from .orders import OrderPipeline, Submission
+from .simulated import SimulatedExchange
+
+
+def __getattr__(name: str):
+    # the http client of BitTrex is only imported by processes that use it
+    if name == "BitTrex":
+        from .bittrex import BitTrex
+        return BitTrex
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,23 +1,138 @@
+import functools
 import hashlib
 import datetime as dt
 import hmac
 import json
 import logging
+import re
 from os import terminal_size
+import threading
 import time
 from time import strftime
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import requests
-from bitbot import services
+from requests.adapters import HTTPAdapter
+from bitbot import metrics, services
+import numpy as np
 import pandas as pd
 
 from bitbot.services.service import CandleInterval
+from bitbot.services.candlestore import to_timestamp
 
 BITTREX_URL = "https://api.bittrex.com/v3"
+# content hash of requests without body
+EMPTY_CONTENT_HASH = hashlib.sha512(b"").hexdigest()
+RETRY_STATUS = (429, 500, 502, 503, 504)
+# requests that can be sent again without side effects; orders are retried by the ``OrderPipeline``
+IDEMPOTENT_METHODS = ("GET", "HEAD", "PUT", "DELETE", "OPTIONS")
+
+# path segments that vary between requests of the same endpoint
+ENDPOINT_PATTERNS = [
+    (re.compile(r"^/(markets|balances)/[^/]+"), r"/\1/{symbol}"),
+    (re.compile(r"/candles/[^/]+/"), "/candles/{interval}/"),
+    (re.compile(r"/historical/.*$"), "/historical/{date}"),
+    (re.compile(r"^/orders/(?!open$|closed$)[^/]+"), "/orders/{id}"),
+]
+
+
+@functools.lru_cache(maxsize=1024)
+def endpoint(method: str, url: str) -> str:
+    """
+    Returns the endpoint of a request, e.g.: ``"GET /markets/{symbol}/ticker"``, to label its metrics with
+
+    """
+    path = url[len(BITTREX_URL):] if url.startswith(BITTREX_URL) else url
+    for pattern, repl in ENDPOINT_PATTERNS:
+        path = pattern.sub(repl, path)
+    return f"{method} {path}"
+
+
+@functools.lru_cache(maxsize=1)
+def timestamp_dtype() -> np.dtype:
+    """
+    Returns the dtype pandas parses the timestamps of the api into; its resolution differs between pandas versions
+
+    """
+    return pd.to_datetime(pd.Series(["2021-01-01T00:00:00Z"]), format="%Y-%m-%dT%H:%M:%SZ").dtype
+
+
+def candle_columns(candles: list[dict[str, str]]) -> dict[str, np.ndarray]:
+    """
+    Converts candles in the format of the api into the columns of a ``CandleWindow``
+
+    """
+    out = {"startsat": np.array([c["startsAt"][:-1] for c in candles], dtype="datetime64[ns]").view(np.int64)}
+    for col in ["open", "high", "low", "close", "volume", "quoteVolume"]:
+        out[col.lower()] = np.array([c[col] for c in candles], dtype=np.float64)
+    return out
 
 
 class BitTrex(services.ServiceInterface):
-    def __init__(self):
+    """
+    Service implementation of the BitTrex v3 api. All requests go through one pooled keep-alive session. Failed
+    idempotent requests are retried on connection errors, timeouts, ``429`` and ``5xx`` responses with an exponential
+    backoff, or after the ``Retry-After`` of the response; every attempt is signed anew and waits for the rate limit.
+
+    Args:
+        candle_store (services.CandleStore=None): the store history candles are cached in. Defaults to ``./candles``
+        max_workers (int=8): the number of history chunks downloaded in parallel
+        requests_per_second (float=10): the maximum number of api requests per second; ``None`` disables the limit
+        pool_size (int=10): the number of keep-alive connections kept open
+        timeout (float or tuple[float, float]=10): the connect and read timeout of a request in seconds
+        retries (int=3): the maximum number of retries of a failed request
+        backoff_factor (float=0.5): the backoff between retries, ``backoff_factor * 2**(retry - 1)`` seconds
+        stream_url (str=None): the SignalR endpoint of the market data ``stream``; the one of BitTrex if ``None``
+
+    """
+    def __init__(self, candle_store: services.CandleStore = None, max_workers: int = 8, requests_per_second: float = 10,
+                 pool_size: int = 10, timeout: float or tuple[float, float] = 10, retries: int = 3, backoff_factor: float = 0.5,
+                 stream_url: str = None):
         super().__init__("bittrex")
+        self.candle_store = candle_store if candle_store is not None else services.CandleStore()
+        self.max_workers = max_workers
+        self.rate_limiter = services.RateLimiter(requests_per_second)
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(pool_size, max_workers))
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Content-Type": "application/json", "Api-Key": self._api_key})
+
+        # the key schedule is computed once, every signature continues from a copy
+        self._hmac = hmac.new(self._api_secret.encode(), digestmod=hashlib.sha512)
+
+        self.stream_url = stream_url
+        self._stream = None
+        self._stream_lock = threading.Lock()
+
+    @property
+    def stream(self) -> "BitTrexStream":
+        """
+        services.bittrex_stream.BitTrexStream: the websocket market data stream of the service, started on first access
+        """
+        with self._stream_lock:
+            if self._stream is None:
+                # websockets is only needed by bots that stream their market data
+                from bitbot.services.bittrex_stream import BitTrexStream, STREAM_URL
+
+                self._stream = BitTrexStream(self, self.stream_url or STREAM_URL)
+                self._stream.start()
+            return self._stream
+
+    def sign(self, timestamp: str, url: str, method: str, content_hash: str) -> str:
+        """
+        Method to create the ``Api-Signature`` of a request
+
+        Returns:
+            str: the hex encoded HMAC-SHA512 of the request
+
+        """
+        sign = self._hmac.copy()
+        sign.update(f"{timestamp}{url}{method}{content_hash}".encode())
+        return sign.hexdigest()
 
     def api_request(
         self,
@@ -25,9 +140,28 @@ class BitTrex(services.ServiceInterface):
         method: str = None,
         params: dict = None,
         body: dict[str, any] or str or list[any]  = None,
-        headers: dict[str, str] = None):
+        headers: dict[str, str] = None,
+        raw: bool = False):
+        """
+        Method to send a signed request to the api
+
+        Args:
+            url (str): the path of the endpoint or its full url
+            method (str=None): the http method; ``"GET"`` if ``None``
+            params (dict=None): the query parameters
+            body (dict[str, any] or str or list[any]=None): the body, serialized to JSON unless it is a string
+            headers (dict[str, str]=None): headers in addition to the authentication headers
+            raw (bool=False): return the undecoded body, e.g.: for ``services.decode_candles``
+
+        Returns:
+            any: the decoded JSON response, or its bytes if ``raw``
 
-        if not isinstance(body, str):
+        Raises:
+            services.ApiError: if the response is not successful
+
+        """
+
+        if body is not None and not isinstance(body, str):
             body = json.dumps(body, separators=(',',':'))
 
         if method is None:
@@ -36,38 +170,67 @@ class BitTrex(services.ServiceInterface):
         # build full api uri
         if not url.startswith("http"):
             url = f"{BITTREX_URL}/{url[1:] if url.startswith('/') else url}"
-        
-        default_headers =  {
-            "Content-Type": "application/json",
-            "Api-Key": self._api_key,
-            # UNIX timestamp, in epoch-millisecond format
-            "Api-Timestamp": str(services.now_milliseconds()),
-            "Api-Content-Hash": hashlib.sha512(body.encode("latin1") if body else "".encode()).hexdigest(),
-        }
-
-
-        # create request signature
-        signature = [
-            default_headers["Api-Timestamp"],
-            url,
-            str(method), 
-            default_headers["Api-Content-Hash"]
-            ]
-        signature = "".join(signature)
-        # encode signature
-        sign = hmac.new(self._api_secret.encode(), signature.encode(), hashlib.sha512).hexdigest()
-
-        default_headers["Api-Signature"] = sign
-
-        # add custom headers
-        if headers is not None:
-            default_headers.update(headers)
-
-        r = requests.request(method, url, params=params, data=body, headers=default_headers)
-
-        if 200 <= r.status_code < 300:
-            return r.json()
-        raise Exception(f"Error {r.status_code}: {r.text}")
+
+        content_hash = hashlib.sha512(body.encode("latin1")).hexdigest() if body else EMPTY_CONTENT_HASH
+        labels = {"service": self.service_name, "endpoint": endpoint(method, url)}
+        retries = self.retries if method in IDEMPOTENT_METHODS else 0
+
+        with metrics.REGISTRY.histogram("bitbot_api_request_seconds", "Seconds per api request, retries included",
+                                        **labels).time():
+            for attempt in range(retries + 1):
+                # signed for every attempt, the api rejects outdated timestamps
+                timestamp = str(services.now_milliseconds())
+                default_headers = {
+                    "Api-Timestamp": timestamp,
+                    "Api-Content-Hash": content_hash,
+                    "Api-Signature": self.sign(timestamp, url, method, content_hash),
+                }
+
+                # add custom headers
+                if headers is not None:
+                    default_headers.update(headers)
+
+                self.rate_limiter.wait()
+                try:
+                    r = self.session.request(method, url, params=params, data=body, headers=default_headers,
+                                             timeout=self.timeout)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    if attempt == retries:
+                        metrics.REGISTRY.counter("bitbot_api_errors_total", "Failed api requests",
+                                                 status=e.__class__.__name__, **labels).inc()
+                        raise
+                    reason = e.__class__.__name__
+                    delay = self.backoff(attempt)
+                except requests.RequestException as e:
+                    metrics.REGISTRY.counter("bitbot_api_errors_total", "Failed api requests",
+                                             status=e.__class__.__name__, **labels).inc()
+                    raise
+                else:
+                    if 200 <= r.status_code < 300:
+                        return r.content if raw else r.json()
+                    if r.status_code not in RETRY_STATUS or attempt == retries:
+                        metrics.REGISTRY.counter("bitbot_api_errors_total", "Failed api requests",
+                                                 status=str(r.status_code), **labels).inc()
+                        raise services.ApiError(r.status_code, r.text)
+                    reason = str(r.status_code)
+                    delay = self.backoff(attempt, r.headers.get("Retry-After"))
+
+                metrics.REGISTRY.counter("bitbot_api_retries_total", "Retried api requests", **labels).inc()
+                logging.warning(f"* {self.service_name}: {method} {url}: {reason}; retrying in {delay:.2f} s")
+                time.sleep(delay)
+
+    def backoff(self, attempt: int, retry_after: str = None) -> float:
+        """
+        Method to get the seconds to wait before the retry of a failed request: the ``Retry-After`` of the response
+        if it has one in seconds, ``backoff_factor * 2**attempt`` otherwise
+
+        """
+        if retry_after is not None:
+            try:
+                return max(0.0, float(retry_after))
+            except ValueError:
+                pass
+        return self.backoff_factor * 2 ** attempt
     
     #### Account
 
@@ -94,63 +257,100 @@ class BitTrex(services.ServiceInterface):
     #### Orders
     
     def place_order(self, order: services.Order) -> list[dict[str, str]]:
-        return self.api_request("/orders", "POST", body=str(order))
+        return self.api_request("/orders", "POST", body=order.body)
+
+    def find_order(self, order: services.Order) -> dict[str, str] or None:
+        for state in ["open", "closed"]:
+            for placed in self.api_request(f"/orders/{state}", params={"marketSymbol": order.market}):
+                if placed.get("clientOrderId") == order.client_order_id:
+                    return placed
+        return None
     
     #### candles
 
     def get_candles(self, market: str, candleinterval: services.CandleInterval) -> pd.DataFrame:
-        response = self.api_request(f"/markets/{market}/candles/{candleinterval.value}/recent")
-        # build dataframe
-        df = pd.DataFrame(response, columns=list(response[0].keys()))
-
-        # time conversion
-        df["startsAt"] = pd.to_datetime(df["startsAt"], format="%Y-%m-%dT%H:%M:%SZ")
-        # float conversion; values are strings by default
-        for val in ["open", "close", "high", "low", "volume", "quoteVolume"]:
-            df[val] = pd.to_numeric(df[val], downcast="float")
-        df = df.rename({"startsAt": "time"})
+        candles = services.decode_candles(self.api_request(f"/markets/{market}/candles/{candleinterval.value}/recent", raw=True))
+        # keep the downcast of the api values
+        df = pd.DataFrame({col: pd.to_numeric(candles[col], downcast="float") for col in services.CandleStore.COLUMNS})
+        df.insert(0, services.CandleStore.TIME, candles[services.CandleStore.TIME].view("datetime64[ns]").astype(timestamp_dtype()))
         return df.rename(str.lower, axis='columns')
-    
+
+    def get_recent_candles(self, market: str, candleinterval: services.CandleInterval, since: int = None) -> dict[str, np.ndarray]:
+        # the response is chronological, so only the new tail is converted
+        candles = services.decode_candles(self.api_request(f"/markets/{market}/candles/{candleinterval.value}/recent", raw=True), since)
+        return {col.lower(): values for col, values in candles.items()}
+
     #### market history
     
     def get_history_data(self, market: str, candleinterval: services.CandleInterval, start: dt.datetime, end: dt.datetime) -> pd.DataFrame:
+        """
+        Method to get the candles starting in ``[start, end)``. Candles of past days are read from the ``candle_store``;
+        only the days missing in it are downloaded, in parallel on ``max_workers`` threads, and stored afterwards.
+
+        Args:
+            market (str): the market name, e.g.: ``"BTC-EUR"``
+            candleinterval (services.CandleInterval): the interval of the candles
+            start (datetime.datetime or datetime.date): the start of the time range
+            end (datetime.datetime or datetime.date): the end of the time range, exclusive
+
+        Returns:
+            pandas.DataFrame
+
+        Raises:
+            services.HistoryGapError: if the data of any day is not available
+
+        """
         interval_days = 1
         if candleinterval == services.CandleInterval.HOUR_1:
             interval_days = 31
         elif candleinterval == services.CandleInterval.DAY_1:
             interval_days = 366
 
+        days = []
+        next_start = to_timestamp(start).date()
+        while to_timestamp(next_start) < to_timestamp(end):
+            days.append(next_start)
+            next_start += dt.timedelta(days=interval_days)
 
-        if self.determine_candle_interval(end - start) == candleinterval:
-            url = f"markets/{market}/candles/{candleinterval.value}/historical/{start.strftime('%Y')}/{start.strftime('%m')}/{start.strftime('%d')}"
-            df = pd.DataFrame(self.api_request(url))
-            df["startsAt"] = pd.to_datetime(df["startsAt"])
-        else:
-            next_start = start
-            
-            df = pd.DataFrame()
-
-            max_iterations = int((end - start).days)
-            i = 0
-            services.printProgressBar(i, max_iterations, f"{'Downloading history':<32}")
-            while next_start < end:
-                url = f"markets/{market}/candles/{candleinterval.value}/historical/{next_start.strftime('%Y')}/{next_start.strftime('%m')}/{next_start.strftime('%d')}"
-                new_df = pd.DataFrame(self.api_request(url))
-                if new_df.empty:
-                    print(f"\n### ERROR: Data in time {next_start.strftime('%Y-%m-%d %H:%M:%S') + ' - ' + (next_start + dt.timedelta(days=interval_days)).strftime('%Y-%m-%d %H:%M:%S')} not available")
-                    return
-                
-                df = df.append(new_df, ignore_index=True)
-                df["startsAt"] = pd.to_datetime(df["startsAt"], utc=True)
-                next_start += dt.timedelta(days=interval_days)
-                # to prevent to DOS the server, or get an error because too many requests
-                # time.sleep(0.1)
-                i += 1
-                services.printProgressBar(i, max_iterations, f"{'Downloading history':<32}")
-        
-        df = df[df["startsAt"] < end.isoformat()]
-        df = df.rename({"startsAt": "time"})
-        # float conversion; values are strings by default
+        chunks = {}
+        for day in days:
+            chunk = self.candle_store.load_day(self.service_name, market, candleinterval, day, mmap=True)
+            if chunk is not None:
+                chunks[day] = chunk
+
+        missing = [day for day in days if day not in chunks]
+        today = dt.datetime.utcnow().date()
+
+        def download(day: dt.date) -> dict or None:
+            url = f"markets/{market}/candles/{candleinterval.value}/historical/{day.strftime('%Y')}/{day.strftime('%m')}/{day.strftime('%d')}"
+            chunk = services.decode_candles(self.api_request(url, raw=True))
+            if not len(chunk[services.CandleStore.TIME]):
+                return None
+
+            # only days that are over are complete
+            if day + dt.timedelta(days=interval_days) <= today:
+                self.candle_store.save_day(self.service_name, market, candleinterval, day, chunk)
+            return chunk
+
+        if missing:
+            show_progress = len(missing) > 1
+            if show_progress:
+                services.printProgressBar(0, len(missing), f"{'Downloading history':<32}")
+
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = {executor.submit(download, day): day for day in missing}
+                for i, future in enumerate(as_completed(futures), 1):
+                    chunks[futures[future]] = future.result()
+                    if show_progress:
+                        services.printProgressBar(i, len(missing), f"{'Downloading history':<32}")
+
+        gaps = [(day, day + dt.timedelta(days=interval_days)) for day in days if chunks[day] is None]
+        if gaps:
+            raise services.HistoryGapError(market, gaps)
+
+        candles = services.CandleStore.concat([chunks[day] for day in days])
+        df = services.CandleStore.to_frame(services.CandleStore.slice(candles, start, end))
+        # float conversion; keep the downcast of the api values
         for val in ["open", "close", "high", "low", "volume", "quoteVolume"]:
             df[val] = pd.to_numeric(df[val], downcast="float")
         return df.rename(str.lower, axis='columns')
@@ -0,0 +1,563 @@
+import asyncio
+import base64
+import json
+import logging
+import threading
+import time
+import zlib
+from http import HTTPStatus
+from urllib.parse import urlencode, urlsplit
+import numpy as np
+import requests
+from websockets.asyncio.client import connect
+from websockets.asyncio.server import serve
+from websockets.exceptions import ConnectionClosed, InvalidHandshake
+
+from bitbot.services.service import CandleInterval
+from bitbot.services.candlewindow import CandleWindow
+from bitbot.services.bittrex import candle_columns
+
+STREAM_URL = "https://socket-v3.bittrex.com/signalr"
+HUB = "c3"
+CLIENT_PROTOCOL = "1.5"
+CONNECTION_DATA = json.dumps([{"name": HUB}])
+
+
+def decode_message(data: str) -> any:
+    """
+    Decodes the argument of a stream message: base64 encoded, raw deflate compressed JSON
+
+    """
+    return json.loads(zlib.decompress(base64.b64decode(data), -zlib.MAX_WBITS))
+
+
+def encode_message(obj: any) -> str:
+    """
+    Encodes the argument of a stream message, the inverse of ``decode_message``
+
+    """
+    compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    return base64.b64encode(compressor.compress(json.dumps(obj).encode()) + compressor.flush()).decode()
+
+
+def start_time(candle: dict[str, str]) -> int:
+    """
+    Returns the start time of a candle in the format of the api in nanoseconds since epoch
+
+    """
+    return int(np.datetime64(candle["startsAt"][:-1], "ns").astype(np.int64))
+
+
+class BitTrexStream:
+    """
+    Push based market data of the BitTrex v3 websocket api. Subscribes to the ticker and candle streams of the
+    subscribed markets and keeps their latest ticker and closed candles in memory, so bots neither have to poll
+    the REST api nor wait for the next poll to see a closed candle.
+
+    A candle is closed by a timer at the end of its interval, without waiting for the first update of the next
+    candle, which may come much later in quiet markets. Updates of the candle that arrive after its close, and
+    the candle of the REST api on the next backfill, replace its values in the window.
+
+    The stream runs its own event loop in a background thread. If the connection drops or a candle update is
+    missed, it reconnects with an exponential backoff and backfills the candles it missed through the REST api
+    of the service.
+
+    ::
+
+        >>> stream = BitTrexStream(service)
+        >>> stream.start()
+        >>> stream.subscribe("BTC-EUR", CandleInterval.MINUTE_1)
+        >>> stream.wait_for_candle("BTC-EUR", CandleInterval.MINUTE_1, since=None, timeout=60)
+        >>> await stream.wait_for_candle_async("BTC-EUR", CandleInterval.MINUTE_1, since=None, timeout=60)
+        >>> ticker, candles = stream.read_since("BTC-EUR", CandleInterval.MINUTE_1, since=None)
+
+    Attributes:
+        service (services.BitTrex): the service used to backfill candles
+        url (str): the url of the SignalR endpoint
+        connected (threading.Event): set while the stream is connected and subscribed
+        reconnects (int): the number of reconnects
+
+    Args:
+        service (services.BitTrex): the service used to backfill candles
+        url (str=STREAM_URL): the url of the SignalR endpoint
+        capacity (int=1440): the number of closed candles kept per market and interval
+        max_backoff (float=60): the maximum seconds between two connection attempts
+
+    """
+    def __init__(self, service: any, url: str = STREAM_URL, capacity: int = 1440, max_backoff: float = 60):
+        self.service = service
+        self.url = url.rstrip("/")
+        self.capacity = capacity
+        self.max_backoff = max_backoff
+
+        self.tickers = {}
+        self.windows = {}
+        # the latest update of the candle that is still open, by market and interval
+        self._open = {}
+        # the timers closing the open candles and the start times of the candles they closed without final values
+        self._close_timers = {}
+        self._provisional = {}
+        self._sequences = {}
+        self._markets = set()
+
+        self.connected = threading.Event()
+        self.reconnects = 0
+        self._changed = threading.Condition()
+        # the futures of ``wait_for_candle_async`` with their event loops and conditions
+        self._waiters = {}
+        self._invocation = 0
+        self._ws = None
+        self._loop = None
+        self._task = None
+        self._thread = None
+
+    #### subscriptions
+
+    def channels(self) -> list[str]:
+        with self._changed:
+            return [f"ticker_{market}" for market in sorted(self._markets)] + \
+                   [f"candle_{market}_{interval.value}" for market, interval in self.windows]
+
+    def subscribe(self, market: str, candleinterval: CandleInterval):
+        """
+        Method to subscribe to the ticker and the candles of a market. The candle window is backfilled through the
+        REST api first. Subscribing twice does nothing.
+
+        Args:
+            market (str): the market name, e.g.: ``"BTC-EUR"``
+            candleinterval (CandleInterval): the interval of the candles
+
+        """
+        key = (market, candleinterval)
+        with self._changed:
+            if key in self.windows:
+                return
+            self.windows[key] = CandleWindow(self.capacity)
+            self._markets.add(market)
+        self.backfill(key)
+
+        if self.connected.is_set():
+            channels = [f"ticker_{market}", f"candle_{market}_{candleinterval.value}"]
+            asyncio.run_coroutine_threadsafe(self._invoke("Subscribe", [channels]), self._loop)
+
+    def backfill(self, key: tuple[str, CandleInterval]):
+        """
+        Method to append the closed candles missing in a candle window from the REST api
+
+        """
+        market, candleinterval = key
+        window = self.windows[key]
+        with self._changed:
+            provisional = self._provisional.get(key)
+        # a candle closed by the timer is requested again for its final values
+        since = window.last if provisional is None else provisional - 1
+        candles = self.service.get_recent_candles(market, candleinterval, since=since)
+        closed_before = time.time_ns() - int(candleinterval.timedelta.total_seconds() * 1e9) + 1
+        with self._changed:
+            if window.last is not None and window.last < closed_before and window.amend(candles):
+                if self._provisional.get(key) == window.last:
+                    del self._provisional[key]
+            if window.append(candles, closed_before):
+                self._notify()
+
+    def _notify(self):
+        """
+        Wakes the threads and coroutines waiting for a candle; called with ``_changed`` held
+
+        """
+        self._changed.notify_all()
+        for future, (loop, ready) in list(self._waiters.items()):
+            if ready():
+                del self._waiters[future]
+                try:
+                    loop.call_soon_threadsafe(_resolve, future)
+                except RuntimeError:
+                    # the event loop of the waiter is closed
+                    pass
+
+    #### reading
+
+    def read_since(self, market: str, candleinterval: CandleInterval, since: int = None) -> tuple[dict[str, str], dict[str, np.ndarray]]:
+        """
+        Returns the latest ticker and a copy of only the closed candles that started after ``since``
+
+        Args:
+            market (str): the market name, e.g.: ``"BTC-EUR"``
+            candleinterval (CandleInterval): the interval of the candles
+            since (int=None): the start time of the newest known candle in nanoseconds since epoch; all candles if ``None``
+
+        Returns:
+            tuple[dict[str, str], dict[str, numpy.ndarray]]: the ticker as ``ServiceInterface.get_market_ticker`` returns
+            it and the candles as ``ServiceInterface.get_recent_candles`` returns them
+
+        """
+        with self._changed:
+            window = self.windows[(market, candleinterval)]
+            times = window["startsat"]
+            start = 0 if since is None else int(np.searchsorted(times, since, side="right"))
+            candles = {col: window[col][start:].copy() for col in (CandleWindow.TIME,) + CandleWindow.COLUMNS}
+            return self.tickers.get(market), candles
+
+    def wait_for_candle(self, market: str, candleinterval: CandleInterval, since: int = None, timeout: float = None) -> bool:
+        """
+        Method to block until a candle newer than ``since`` has closed
+
+        Returns:
+            bool: ``False`` if the timeout expired first
+
+        """
+        window = self.windows[(market, candleinterval)]
+        with self._changed:
+            return self._changed.wait_for(lambda: window.last is not None and (since is None or window.last > since), timeout)
+
+    async def wait_for_candle_async(self, market: str, candleinterval: CandleInterval, since: int = None, timeout: float = None) -> bool:
+        """
+        Coroutine counterpart of ``wait_for_candle``. The stream wakes the event loop of the caller through
+        ``call_soon_threadsafe`` when the candle has closed, so no thread is blocked while waiting, and cancelling
+        the caller leaves nothing behind.
+
+        Returns:
+            bool: ``False`` if the timeout expired first
+
+        """
+        window = self.windows[(market, candleinterval)]
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def ready():
+            return window.last is not None and (since is None or window.last > since)
+
+        with self._changed:
+            if ready():
+                return True
+            self._waiters[future] = (loop, ready)
+        try:
+            await asyncio.wait_for(future, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            with self._changed:
+                self._waiters.pop(future, None)
+
+    #### connection
+
+    def start(self):
+        """
+        Starts the event loop of the stream in a background thread
+
+        """
+        if self._thread is not None:
+            return
+        self._loop = asyncio.new_event_loop()
+        self._task = self._loop.create_task(self._run())
+        self._thread = threading.Thread(target=self._main, name="bitbot-bittrex-stream", daemon=True)
+        self._thread.start()
+
+    def _main(self):
+        try:
+            self._loop.run_until_complete(self._task)
+        except asyncio.CancelledError:
+            pass
+
+    def stop(self):
+        """
+        Closes the connection and stops the background thread
+
+        """
+        if self._thread is None:
+            return
+        self._loop.call_soon_threadsafe(self._task.cancel)
+        self._thread.join()
+        self._loop.close()
+        self._thread = None
+        self._loop = None
+
+    def _negotiate(self) -> dict[str, any]:
+        res = requests.get(f"{self.url}/negotiate", timeout=10,
+                           params={"clientProtocol": CLIENT_PROTOCOL, "connectionData": CONNECTION_DATA})
+        res.raise_for_status()
+        return res.json()
+
+    def _start(self, token: str):
+        res = requests.get(f"{self.url}/start", timeout=10,
+                           params={"transport": "webSockets", "clientProtocol": CLIENT_PROTOCOL,
+                                   "connectionToken": token, "connectionData": CONNECTION_DATA})
+        res.raise_for_status()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        backoff = 1
+        while True:
+            try:
+                negotiation = await loop.run_in_executor(None, self._negotiate)
+                token = negotiation["ConnectionToken"]
+                # without any message for this long the connection is considered dead
+                timeout = float(negotiation.get("DisconnectTimeout") or 30)
+
+                ws_url = self.url.replace("https://", "wss://", 1).replace("http://", "ws://", 1)
+                query = urlencode({"transport": "webSockets", "clientProtocol": CLIENT_PROTOCOL,
+                                   "connectionToken": token, "connectionData": CONNECTION_DATA})
+                async with connect(f"{ws_url}/connect?{query}", max_size=None) as ws:
+                    self._ws = ws
+                    await loop.run_in_executor(None, self._start, token)
+                    if self.channels():
+                        await self._invoke("Subscribe", [self.channels()])
+                    # candles that closed while the stream was disconnected
+                    self._open.clear()
+                    for timer in self._close_timers.values():
+                        timer.cancel()
+                    self._close_timers.clear()
+                    self._sequences.clear()
+                    for key in list(self.windows):
+                        await loop.run_in_executor(None, self.backfill, key)
+                    self.connected.set()
+                    backoff = 1
+
+                    while True:
+                        raw = await asyncio.wait_for(ws.recv(), timeout)
+                        missed = self._handle(raw)
+                        for key in missed:
+                            await loop.run_in_executor(None, self.backfill, key)
+            except (OSError, ConnectionClosed, InvalidHandshake, asyncio.TimeoutError, requests.RequestException,
+                    KeyError, ValueError, zlib.error) as e:
+                logging.warning(f"* BitTrex stream: {e.__class__.__name__}: {str(e)}")
+            finally:
+                self._ws = None
+                self.connected.clear()
+
+            self.reconnects += 1
+            await asyncio.sleep(backoff)
+            backoff = min(2 * backoff, self.max_backoff)
+
+    async def _invoke(self, method: str, args: list[any]):
+        # while disconnected, the subscriptions are renewed on the next connect
+        if self._ws is None:
+            return
+        self._invocation += 1
+        await self._ws.send(json.dumps({"H": HUB, "M": method, "A": args, "I": self._invocation}))
+
+    #### messages
+
+    def _handle(self, raw: str) -> list[tuple[str, CandleInterval]]:
+        """
+        Applies a message of the hub to the market state
+
+        Returns:
+            list[tuple[str, CandleInterval]]: the markets and intervals whose candle sequence has a gap
+
+        """
+        msg = json.loads(raw)
+        if "R" in msg:
+            for result in msg["R"] if isinstance(msg["R"], list) else [msg["R"]]:
+                if isinstance(result, dict) and not result.get("Success", True):
+                    logging.error(f"* BitTrex stream: invocation {msg.get('I')} failed: {result.get('ErrorCode')}")
+            return []
+
+        missed = []
+        for call in msg.get("M", []):
+            if call.get("H", "").lower() != HUB:
+                continue
+            for arg in call.get("A", []):
+                data = decode_message(arg)
+                if call["M"] == "ticker":
+                    with self._changed:
+                        self.tickers[data["symbol"]] = data
+                elif call["M"] == "candle":
+                    key = self._on_candle(data)
+                    if key is not None:
+                        missed.append(key)
+        return missed
+
+    def _on_candle(self, data: dict[str, any]) -> tuple[str, CandleInterval] or None:
+        key = (data["marketSymbol"], CandleInterval(data["interval"]))
+        if key not in self.windows:
+            return None
+
+        sequence = data.get("sequence")
+        previous = self._sequences.get(key)
+        self._sequences[key] = sequence
+        gap = previous is not None and sequence is not None and sequence != previous + 1
+
+        candle = data["delta"]
+        last = self._open.get(key)
+        if last is not None and candle["startsAt"] < last["startsAt"]:
+            return key if gap else None
+        self._open[key] = candle
+        if last is None or last["startsAt"] < candle["startsAt"]:
+            if last is not None:
+                # a new candle started, so the previous one has its final values
+                self._close(key, last, final=True)
+            if key in self._close_timers:
+                self._close_timers[key].cancel()
+            self._arm_close(key, start_time(candle))
+        elif self._provisional.get(key) == start_time(candle):
+            # a late update of the candle the timer has closed
+            self._close(key, candle, final=False)
+        return key if gap else None
+
+    def _arm_close(self, key: tuple[str, CandleInterval], start: int):
+        due = start + int(key[1].timedelta.total_seconds() * 1e9)
+        self._close_timers[key] = asyncio.get_running_loop().call_later(
+            max(0, due - time.time_ns()) / 1e9, self._close_open, key, start)
+
+    def _close_open(self, key: tuple[str, CandleInterval], start: int):
+        """
+        Closes the open candle at the end of its interval, if no update of the next candle has closed it yet
+
+        """
+        # the timer of the event loop runs on its monotonic clock and may fire before the wall clock reaches the end
+        if time.time_ns() < start + int(key[1].timedelta.total_seconds() * 1e9):
+            self._arm_close(key, start)
+            return
+        self._close_timers.pop(key, None)
+        candle = self._open.get(key)
+        if candle is not None and start_time(candle) == start:
+            self._close(key, candle, final=False)
+
+    def _close(self, key: tuple[str, CandleInterval], candle: dict[str, str], final: bool):
+        """
+        Appends a closed candle to its window, or replaces the values of the candle if the timer has appended it
+        already
+
+        Args:
+            final (bool): whether no more updates of the candle are expected
+
+        """
+        columns = candle_columns([candle])
+        start = int(columns[CandleWindow.TIME][0])
+        with self._changed:
+            window = self.windows[key]
+            if window.last == start:
+                window.amend(columns)
+            elif window.append(columns):
+                self._notify()
+            if not final:
+                self._provisional[key] = start
+            elif self._provisional.get(key) == start:
+                del self._provisional[key]
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(True)
+
+
+class StandInServer:
+    """
+    A local stand-in for the BitTrex SignalR endpoint, to develop and test against the stream without the exchange.
+    Implements the negotiate, start and connect requests and the ``Subscribe`` invocation. Messages are published
+    with ``publish_ticker`` and ``publish_candle``; ``drop_connections`` simulates a connection loss.
+
+    ::
+
+        >>> server = StandInServer()
+        >>> server.start()
+        >>> stream = BitTrexStream(service, server.url)
+
+    Args:
+        host (str="127.0.0.1"): the interface to listen on
+        port (int=0): the port to listen on; a free one if ``0``
+
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.connections = {}
+        self.sequences = {}
+        self._server = None
+        self._loop = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/signalr"
+
+    def start(self):
+        started = threading.Event()
+
+        # the plain http requests of negotiate and start are reported as failed websocket handshakes
+        logger = logging.getLogger("bitbot.stand_in")
+        logger.setLevel(logging.CRITICAL)
+
+        async def main():
+            self._server = await serve(self._handler, self.host, self.port, process_request=self._process_request, logger=logger)
+            self.port = self._server.sockets[0].getsockname()[1]
+            started.set()
+            try:
+                await self._server.serve_forever()
+            except asyncio.CancelledError:
+                pass
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_until_complete, args=(main(),), name="bitbot-stand-in", daemon=True)
+        self._thread.start()
+        started.wait()
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._server.close)
+        self._thread.join()
+        self._loop.close()
+
+    def _process_request(self, connection, request):
+        path = urlsplit(request.path).path
+        if path.endswith("/negotiate"):
+            body = {"ConnectionToken": f"token{len(self.connections)}", "KeepAliveTimeout": 20.0, "DisconnectTimeout": 30.0}
+            return connection.respond(HTTPStatus.OK, json.dumps(body))
+        if path.endswith("/start"):
+            return connection.respond(HTTPStatus.OK, json.dumps({"Response": "started"}))
+        return None
+
+    async def _handler(self, ws):
+        channels = set()
+        self.connections[ws] = channels
+        try:
+            await ws.send(json.dumps({"C": "init", "S": 1, "M": []}))
+            async for raw in ws:
+                msg = json.loads(raw)
+                if msg.get("M") == "Subscribe":
+                    channels.update(msg["A"][0])
+                    await ws.send(json.dumps({"R": [{"Success": True, "ErrorCode": None}] * len(msg["A"][0]), "I": str(msg["I"])}))
+        except ConnectionClosed:
+            pass
+        finally:
+            self.connections.pop(ws, None)
+
+    def _publish(self, channel: str, method: str, data: dict[str, any]):
+        msg = json.dumps({"C": "msg", "M": [{"H": HUB, "M": method, "A": [encode_message(data)]}]})
+
+        async def send():
+            for ws, channels in list(self.connections.items()):
+                if channel in channels:
+                    try:
+                        await ws.send(msg)
+                    except ConnectionClosed:
+                        pass
+
+        asyncio.run_coroutine_threadsafe(send(), self._loop).result()
+
+    def publish_ticker(self, market: str, ticker: dict[str, str]):
+        self._publish(f"ticker_{market}", "ticker", dict(ticker, symbol=market))
+
+    def publish_candle(self, market: str, candleinterval: CandleInterval, candle: dict[str, str], skip: int = 0):
+        """
+        Publishes an update of a candle in the format of the api
+
+        Args:
+            skip (int=0): the number of sequence numbers to skip, to simulate missed messages
+
+        """
+        channel = f"candle_{market}_{candleinterval.value}"
+        self.sequences[channel] = self.sequences.get(channel, 0) + 1 + skip
+        self._publish(channel, "candle", {"sequence": self.sequences[channel], "marketSymbol": market,
+                                          "interval": candleinterval.value, "delta": candle})
+
+    def drop_connections(self):
+        async def close():
+            for ws in list(self.connections):
+                await ws.close()
+
+        asyncio.run_coroutine_threadsafe(close(), self._loop).result()
+
+    def subscribed(self, channel: str) -> bool:
+        return any(channel in channels for channels in self.connections.values())
@@ -0,0 +1,168 @@
+import datetime as dt
+import os
+import struct
+import zipfile
+import numpy as np
+import pandas as pd
+
+
+def to_timestamp(date: dt.date or dt.datetime) -> pd.Timestamp:
+    """
+    Converts a date or a (naive) datetime to a UTC timestamp. Naive datetimes are assumed to be UTC, as this is
+    the timezone the services report candles in.
+
+    Args:
+        date (datetime.date or datetime.datetime): the date to convert
+
+    Returns:
+        pandas.Timestamp
+
+    """
+    ts = pd.Timestamp(date)
+    if ts.tzinfo is None:
+        return ts.tz_localize("UTC")
+    return ts.tz_convert("UTC")
+
+
+class CandleStore:
+    """
+    On-disk cache of history candles. Every chunk of candles a service downloads at once is stored in a separate
+    uncompressed ``.npz`` file with one array per column, keyed by service, market, interval and day:
+
+    ::
+
+        <root>/<service>/<market>/<interval>/<YYYY-MM-DD>.npz
+
+    The ``startsAt`` column is stored as int64 epoch nanoseconds, so time ranges can be sliced with a binary search.
+
+    Attributes:
+        root (str): the directory the candles are stored in
+
+    Args:
+        root (str): the directory the candles are stored in
+
+    """
+    TIME = "startsAt"
+    COLUMNS = ["open", "high", "low", "close", "volume", "quoteVolume"]
+
+    def __init__(self, root: str = "./candles"):
+        self.root = root
+
+    def path(self, service: str, market: str, candleinterval, day: dt.date) -> str:
+        return os.path.join(self.root, service, market, candleinterval.value, f"{day.strftime('%Y-%m-%d')}.npz")
+
+    def has_day(self, service: str, market: str, candleinterval, day: dt.date) -> bool:
+        return os.path.isfile(self.path(service, market, candleinterval, day))
+
+    def load_day(self, service: str, market: str, candleinterval, day: dt.date, mmap: bool = False) -> dict[str, np.ndarray] or None:
+        """
+        Loads the candles of a single day
+
+        Args:
+            mmap (bool=False): whether to memory-map the columns read-only instead of reading them into memory
+
+        Returns:
+            dict[str, numpy.ndarray] or None: the columns of the day or ``None`` if the day is not stored
+
+        """
+        fp = self.path(service, market, candleinterval, day)
+        if not os.path.isfile(fp):
+            return None
+        if mmap:
+            return self.map_columns(fp)
+        with np.load(fp) as data:
+            return {col: data[col] for col in [self.TIME] + self.COLUMNS}
+
+    @classmethod
+    def map_columns(cls, fp: str) -> dict[str, np.memmap]:
+        """
+        Memory-maps the columns of a stored day. ``np.load`` cannot map the arrays of an ``.npz`` file, but as the
+        store writes them uncompressed, every array lies contiguous in the file and can be mapped in place.
+
+        Args:
+            fp (str): the path of the ``.npz`` file
+
+        Returns:
+            dict[str, numpy.memmap]
+
+        """
+        out = {}
+        with zipfile.ZipFile(fp) as archive, open(fp, "rb") as f:
+            for col in [cls.TIME] + cls.COLUMNS:
+                info = archive.getinfo(f"{col}.npy")
+                if info.compress_type != zipfile.ZIP_STORED:
+                    raise ValueError(f"{fp}: {col} is compressed")
+                # the local header is followed by the file name and an extra field of their own lengths
+                f.seek(info.header_offset + 26)
+                name_len, extra_len = struct.unpack("<HH", f.read(4))
+                f.seek(info.header_offset + 30 + name_len + extra_len)
+                if np.lib.format.read_magic(f) == (1, 0):
+                    shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+                else:
+                    shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+                if not np.prod(shape):
+                    out[col] = np.empty(shape, dtype=dtype)
+                    continue
+                out[col] = np.memmap(f, dtype=dtype, mode="r", offset=f.tell(), shape=shape,
+                                     order="F" if fortran_order else "C")
+        return out
+
+    def save_day(self, service: str, market: str, candleinterval, day: dt.date, candles: dict[str, np.ndarray]):
+        """
+        Stores the candles of a single day. The file is written to a temporary path first, so concurrent readers
+        never see partially written days.
+
+        Args:
+            candles (dict[str, numpy.ndarray]): the columns; ``startsAt`` as int64 epoch nanoseconds, everything
+                else as float64
+
+        """
+        fp = self.path(service, market, candleinterval, day)
+        os.makedirs(os.path.dirname(fp), exist_ok=True)
+
+        tmp = f"{fp}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, **{col: candles[col] for col in [self.TIME] + self.COLUMNS})
+        os.replace(tmp, fp)
+
+    @classmethod
+    def from_response(cls, response: list[dict[str, str]]) -> dict[str, np.ndarray]:
+        """
+        Converts a candle response of a service into store columns
+
+        Args:
+            response (list[dict[str, str]]): the candles as returned by the api
+
+        Returns:
+            dict[str, numpy.ndarray]
+
+        """
+        times = pd.to_datetime([c[cls.TIME] for c in response], utc=True)
+        out = {cls.TIME: times.tz_convert(None).to_numpy().astype("datetime64[ns]").view(np.int64)}
+        for col in cls.COLUMNS:
+            out[col] = np.array([c[col] for c in response], dtype=np.float64)
+        return out
+
+    @classmethod
+    def slice(cls, candles: dict[str, np.ndarray], start: dt.datetime, end: dt.datetime) -> dict[str, np.ndarray]:
+        """
+        Slices sorted columns to the candles starting in ``[start, end)`` using a binary search
+
+        """
+        times = candles[cls.TIME]
+        lo, hi = np.searchsorted(times, [to_timestamp(start).value, to_timestamp(end).value])
+        return {col: values[lo:hi] for col, values in candles.items()}
+
+    @classmethod
+    def concat(cls, chunks: list[dict[str, np.ndarray]]) -> dict[str, np.ndarray]:
+        return {col: np.concatenate([chunk[col] for chunk in chunks]) for col in [cls.TIME] + cls.COLUMNS}
+
+    @classmethod
+    def to_frame(cls, candles: dict[str, np.ndarray]) -> pd.DataFrame:
+        """
+        Builds a DataFrame of the columns, with ``startsAt`` converted to UTC datetimes
+
+        """
+        df = pd.DataFrame({col: candles[col] for col in cls.COLUMNS})
+        df.insert(0, cls.TIME, pd.to_datetime(candles[cls.TIME], utc=True))
+        return df
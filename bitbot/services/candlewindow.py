@@ -0,0 +1,141 @@
+import numpy as np
+
+
+class CandleWindow:
+    """
+    A fixed number of the most recent closed candles of a market, kept in preallocated arrays: the start times as
+    int64 nanoseconds since epoch and the prices and volumes as float32. Memory per window only depends on its
+    ``capacity``.
+
+    Like ``MarketFeed`` the ring buffer is stored twice in a row, so the window is always a contiguous slice and
+    ``view`` and ``__getitem__`` return read-only NumPy views instead of copies.
+
+    ::
+
+        >>> window = CandleWindow(1440)
+        >>> window.append(service.get_recent_candles("BTC-EUR", CandleInterval.MINUTE_1, since=window.last), closed_before)
+        >>> window["close"][-1]
+
+    Attributes:
+        capacity (int): the maximum number of candles kept
+        total (int): the number of candles ever appended
+
+    Args:
+        capacity (int=1440): the maximum number of candles kept
+
+    """
+    __slots__ = ("capacity", "total", "_times", "_values")
+
+    TIME = "startsat"
+    COLUMNS = ("open", "high", "low", "close", "volume", "quotevolume")
+    _INDEX = {col: i for i, col in enumerate(COLUMNS)}
+
+    def __init__(self, capacity: int = 1440):
+        self.capacity = capacity
+        self.total = 0
+        self._times = np.zeros(2 * capacity, dtype=np.int64)
+        self._values = np.zeros((len(self.COLUMNS), 2 * capacity), dtype=np.float32)
+
+    def __len__(self) -> int:
+        return min(self.total, self.capacity)
+
+    @property
+    def last(self) -> int or None:
+        """
+        int or None: the start time of the most recent candle in nanoseconds since epoch, ``None`` while empty
+
+        """
+        if not self.total:
+            return None
+        return int(self._times[(self.total - 1) % self.capacity])
+
+    def append(self, candles: dict[str, np.ndarray], closed_before: int = None) -> int:
+        """
+        Appends the candles that are newer than ``last`` and, if given, start before ``closed_before``. Older candles
+        and the still open one are skipped, so the same candles can be passed again without duplicating them.
+
+        Args:
+            candles (dict[str, numpy.ndarray]): chronological columns, ``startsat`` in nanoseconds since epoch; a
+                structured array of ``feed.CANDLE_DTYPE`` works as well
+            closed_before (int=None): the first start time in nanoseconds since epoch that is not closed yet
+
+        Returns:
+            int: the number of appended candles
+
+        """
+        times = np.asarray(candles[self.TIME], dtype=np.int64)
+        start = 0 if self.last is None else int(np.searchsorted(times, self.last, side="right"))
+        stop = len(times) if closed_before is None else int(np.searchsorted(times, closed_before, side="left"))
+        if stop <= start:
+            return 0
+        # only the newest candles fit into the window
+        start = max(start, stop - self.capacity)
+
+        slots = (self.total + np.arange(stop - start)) % self.capacity
+        # every candle is written to its slot in both halves
+        for half in (slots, slots + self.capacity):
+            self._times[half] = times[start:stop]
+            for col, i in self._INDEX.items():
+                self._values[i, half] = candles[col][start:stop]
+        self.total += stop - start
+        return stop - start
+
+    def amend(self, candles: dict[str, np.ndarray]) -> bool:
+        """
+        Replaces the values of the most recent candle with the ones of the candle of the same start time in
+        ``candles``, e.g.: the final values of a candle that was appended when its interval ended
+
+        Args:
+            candles (dict[str, numpy.ndarray]): chronological columns like ``append`` takes them
+
+        Returns:
+            bool: whether ``candles`` contained the most recent candle
+
+        """
+        last = self.last
+        if last is None:
+            return False
+        times = np.asarray(candles[self.TIME], dtype=np.int64)
+        i = int(np.searchsorted(times, last))
+        if i == len(times) or times[i] != last:
+            return False
+
+        slot = (self.total - 1) % self.capacity
+        for col, j in self._INDEX.items():
+            self._values[j, slot] = self._values[j, slot + self.capacity] = candles[col][i]
+        return True
+
+    def _head(self) -> int:
+        return (self.total - len(self)) % self.capacity
+
+    def view(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the candles in chronological order without copying
+
+        Returns:
+            tuple[numpy.ndarray, numpy.ndarray]: the read-only start times and the read-only ``(len(COLUMNS), len(self))``
+            values, one row per column of ``COLUMNS``
+
+        """
+        head = self._head()
+        times = self._times[head:head + len(self)]
+        values = self._values[:, head:head + len(self)]
+        times.flags.writeable = False
+        values.flags.writeable = False
+        return times, values
+
+    def __getitem__(self, col: str) -> np.ndarray:
+        """
+        Returns a read-only view of a column in chronological order, e.g.: ``window["close"]``
+
+        """
+        head = self._head()
+        if col == self.TIME:
+            values = self._times[head:head + len(self)]
+        else:
+            values = self._values[self._INDEX[col], head:head + len(self)]
+        values.flags.writeable = False
+        return values
+
+    def clear(self):
+        self.total = 0
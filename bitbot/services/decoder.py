@@ -0,0 +1,191 @@
+import json
+import numpy as np
+
+from bitbot.services.candlestore import CandleStore
+
+QUOTE = ord('"')
+ZULU = ord("Z")
+MINUS = ord("-")
+DOT = ord(".")
+ZERO = ord("0")
+
+# decimals with up to 15 digits are exact as integers in a float64, see ``parse_decimals``
+MAX_DIGITS = 15
+
+
+def decode_candles(raw: bytes, since: int = None) -> dict[str, np.ndarray]:
+    """
+    Decodes a candles response of the api, e.g.: ``[{"startsAt":"2021-01-01T00:00:00Z","open":"29000.1",...}, ...]``,
+    straight from its bytes into typed columns, without building a Python object per candle.
+
+    The api sends every value as a string and every candle with the same keys in the same order, so the strings of
+    the response are found by the positions of its quotes alone: the ``2k``-th string of a candle is its ``k``-th key
+    and the next one its value. The values of a column are copied into a fixed width byte matrix, which is converted
+    to float64 and datetime64 in one pass each, with the same results as ``float`` and ``numpy.datetime64`` on the
+    strings, see ``parse_decimals``. Responses that do not have this layout, e.g.: with escaped or unquoted values,
+    are decoded with ``json`` instead.
+
+    Args:
+        raw (bytes): the body of the response
+        since (int=None): only decode the candles that started after this time in nanoseconds since epoch; all if
+            ``None``. The candles of the response must be chronological.
+
+    Returns:
+        dict[str, numpy.ndarray]: the columns as ``CandleStore.from_response`` returns them, ``startsAt`` in
+        nanoseconds since epoch
+
+    """
+    buf = np.frombuffer(raw, dtype=np.uint8)
+    quotes = np.flatnonzero(buf == QUOTE)
+    if not len(quotes):
+        if raw.strip() == b"[]":
+            return empty_columns()
+        return decode_json(raw, since)
+    if len(quotes) % 2 or b"\\" in raw:
+        return decode_json(raw, since)
+
+    starts, ends = quotes[0::2] + 1, quotes[1::2]
+
+    # the keys of the first candle
+    first = raw.find(b"}")
+    width = int(np.searchsorted(starts, first)) if first >= 0 else 0
+    candles = len(starts) // width if width and width % 2 == 0 else 0
+    if not candles or len(starts) != candles * width:
+        return decode_json(raw, since)
+    starts, ends = starts.reshape(candles, width), ends.reshape(candles, width)
+    keys = {raw[starts[0, i]:ends[0, i]].decode(): i + 1 for i in range(0, width, 2)}
+    if any(col not in keys for col in [CandleStore.TIME] + CandleStore.COLUMNS):
+        return decode_json(raw, since)
+
+    # every candle must have the keys of the first one at the same positions, recognized by their length and their
+    # first and last character
+    key_starts, key_ends = starts[:, 0::2], ends[:, 0::2]
+    if not ((key_ends - key_starts == key_ends[0] - key_starts[0]).all()
+            and (buf[key_starts] == buf[key_starts[0]]).all() and (buf[key_ends - 1] == buf[key_ends[0] - 1]).all()):
+        return decode_json(raw, since)
+
+    i = keys[CandleStore.TIME]
+    time_starts, time_ends = starts[:, i], ends[:, i] - 1
+    if not (buf[time_ends] == ZULU).all():
+        return decode_json(raw, since)
+
+    times = strings(gather(buf, time_starts, time_ends)).astype("datetime64[ns]").view(np.int64)
+    start = 0
+    if since is not None:
+        # the values of the candles before ``since`` are not needed
+        start = int(np.searchsorted(times, since, side="right"))
+        times = times[start:]
+
+    # all values at once, column after column
+    columns = [keys[col] for col in CandleStore.COLUMNS]
+    value_starts, value_ends = starts[start:, columns].T.ravel(), ends[start:, columns].T.ravel()
+    values = parse_decimals(gather(buf, value_starts, value_ends, right=True), value_ends - value_starts)
+
+    out = {CandleStore.TIME: times}
+    for col, column in zip(CandleStore.COLUMNS, values.reshape(len(columns), -1)):
+        out[col] = column
+    return out
+
+
+def decode_json(raw: bytes, since: int = None) -> dict[str, np.ndarray]:
+    candles = CandleStore.from_response(json.loads(raw))
+    if since is None:
+        return candles
+    start = int(np.searchsorted(candles[CandleStore.TIME], since, side="right"))
+    return {col: values[start:] for col, values in candles.items()}
+
+
+def gather(buf: np.ndarray, starts: np.ndarray, ends: np.ndarray, right: bool = False) -> np.ndarray:
+    """
+    Copies the byte ranges ``[starts, ends)`` of a buffer into the rows of a matrix, padded with zeros; aligned to
+    the right if ``right``
+
+    """
+    lengths = ends - starts
+    width = max(int(lengths.max(initial=0)), 1)
+    # padded, so every range can be copied from a window of the widest one
+    lo, hi = int(starts.min(initial=0)), int(ends.max(initial=0))
+    padded = np.concatenate((np.zeros(width, dtype=np.uint8), buf[lo:hi], np.zeros(width, dtype=np.uint8)))
+    windows = np.lib.stride_tricks.sliding_window_view(padded, width)
+    offsets = np.arange(width)
+    if right:
+        chars = windows[ends - lo]
+        chars[offsets < (width - lengths)[:, None]] = 0
+    else:
+        chars = windows[starts - lo + width]
+        chars[offsets >= lengths[:, None]] = 0
+    return chars
+
+
+def strings(chars: np.ndarray) -> np.ndarray:
+    return np.ascontiguousarray(chars).view(f"S{chars.shape[1]}").ravel()
+
+
+def parse_decimals(chars: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """
+    Parses the plain decimals in the rows of a byte matrix, aligned to the right and padded with zeros, e.g.:
+    ``b"\\0-29995.72656250"``.
+
+    A decimal with up to 15 digits is an integer below ``2**53`` divided by a power of ten below ``10**15``; both are
+    exact in float64, so their quotient is the correctly rounded value ``float`` returns. As the rows are aligned to
+    the right, all rows with the same number of fraction digits weigh the digits of a column the same, so their
+    integers are one matrix product. Other rows, e.g.: with more digits or an exponent, are parsed by ``float``.
+
+    Args:
+        chars (numpy.ndarray): the uint8 matrix, see ``gather``
+        lengths (numpy.ndarray): the length of every row without the padding
+
+    Returns:
+        numpy.ndarray: float64
+
+    """
+    n, width = chars.shape
+    values = chars - np.uint8(ZERO)
+    digit = values <= 9
+    dot = chars == DOT
+    minus = chars == MINUS
+
+    # the position of the dot and the minus of every row; at most one of each, the minus in front
+    plain = np.ones(n, dtype=bool)
+    # -1 without a dot
+    fraction = np.full(n, -1, dtype=np.int64)
+    negative = np.zeros(n, dtype=bool)
+    for mask in (dot, minus):
+        rows, cols = np.divmod(np.flatnonzero(mask), width)
+        repeated = rows[1:][rows[1:] == rows[:-1]]
+        plain[repeated] = False
+        if mask is dot:
+            fraction[rows] = width - 1 - cols
+        else:
+            negative[rows] = True
+            plain[rows[cols != width - lengths[rows]]] = False
+    digits = lengths - (fraction >= 0) - negative
+    plain &= (digits > 0) & (digits <= MAX_DIGITS)
+    other = ~(digit | dot | minus) & (chars != 0)
+    if other.any():
+        plain[other.any(axis=1)] = False
+
+    matrix = np.where(digit, values, 0).astype(np.float64)
+    out = np.empty(n)
+    places = np.arange(width - 1, -1, -1)
+    groups = np.unique(fraction)
+    for f in groups:
+        rows = fraction == f if len(groups) > 1 else slice(None)
+        if f < 0:
+            out[rows] = matrix[rows] @ 10.0 ** places
+            continue
+        # the digits left of the dot shift by one
+        weights = 10.0 ** np.where(places > f, places - 1, places)
+        weights[width - 1 - f] = 0
+        out[rows] = matrix[rows] @ weights / 10.0 ** f
+
+    out[negative] = -out[negative]
+    for row in np.flatnonzero(~plain):
+        out[row] = float(chars[row, width - lengths[row]:].tobytes())
+    return out
+
+
+def empty_columns() -> dict[str, np.ndarray]:
+    out = {CandleStore.TIME: np.empty(0, dtype=np.int64)}
+    out.update({col: np.empty(0, dtype=np.float64) for col in CandleStore.COLUMNS})
+    return out
@@ -0,0 +1,266 @@
+import datetime as dt
+import logging
+import multiprocessing as mp
+import os
+import signal
+import sys
+import time
+from multiprocessing import shared_memory, resource_tracker
+import numpy as np
+import pandas as pd
+
+from bitbot.services.service import CandleInterval
+
+
+HEADER_DTYPE = np.dtype([
+    # even while the feed is consistent, odd while the publisher writes
+    ("seq", "<i8"),
+    # number of candles ever written
+    ("total", "<i8"),
+    # epoch milliseconds of the last update
+    ("updated", "<i8"),
+    ("last_trade_rate", "<f8"),
+    ("bid_rate", "<f8"),
+    ("ask_rate", "<f8"),
+])
+CANDLE_DTYPE = np.dtype([
+    ("startsat", "<i8"),
+    ("open", "<f8"),
+    ("high", "<f8"),
+    ("low", "<f8"),
+    ("close", "<f8"),
+    ("volume", "<f8"),
+    ("quotevolume", "<f8"),
+])
+
+
+def feed_name(service: str, market: str, candleinterval: CandleInterval) -> str:
+    """
+    Returns the name of the shared memory block of a market feed
+
+    """
+    return f"bitbot_{service}_{market}_{candleinterval.value}".lower()
+
+
+class MarketFeed:
+    """
+    The latest ticker and candles of a market in a shared memory block, so any number of bot processes can read
+    what a single publisher process requests from the service.
+
+    The candles are kept in a ring buffer that is stored twice in a row. Every candle is written to its slot in both
+    halves, so the most recent ``capacity`` candles are always a contiguous slice and can be handed out as a NumPy
+    view without copying. Writers increment ``seq`` before and after every update, readers retry if it was odd or
+    changed while they were reading.
+
+    Attributes:
+        name (str): the name of the shared memory block
+        capacity (int): the maximum number of candles kept
+
+    Args:
+        name (str): the name of the shared memory block
+        capacity (int=None): the maximum number of candles kept; creates the block if given, attaches to it otherwise
+
+    """
+    def __init__(self, name: str, capacity: int = None):
+        self.name = name
+        create = capacity is not None
+        if create:
+            size = HEADER_DTYPE.itemsize + 2 * capacity * CANDLE_DTYPE.itemsize
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            if os.name == "posix" and sys.version_info < (3, 13):
+                # attaching registers the block with this process' resource tracker, which would unlink it on exit
+                resource_tracker.unregister(self.shm._name, "shared_memory")
+
+        self.header = np.ndarray((), dtype=HEADER_DTYPE, buffer=self.shm.buf)
+        if create:
+            self.header[()] = (0, 0, 0, np.nan, np.nan, np.nan)
+        self.capacity = (self.shm.size - HEADER_DTYPE.itemsize) // (2 * CANDLE_DTYPE.itemsize)
+        self.candles = np.ndarray((2 * self.capacity,), dtype=CANDLE_DTYPE, buffer=self.shm.buf, offset=HEADER_DTYPE.itemsize)
+
+    @classmethod
+    def exists(cls, name: str) -> bool:
+        try:
+            feed = cls(name)
+        except FileNotFoundError:
+            return False
+        feed.close()
+        return True
+
+    #### writing
+
+    def write(self, ticker: dict[str, str], candles: pd.DataFrame):
+        """
+        Updates the ticker and appends the candles newer than the stored ones. The most recent stored candle is
+        overwritten, as it may not have been closed when it was written.
+
+        Args:
+            ticker (dict[str, str]): the ticker as returned by ``ServiceInterface.get_market_ticker``
+            candles (pandas.DataFrame): the candles as returned by ``ServiceInterface.get_candles``
+
+        """
+        times = candles["startsat"].to_numpy().astype("datetime64[ns]").view(np.int64)
+        total = int(self.header["total"])
+
+        start = 0
+        if total:
+            last = self.candles[(total - 1) % self.capacity]["startsat"]
+            start = int(np.searchsorted(times, last))
+            if start < len(times) and times[start] == last:
+                total -= 1
+        # more new candles than the ring holds
+        start = max(start, len(times) - self.capacity)
+
+        new = np.empty(len(times) - start, dtype=CANDLE_DTYPE)
+        new["startsat"] = times[start:]
+        for col in CANDLE_DTYPE.names[1:]:
+            new[col] = candles[col].to_numpy()[start:]
+
+        self.header["seq"] += 1
+        for i, candle in enumerate(new, total):
+            slot = i % self.capacity
+            self.candles[slot] = candle
+            self.candles[slot + self.capacity] = candle
+        self.header["total"] = total + len(new)
+        self.header["updated"] = int(time.time() * 1000)
+        self.header["last_trade_rate"] = float(ticker["lastTradeRate"])
+        self.header["bid_rate"] = float(ticker.get("bidRate", "nan"))
+        self.header["ask_rate"] = float(ticker.get("askRate", "nan"))
+        self.header["seq"] += 1
+
+    #### reading
+
+    def view(self) -> tuple[int, np.ndarray]:
+        """
+        Returns the stored candles in chronological order without copying. The view changes with the next write of
+        the publisher; compare the returned sequence number with ``seq`` to detect that.
+
+        Returns:
+            tuple[int, numpy.ndarray]: the sequence number and a read-only structured array of ``CANDLE_DTYPE``
+
+        """
+        seq = int(self.header["seq"])
+        total = int(self.header["total"])
+        count = min(total, self.capacity)
+        head = (total - count) % self.capacity
+        view = self.candles[head:head + count].view()
+        view.flags.writeable = False
+        return seq, view
+
+    @property
+    def seq(self) -> int:
+        return int(self.header["seq"])
+
+    @property
+    def updated(self) -> float:
+        """
+        float: seconds since epoch of the last update
+
+        """
+        return int(self.header["updated"]) / 1000
+
+    def read(self) -> tuple[dict[str, float], pd.DataFrame]:
+        """
+        Returns a consistent copy of the ticker and the candles, in the format of ``ServiceInterface.get_market_ticker``
+        and ``ServiceInterface.get_candles``
+
+        Returns:
+            tuple[dict[str, float], pandas.DataFrame]
+
+        """
+        ticker, candles = self.read_since()
+        df = pd.DataFrame({col: candles[col] for col in CANDLE_DTYPE.names[1:]})
+        df.insert(0, "startsat", candles["startsat"].view("datetime64[ns]"))
+        return ticker, df
+
+    def read_since(self, since: int = None) -> tuple[dict[str, float], np.ndarray]:
+        """
+        Returns a consistent copy of the ticker and of only the candles that started after ``since``
+
+        Args:
+            since (int=None): the start time of the newest known candle in nanoseconds since epoch; all candles if ``None``
+
+        Returns:
+            tuple[dict[str, float], numpy.ndarray]: the ticker and a structured array of ``CANDLE_DTYPE``
+
+        """
+        while True:
+            seq, view = self.view()
+            if seq % 2:
+                time.sleep(0)
+                continue
+            start = 0 if since is None else int(np.searchsorted(view["startsat"], since, side="right"))
+            candles = view[start:].copy()
+            header = self.header.copy()
+            if self.seq == seq:
+                break
+
+        ticker = {
+            "lastTradeRate": float(header["last_trade_rate"]),
+            "bidRate": float(header["bid_rate"]),
+            "askRate": float(header["ask_rate"]),
+        }
+        return ticker, candles
+
+    def close(self):
+        del self.header, self.candles
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+
+def publish(service_name: str, service_params: dict[str, any], market: str, candleinterval: CandleInterval,
+            update_interval: float, capacity: int = 1440):
+    """
+    Runs a publisher: polls the ticker and the recent candles of a market every ``update_interval`` seconds and
+    writes them into the market feed. Meant to be the target of a separate process.
+
+    Args:
+        service_name (str): the name of the service class, e.g.: ``"BitTrex"``
+        service_params (dict[str, any]): the arguments of the service class
+        market (str): the market name, e.g.: ``"BTC-EUR"``
+        candleinterval (CandleInterval): the interval of the candles
+        update_interval (float): the seconds between two polls
+        capacity (int=1440): the maximum number of candles kept
+
+    """
+    from bitbot import services
+
+    # terminate() of the parent process ends the loop below, so the shared memory is released
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    service = getattr(services, service_name)(**service_params)
+    feed = MarketFeed(feed_name(service_name, market, candleinterval), capacity)
+    try:
+        while True:
+            try:
+                feed.write(service.get_market_ticker(market), service.get_candles(market, candleinterval))
+            except Exception as e:
+                logging.error(f"* feed {market}: {e.__class__.__name__}: {str(e)}")
+            time.sleep(update_interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        feed.close()
+        feed.unlink()
+
+
+def start_publisher(service_name: str, service_params: dict[str, any], market: str, candleinterval: CandleInterval,
+                    update_interval: float, capacity: int = 1440) -> mp.Process or None:
+    """
+    Starts a publisher process for a market, unless one is already running
+
+    Returns:
+        multiprocessing.Process or None: the started process or ``None`` if the feed already exists
+
+    """
+    name = feed_name(service_name, market, candleinterval)
+    if MarketFeed.exists(name):
+        return None
+
+    process = mp.Process(target=publish, name=name, daemon=True,
+                         args=(service_name, service_params, market, candleinterval, update_interval, capacity))
+    process.start()
+    return process
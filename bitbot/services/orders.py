@@ -0,0 +1,174 @@
+import logging
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from bitbot import metrics
+from bitbot.services.service import ApiError, Order, ServiceInterface
+
+# responses after which an order is placed again
+RETRY_STATUS = (429, 500, 502, 503, 504)
+# the response to an order whose client order id was already placed
+DUPLICATE_STATUS = 409
+
+
+def transient_errors() -> tuple[type, ...]:
+    """
+    Returns the connection errors after which an order is placed again. Services without an http client never
+    import ``requests``, so none of its errors can be raised then.
+
+    """
+    requests = sys.modules.get("requests")
+    if requests is None:
+        return ()
+    return requests.ConnectionError, requests.Timeout
+
+
+class Submission:
+    """
+    The timeline of an order sent through an ``OrderPipeline``. All times are ``time.monotonic`` seconds.
+
+    Attributes:
+        order (Order): the order
+        signal_time (float): when the signal of the order was generated
+        queued (float): when the order was submitted to the pipeline
+        sent (float): when the first attempt to place the order was sent
+        done (float): when the order was placed or finally failed
+        attempts (int): the number of attempts to place the order
+        response (dict[str, str]): the order as the service reported it, ``None`` if it failed
+
+    """
+    __slots__ = ("order", "signal_time", "queued", "sent", "done", "attempts", "response")
+
+    def __init__(self, order: Order, signal_time: float = None):
+        self.order = order
+        self.queued = time.monotonic()
+        self.signal_time = signal_time if signal_time is not None else self.queued
+        self.sent = None
+        self.done = None
+        self.attempts = 0
+        self.response = None
+
+    @property
+    def signal_to_order(self) -> float or None:
+        """
+        float or None: the seconds from the signal until the order was sent
+        """
+        return None if self.sent is None else self.sent - self.signal_time
+
+    @property
+    def latency(self) -> float or None:
+        """
+        float or None: the seconds from the signal until the order was placed or failed
+        """
+        return None if self.done is None else self.done - self.signal_time
+
+
+class OrderPipeline:
+    """
+    Places orders on a thread of its own, so a bot never waits for an order to be placed and an order never waits
+    behind the market data requests of bots. Orders are placed one after the other in the order they are submitted.
+
+    Failed attempts are retried with a bounded exponential backoff if the failure is transient: a connection error,
+    a timeout, ``429`` or ``5xx``. As the order keeps its client order id, a retry of an order that reached the
+    service anyway is rejected as duplicate; the pipeline then looks up the placed order instead.
+
+    Attributes:
+        service (ServiceInterface): the service to place the orders with
+        submissions (collections.deque[Submission]): the most recent submissions, with their latencies
+
+    Args:
+        service (ServiceInterface): the service to place the orders with
+        retries (int=3): the maximum number of retries of an order
+        backoff (float=0.1): the seconds before the first retry, doubled for every further one
+        max_backoff (float=2): the maximum seconds between two retries
+        history (int=1000): the number of submissions kept in ``submissions``
+
+    """
+    def __init__(self, service: ServiceInterface, retries: int = 3, backoff: float = 0.1, max_backoff: float = 2,
+                 history: int = 1000):
+        self.service = service
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.submissions = deque(maxlen=history)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bitbot-orders")
+        self._lock = threading.Lock()
+
+    def submit(self, order: Order, signal_time: float = None, prepare: callable = None) -> Future:
+        """
+        Method to queue an order. Returns immediately.
+
+        Args:
+            order (Order): the order
+            signal_time (float=None): the ``time.monotonic`` of the signal of the order; now if ``None``
+            prepare (callable=None): called with the order on the pipeline thread right before it is placed, e.g.: to
+                adjust its quantity to the available balance
+
+        Returns:
+            concurrent.futures.Future: resolves to the ``Submission`` of the order once it was placed; fails with the
+            last error otherwise
+
+        """
+        submission = Submission(order, signal_time)
+        with self._lock:
+            self.submissions.append(submission)
+        return self._executor.submit(self._place, submission, prepare)
+
+    def _place(self, submission: Submission, prepare: callable = None) -> Submission:
+        order = submission.order
+        try:
+            if prepare is not None:
+                prepare(order)
+            # serialized once, every retry sends the same body
+            order.body
+
+            for attempt in range(self.retries + 1):
+                if submission.sent is None:
+                    submission.sent = time.monotonic()
+                submission.attempts += 1
+                try:
+                    submission.response = self.service.place_order(order)
+                    return submission
+                except ApiError as e:
+                    if e.status == DUPLICATE_STATUS and attempt:
+                        # an earlier attempt reached the service
+                        submission.response = self.service.find_order(order)
+                        if submission.response is not None:
+                            return submission
+                    if e.status not in RETRY_STATUS or attempt == self.retries:
+                        raise
+                    error = e
+                except transient_errors() as e:
+                    if attempt == self.retries:
+                        raise
+                    error = e
+
+                metrics.REGISTRY.counter("bitbot_order_retries_total", "Retried order placements", market=order.market,
+                                         reason=str(getattr(error, "status", error.__class__.__name__))).inc()
+                delay = min(self.backoff * 2 ** attempt, self.max_backoff)
+                logging.warning(f"* orders: {order.client_order_id}: {error.__class__.__name__}: {str(error)}; "
+                                f"retrying in {delay:.2f} s")
+                time.sleep(delay)
+        finally:
+            submission.done = time.monotonic()
+
+    def latencies(self) -> list[float]:
+        """
+        Returns the signal to order latencies of the recent submissions in seconds
+
+        """
+        with self._lock:
+            return [sub.signal_to_order for sub in self.submissions if sub.signal_to_order is not None]
+
+    def close(self, wait: bool = True):
+        """
+        Stops the pipeline thread
+
+        Args:
+            wait (bool=True): whether to wait for the queued orders to be placed
+
+        """
+        self._executor.shutdown(wait=wait)
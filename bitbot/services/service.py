@@ -4,6 +4,10 @@ import time
 import sys
 import datetime as dt
 import enum
+import functools
+import threading
+import uuid
+import numpy as np
 import pandas as pd
 
 
@@ -12,6 +16,22 @@ def now_milliseconds():
 
 def date_time_milliseconds(date_time_obj):
     return int(time.mktime(date_time_obj.timetuple()) * 1000)    
+
+
+@functools.lru_cache(maxsize=None)
+def load_secrets(fp: str = "./secrets.json") -> dict[str, dict[str, str]]:
+    """
+    Loads the secrets file once per process; all services of a process share it
+
+    Args:
+        fp (str="./secrets.json"): the path of the secrets file
+
+    Returns:
+        dict[str, dict[str, str]]: the secrets by service name
+
+    """
+    with open(fp, encoding="utf8") as f:
+        return json.load(f)
     
 
 class OrderDirection(enum.Enum):
@@ -33,6 +53,19 @@ class CandleInterval(enum.Enum):
     HOUR_1 = "HOUR_1"
     DAY_1 = "DAY_1"
 
+    @property
+    def timedelta(self) -> dt.timedelta:
+        """
+        datetime.timedelta: the duration of one candle
+
+        """
+        return {
+            "MINUTE_1": dt.timedelta(minutes=1),
+            "MINUTE_5": dt.timedelta(minutes=5),
+            "HOUR_1": dt.timedelta(hours=1),
+            "DAY_1": dt.timedelta(days=1),
+        }[self.value]
+
 class OrderType(enum.Enum):
     LIMIT = "LIMIT"
     MARKET = "MARKET"
@@ -40,9 +73,18 @@ class OrderType(enum.Enum):
     CEILING_MARKET = "CEILING_MARKET"
 
 class Order:
+    """
+    An order of a service. Every order gets a client order id on creation; placing the same order again, e.g.:
+    after a timeout, can not open a second one.
+
+    Attributes:
+        client_order_id (str): the client generated id of the order
+        body (str): the JSON body of the order; serialized on first access, so the order should not be changed after it
+
+    """
     def __init__(self, market: str, direction: OrderDirection, type: OrderType,
                     time_in_force: TimeInForce = None, quantity: float = 0, ceiling: float = 0, 
-                    limit: float = 0, use_awards: bool = False) -> None:
+                    limit: float = 0, use_awards: bool = False, client_order_id: str = None) -> None:
 
         self.market = market
         self.direction = direction
@@ -52,22 +94,31 @@ class Order:
         self.limit = limit
         self.time_in_force = time_in_force if time_in_force is not None else TimeInForce.GOOD_TIL_CANCELLED
         self.use_awards = use_awards
+        self.client_order_id = client_order_id if client_order_id is not None else str(uuid.uuid4())
 
-    def __str__(self):
+    def to_dict(self) -> dict[str, any]:
         out = {
                 "marketSymbol": self.market,
                 "direction": self.direction.value,
                 "type": self.type.value,
                 "timeInForce": self.time_in_force.value,
-                "useAwards": str(self.use_awards).lower()
+                "useAwards": self.use_awards,
+                "clientOrderId": self.client_order_id,
             }
         for item in ["ceiling", "quantity", "limit"]:
             val = getattr(self, item)
             if not val:
                 continue
-            out[item] = getattr(self, item)
+            out[item] = val
 
-        return str(out)
+        return out
+
+    @functools.cached_property
+    def body(self) -> str:
+        return json.dumps(self.to_dict(), separators=(",", ":"))
+
+    def __str__(self):
+        return self.body
 
 def printProgressBar (iteration, total, prefix = '', suffix = '', decimals = 1, length = 60, fill = '█', printEnd = "\r"):
     """
@@ -93,6 +144,66 @@ def printProgressBar (iteration, total, prefix = '', suffix = '', decimals = 1,
         print()
 
 
+class HistoryGapError(Exception):
+    """
+    Raised if a service has no history data for parts of a requested time range
+
+    Attributes:
+        market (str): the market the data was requested for
+        gaps (list[tuple[datetime.date, datetime.date]]): the start and end of every missing chunk
+
+    """
+    def __init__(self, market: str, gaps: list[tuple[dt.date, dt.date]]):
+        self.market = market
+        self.gaps = gaps
+        ranges = ", ".join(f"{start.strftime('%Y-%m-%d')} - {end.strftime('%Y-%m-%d')}" for start, end in gaps)
+        super().__init__(f"History data of {market} not available in: {ranges}")
+
+
+class ApiError(Exception):
+    """
+    Raised if the api of a service responds with an error status
+
+    Attributes:
+        status (int): the http status code
+        text (str): the body of the response
+
+    """
+    def __init__(self, status: int, text: str):
+        self.status = status
+        self.text = text
+        super().__init__(f"Error {status}: {text}")
+
+
+class RateLimiter:
+    """
+    Thread safe limiter that spaces calls evenly to at most ``requests_per_second``
+
+    Args:
+        requests_per_second (float=None): the maximum rate; ``None`` disables the limit
+
+    """
+    def __init__(self, requests_per_second: float = None):
+        self.interval = 1 / requests_per_second if requests_per_second else 0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """
+        Blocks until the next call is allowed
+
+        """
+        if not self.interval:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
 class ServiceInterface:
     def __init__(self, service_name: str = None):
         """
@@ -103,13 +214,13 @@ class ServiceInterface:
                 find the right class to use
 
         """
+        self.service_name = service_name
         if service_name is None:
             return
             
-        with open("./secrets.json", encoding="utf8") as f:
-            self._config = json.load(f)[service_name]
-            self._api_key = self._config["key"]
-            self._api_secret = self._config["secret"]
+        self._config = load_secrets()[service_name]
+        self._api_key = self._config["key"]
+        self._api_secret = self._config["secret"]
 
     
     @staticmethod
@@ -141,6 +252,28 @@ class ServiceInterface:
     def get_candles(self, market: str, candleinterval: CandleInterval) -> pd.DataFrame:
         pass
 
+    def get_recent_candles(self, market: str, candleinterval: CandleInterval, since: int = None) -> dict[str, np.ndarray]:
+        """
+        Method to get the recent candles that started after ``since`` as columns, see ``CandleWindow.append``.
+        Services should override it to convert only the new candles of the response.
+
+        Args:
+            market (str): the market name, e.g.: ``"BTC-EUR"``
+            candleinterval (CandleInterval): the interval of the candles
+            since (int=None): the start time of the newest known candle in nanoseconds since epoch; all candles if ``None``
+
+        Returns:
+            dict[str, numpy.ndarray]: ``startsat`` in nanoseconds since epoch and the lowercase price and volume columns
+
+        """
+        candles = self.get_candles(market, candleinterval)
+        times = candles["startsat"].to_numpy().astype("datetime64[ns]").view(np.int64)
+        start = 0 if since is None else int(np.searchsorted(times, since, side="right"))
+        out = {"startsat": times[start:]}
+        for col in ("open", "high", "low", "close", "volume", "quotevolume"):
+            out[col] = candles[col].to_numpy()[start:]
+        return out
+
     @abstractmethod
     def get_market_ticker(self, market: str) -> dict[str, str]:
         pass
@@ -160,6 +293,16 @@ class ServiceInterface:
     @abstractmethod
     def place_order(self, orders: list[Order]) -> list[dict[str, str]]:
         pass
+
+    def find_order(self, order: Order) -> dict[str, str] or None:
+        """
+        Method to look up a placed order by its ``client_order_id``
+
+        Returns:
+            dict[str, str] or None: the order as the service reports it or ``None`` if it was not placed
+
+        """
+        return None
     
     @abstractmethod
     def get_history_data(self, market: str, candleinterval: CandleInterval, start: dt.datetime, end: dt.datetime) -> pd.DataFrame:
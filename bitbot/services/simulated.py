@@ -0,0 +1,668 @@
+import datetime as dt
+import functools
+import heapq
+import itertools
+import json
+import re
+import threading
+import time
+import uuid
+import zlib
+import numpy as np
+import pandas as pd
+
+from bitbot.services.service import ServiceInterface, Order, OrderDirection, OrderType, CandleInterval, TimeInForce, \
+    ApiError, HistoryGapError
+from bitbot.services.candlestore import CandleStore, to_timestamp
+
+COLUMNS = ("open", "high", "low", "close", "volume", "quotevolume")
+
+# the number of candles of a recent candles response by interval, as BitTrex answers it
+RECENT_CANDLES = {
+    CandleInterval.MINUTE_1: 1440,
+    CandleInterval.MINUTE_5: 288,
+    CandleInterval.HOUR_1: 744,
+    CandleInterval.DAY_1: 366,
+}
+
+MINUTE = 60_000_000_000
+
+
+def synthetic_candles(n: int, start: dt.datetime = dt.datetime(2021, 1, 1), seed: int = 0, price: float = 30000.0,
+                      regime_length: int = 1440) -> pd.DataFrame:
+    """
+    Generates deterministic minute candles: a geometric random walk whose drift and volatility change between
+    regimes of random length, so trends, ranges and volatile phases alternate like in real markets. Volume rises
+    with the volatility of a regime.
+
+    Args:
+        n (int): the number of candles
+        start (datetime.datetime=2021-01-01): the UTC start time of the first candle
+        seed (int=0): the seed of the random generator; equal seeds give equal candles
+        price (float=30000.0): the open of the first candle
+        regime_length (int=1440): the mean number of candles of a regime
+
+    Returns:
+        pandas.DataFrame: the candles as ``get_history_data`` returns them
+
+    """
+    rng = np.random.default_rng(seed)
+
+    lengths = []
+    while sum(lengths) < n:
+        lengths.append(int(rng.geometric(1 / regime_length)))
+    drift = np.repeat(rng.normal(0, 2e-5, len(lengths)), lengths)[:n]
+    volatility = np.repeat(np.exp(rng.normal(np.log(5e-4), 0.5, len(lengths))), lengths)[:n]
+
+    returns = drift + volatility * rng.standard_normal(n)
+    close = price * np.exp(np.cumsum(returns))
+    open_ = np.concatenate(([price], close[:-1]))
+    high = np.maximum(open_, close) * np.exp(np.abs(rng.normal(0, 0.5, n)) * volatility)
+    low = np.minimum(open_, close) * np.exp(-np.abs(rng.normal(0, 0.5, n)) * volatility)
+    volume = rng.lognormal(0, 0.5, n) * volatility / 5e-4
+
+    # the services downcast the api values to float32
+    df = pd.DataFrame({
+        "open": open_.astype(np.float32),
+        "high": high.astype(np.float32),
+        "low": low.astype(np.float32),
+        "close": close.astype(np.float32),
+        "volume": volume.astype(np.float32),
+        "quotevolume": (volume * close).astype(np.float32),
+    })
+    df.insert(0, "startsat", pd.date_range(pd.Timestamp(start).tz_localize(None), periods=n, freq="min", tz="UTC"))
+    return df
+
+
+@functools.lru_cache(maxsize=64)
+def load_market(market: str, start: pd.Timestamp, minutes: int, seed: int = 0, candle_store: str = None,
+                store_service: str = "bittrex") -> dict[str, np.ndarray]:
+    """
+    Loads the minute candles a ``SimulatedExchange`` replays. The candles are cached and shared by all exchanges of
+    the process, so hundreds of them cost the memory of one.
+
+    Args:
+        market (str): the market name, e.g.: ``"BTC-EUR"``
+        start (pandas.Timestamp): the UTC start of the first candle
+        minutes (int): the number of candles
+        seed (int=0): the seed of synthetic candles
+        candle_store (str=None): the root of a ``CandleStore`` to read the candles from; synthetic candles if ``None``
+        store_service (str="bittrex"): the service whose candles are read from the store
+
+    Returns:
+        dict[str, numpy.ndarray]: read-only ``startsat`` in nanoseconds since epoch and float64 ``COLUMNS``
+
+    Raises:
+        HistoryGapError: if days are missing in the candle store
+
+    """
+    if candle_store is None:
+        # every market walks on its own
+        df = synthetic_candles(minutes, start.to_pydatetime(), seed ^ zlib.crc32(market.encode()))
+        out = {"startsat": df["startsat"].dt.tz_convert(None).to_numpy().astype("datetime64[ns]").view(np.int64)}
+        out.update({col: df[col].to_numpy(dtype=np.float64) for col in COLUMNS})
+    else:
+        store = CandleStore(candle_store)
+        end = start + pd.Timedelta(minutes=minutes)
+        days = []
+        next_start = start.normalize()
+        while next_start < end:
+            days.append(next_start.date())
+            next_start += dt.timedelta(days=1)
+        chunks = [store.load_day(store_service, market, CandleInterval.MINUTE_1, day, mmap=True) for day in days]
+        gaps = [(day, day + dt.timedelta(days=1)) for day, chunk in zip(days, chunks) if chunk is None]
+        if gaps:
+            raise HistoryGapError(market, gaps)
+        candles = CandleStore.slice(CandleStore.concat(chunks), start, end)
+        out = {"startsat": candles[CandleStore.TIME]}
+        out.update({col.lower(): candles[col].astype(np.float64) for col in CandleStore.COLUMNS})
+
+    for values in out.values():
+        values.flags.writeable = False
+    return out
+
+
+def aggregate(candles: dict[str, np.ndarray], candleinterval: CandleInterval) -> dict[str, np.ndarray]:
+    """
+    Aggregates minute candles into candles of a longer interval
+
+    """
+    step = pd.Timedelta(candleinterval.timedelta).value
+    keys = candles["startsat"] // step
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    ends = np.concatenate((starts[1:], [len(keys)])) - 1
+    out = {
+        "startsat": keys[starts] * step,
+        "open": candles["open"][starts],
+        "high": np.maximum.reduceat(candles["high"], starts),
+        "low": np.minimum.reduceat(candles["low"], starts),
+        "close": candles["close"][ends],
+        "volume": np.add.reduceat(candles["volume"], starts),
+        "quotevolume": np.add.reduceat(candles["quotevolume"], starts),
+    }
+    for values in out.values():
+        values.flags.writeable = False
+    return out
+
+
+def iso(ns: int) -> str:
+    return pd.Timestamp(ns).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+class SimulatedExchange(ServiceInterface):
+    """
+    In-process exchange for load tests and offline runs. It replays synthetic candles, or candles cached in a
+    ``CandleStore``, on a simulated clock that runs ``speed`` times faster than the real one, and fills orders with
+    an in-memory matching engine against the replayed prices:
+
+    - market orders and marketable limit orders fill at once at the ask (buys) or bid (sells), ``spread`` around
+      the last close, and pay the ``taker_fee``
+    - other limit orders rest in the order book until a closed candle reaches their limit, then fill at the limit
+      and pay the ``maker_fee``; ``IMMEDIATE_OR_CANCEL`` and ``FILL_OR_KILL`` orders are closed without a fill instead
+    - ceiling orders spend their ceiling, fees included
+
+    Balances are reserved for resting orders. Orders exceeding the available balance are rejected with
+    ``INSUFFICIENT_FUNDS``, a reused client order id with ``DUPLICATE_ORDER``, like BitTrex does.
+
+    Only closed candles are served, as the bots tell closed candles apart with the real clock. Once the clock passes
+    the last candle, the markets stand still. Every method takes one lock and a binary search, so an exchange answers
+    tens of thousands of calls per second.
+
+    Configured like any service:
+
+    ::
+
+        service: SimulatedExchange
+        service_params:
+          markets: [BTC-EUR, ETH-EUR]
+          start: 2021-05-01
+          days: 30 # candles replayed after the history
+          history_days: 1 # candles closed when the exchange starts
+          speed: 60 # one simulated minute per second
+          candle_store: ./candles # optional; replay the cached BitTrex candles instead of synthetic ones
+          balances: {EUR: 1000}
+
+    Attributes:
+        markets (list[str]): the markets of the exchange
+        speed (float): the simulated seconds per real second
+        calls (int): the number of calls of the exchange
+
+    Args:
+        markets (list[str]=("BTC-EUR",)): the markets of the exchange
+        start (datetime.datetime="2021-01-01"): the UTC start of the first candle
+        days (float=30): the number of days replayed
+        history_days (float=1): the number of days before the simulated clock starts
+        speed (float=60.0): the simulated seconds per real second; ``0`` stops the clock, see ``advance``
+        seed (int=0): the seed of synthetic candles
+        candle_store (str=None): the root of a ``CandleStore`` to replay the candles of; synthetic candles if ``None``
+        store_service (str="bittrex"): the service whose candles are replayed from the store
+        balances (dict[str, float]=None): the available balance by currency; ``1000000`` of every currency of the
+            markets if ``None``
+        taker_fee (float=0.0035): the relative fee of orders that fill at once
+        maker_fee (float=0.0035): the relative fee of orders that rest in the order book
+        spread (float=0.0005): the relative distance between bid and ask
+
+    """
+    def __init__(self, markets: list[str] = ("BTC-EUR",), start: dt.datetime = "2021-01-01", days: float = 30,
+                 history_days: float = 1, speed: float = 60.0, seed: int = 0, candle_store: str = None,
+                 store_service: str = "bittrex", balances: dict[str, float] = None, taker_fee: float = 0.0035,
+                 maker_fee: float = 0.0035, spread: float = 0.0005):
+        # no secrets needed
+        super().__init__()
+        self.service_name = "simulated"
+
+        self.markets = list(markets)
+        start = to_timestamp(start).tz_convert(None)
+        minutes = int((days + history_days) * 1440)
+        self._candles = {market: load_market(market, start, minutes, seed, candle_store, store_service)
+                         for market in self.markets}
+        self._series = {}
+
+        self.speed = speed
+        self._clock_start = start.value + int(history_days * 1440) * MINUTE
+        self._real_start = time.monotonic()
+        self._offset = 0
+
+        self.taker_fee = taker_fee
+        self.maker_fee = maker_fee
+        self.spread = spread
+        if balances is None:
+            balances = {currency: 1_000_000 for market in self.markets for currency in market.split("-")}
+        self._available = dict(balances)
+        self._reserved = {}
+
+        self.orders = {}
+        self._client_ids = {}
+        # resting limit orders per market: a max heap of buys and a min heap of sells by limit
+        self._books = {market: ([], []) for market in self.markets}
+        self._matched = {market: 0 for market in self.markets}
+        self._sequence = itertools.count()
+
+        self.calls = 0
+        self._lock = threading.RLock()
+
+    #### clock
+
+    def now(self) -> int:
+        """
+        Returns the simulated time in nanoseconds since epoch
+
+        """
+        return self._clock_start + self._offset + int((time.monotonic() - self._real_start) * self.speed * 1e9)
+
+    def advance(self, seconds: float):
+        """
+        Method to move the simulated clock forward, e.g.: to step a stopped clock
+
+        Args:
+            seconds (float): the simulated seconds
+
+        """
+        with self._lock:
+            self._offset += int(seconds * 1e9)
+
+    def series(self, market: str, candleinterval: CandleInterval = CandleInterval.MINUTE_1) -> dict[str, np.ndarray]:
+        """
+        Returns all candles of a market, closed or not, see ``load_market``
+
+        Raises:
+            ApiError: if the market does not exist
+
+        """
+        key = (market, candleinterval)
+        candles = self._series.get(key)
+        if candles is None:
+            if market not in self._candles:
+                raise ApiError(404, json.dumps({"code": "MARKET_DOES_NOT_EXIST"}))
+            candles = self._candles[market]
+            if candleinterval != CandleInterval.MINUTE_1:
+                candles = aggregate(candles, candleinterval)
+            self._series[key] = candles
+        return candles
+
+    def closed(self, market: str, candleinterval: CandleInterval = CandleInterval.MINUTE_1, now: int = None) -> int:
+        """
+        Returns the number of candles of a market that have closed by the simulated clock
+
+        """
+        now = self.now() if now is None else now
+        step = pd.Timedelta(candleinterval.timedelta).value
+        return int(np.searchsorted(self.series(market, candleinterval)["startsat"], now - step, side="right"))
+
+    def _enter(self, market: str = None) -> int:
+        # called by every method under the lock: counts the call and fills the resting orders the clock has reached
+        self.calls += 1
+        if market is not None:
+            return self._match(market)
+
+    #### matching engine
+
+    def _match(self, market: str) -> int:
+        closed = self.closed(market)
+        start = self._matched[market]
+        if closed <= start:
+            return closed
+        self._matched[market] = closed
+
+        buys, sells = self._books[market]
+        if buys or sells:
+            candles = self.series(market)
+            for heap, prices, sign in ((buys, candles["low"][start:closed], -1), (sells, candles["high"][start:closed], 1)):
+                while heap:
+                    key, _, order_id = heap[0]
+                    rec = self.orders[order_id]
+                    if rec["status"] != "OPEN":
+                        # cancelled
+                        heapq.heappop(heap)
+                        continue
+                    limit = sign * key
+                    reached = prices <= limit if sign < 0 else prices >= limit
+                    k = int(np.argmax(reached))
+                    if not reached[k]:
+                        break
+                    heapq.heappop(heap)
+                    self._fill(rec, limit, self.maker_fee, int(candles["startsat"][start + k]) + MINUTE)
+        return closed
+
+    def _fill(self, rec: dict[str, any], price: float, fee_rate: float, time_ns: int):
+        base, quote = rec["marketSymbol"].split("-")
+        if rec["ceiling"] and not rec["quantity"]:
+            quantity = rec["ceiling"] / (price * (1 + fee_rate))
+        else:
+            quantity = rec["quantity"]
+        value = price * quantity
+        commission = value * fee_rate
+
+        reserved = rec.pop("_reserved", 0)
+        if rec["direction"] == OrderDirection.BUY.value:
+            self._release(quote, reserved)
+            self._available[quote] = self._available.get(quote, 0) - value - commission
+            self._available[base] = self._available.get(base, 0) + quantity
+        else:
+            self._release(base, reserved)
+            self._available[base] = self._available.get(base, 0) - quantity
+            self._available[quote] = self._available.get(quote, 0) + value - commission
+
+        rec.update(fillQuantity=quantity, proceeds=value, commission=commission, status="CLOSED",
+                   updatedAt=time_ns, closedAt=time_ns)
+
+    def _reserve(self, currency: str, amount: float):
+        if self._available.get(currency, 0) < amount:
+            raise ApiError(400, json.dumps({"code": "INSUFFICIENT_FUNDS"}))
+        self._available[currency] = self._available.get(currency, 0) - amount
+        self._reserved[currency] = self._reserved.get(currency, 0) + amount
+
+    def _release(self, currency: str, amount: float):
+        self._reserved[currency] = self._reserved.get(currency, 0) - amount
+        self._available[currency] = self._available.get(currency, 0) + amount
+
+    def _quote(self, market: str, closed: int) -> tuple[float, float, float]:
+        last = float(self.series(market)["close"][max(closed, 1) - 1])
+        return last, last * (1 - self.spread / 2), last * (1 + self.spread / 2)
+
+    @staticmethod
+    def _response(rec: dict[str, any]) -> dict[str, str]:
+        out = {}
+        for key, value in rec.items():
+            if key.startswith("_") or value is None:
+                continue
+            if key in ("createdAt", "updatedAt", "closedAt"):
+                value = iso(value)
+            elif isinstance(value, float):
+                value = f"{value:.8f}"
+            out[key] = value
+        return out
+
+    #### Account
+
+    def get_account_id(self) -> str:
+        with self._lock:
+            self._enter()
+            return "simulated"
+
+    def get_available_balance(self, currency: str) -> float:
+        with self._lock:
+            self._enter()
+            for market in self.markets:
+                self._match(market)
+            return float(self._available.get(currency, 0))
+
+    def get_balances(self) -> list[dict[str, str]]:
+        with self._lock:
+            self._enter()
+            for market in self.markets:
+                self._match(market)
+            currencies = sorted(set(self._available) | set(self._reserved))
+            return [{
+                "currencySymbol": currency,
+                "total": f"{self._available.get(currency, 0) + self._reserved.get(currency, 0):.8f}",
+                "available": f"{self._available.get(currency, 0):.8f}",
+                "updatedAt": iso(self.now()),
+            } for currency in currencies]
+
+    #### Markets
+
+    def get_market(self, market: str) -> dict[str, any]:
+        with self._lock:
+            self._enter()
+            self.series(market)
+            base, quote = market.split("-")
+            return {"symbol": market, "baseCurrencySymbol": base, "quoteCurrencySymbol": quote,
+                    "minTradeSize": "0.00000001", "precision": 8, "status": "ONLINE"}
+
+    def get_all_markets(self) -> list[dict[str, any]]:
+        return [self.get_market(market) for market in self.markets]
+
+    def get_market_summary(self, market: str) -> dict[str, any]:
+        with self._lock:
+            closed = self._enter(market)
+            candles = self.series(market)
+            start = max(0, closed - 1440)
+            day = slice(start, max(closed, start + 1))
+            open_, last = candles["open"][start], candles["close"][day.stop - 1]
+            return {
+                "symbol": market,
+                "high": f"{candles['high'][day].max():.8f}",
+                "low": f"{candles['low'][day].min():.8f}",
+                "volume": f"{candles['volume'][day].sum():.8f}",
+                "quoteVolume": f"{candles['quotevolume'][day].sum():.8f}",
+                "percentChange": f"{(last / open_ - 1) * 100:.2f}",
+                "updatedAt": iso(self.now()),
+            }
+
+    def get_market_ticker(self, market: str) -> dict[str, str]:
+        with self._lock:
+            closed = self._enter(market)
+            last, bid, ask = self._quote(market, closed)
+            return {"symbol": market, "lastTradeRate": f"{last:.8f}", "bidRate": f"{bid:.8f}", "askRate": f"{ask:.8f}"}
+
+    def _window(self, market: str, timedelta: dt.timedelta, calc_point: str = None) -> np.ndarray:
+        with self._lock:
+            closed = self._enter(market)
+        rows = max(1, int(timedelta.total_seconds() // 60))
+        return self.series(market)[(calc_point or "close").lower()][max(0, closed - rows):closed]
+
+    def get_market_percentage(self, market: str, timedelta: dt.timedelta, calc_point: str = None) -> float:
+        values = self._window(market, timedelta, calc_point)
+        return float((values[-1] / values[0] - 1) * 100) if len(values) else 0.0
+
+    def get_market_mean(self, market: str, timedelta: dt.timedelta, calc_point: str = None) -> float:
+        values = self._window(market, timedelta, calc_point)
+        return float(values.mean()) if len(values) else 0.0
+
+    #### Orders
+
+    def place_order(self, order: Order) -> dict[str, str]:
+        with self._lock:
+            closed = self._enter(order.market)
+            if order.client_order_id in self._client_ids:
+                raise ApiError(409, json.dumps({"code": "DUPLICATE_ORDER"}))
+            if not order.quantity and not order.ceiling:
+                raise ApiError(400, json.dumps({"code": "MIN_TRADE_REQUIREMENT_NOT_MET"}))
+
+            base, quote = order.market.split("-")
+            last, bid, ask = self._quote(order.market, closed)
+            buy = order.direction == OrderDirection.BUY
+            price = ask if buy else bid
+            limited = order.type in (OrderType.LIMIT, OrderType.CEILING_LIMIT)
+            marketable = not limited or (order.limit >= ask if buy else order.limit <= bid)
+            now = self.now()
+
+            rec = {
+                "id": str(uuid.uuid4()),
+                "marketSymbol": order.market,
+                "direction": order.direction.value,
+                "type": order.type.value,
+                "quantity": float(order.quantity) if order.quantity else None,
+                "limit": float(order.limit) if limited else None,
+                "ceiling": float(order.ceiling) if order.ceiling else None,
+                "timeInForce": order.time_in_force.value,
+                "clientOrderId": order.client_order_id,
+                "fillQuantity": 0.0,
+                "commission": 0.0,
+                "proceeds": 0.0,
+                "status": "OPEN",
+                "createdAt": now,
+                "updatedAt": now,
+                "closedAt": None,
+            }
+
+            if marketable:
+                if order.time_in_force == TimeInForce.POST_ONLY_GOOD_TIL_CANCELLED:
+                    raise ApiError(400, json.dumps({"code": "POST_ONLY_WOULD_FILL"}))
+                quantity = rec["quantity"] or rec["ceiling"] / (price * (1 + self.taker_fee))
+                if buy and self._available.get(quote, 0) < price * quantity * (1 + self.taker_fee) or \
+                        not buy and self._available.get(base, 0) < quantity:
+                    raise ApiError(400, json.dumps({"code": "INSUFFICIENT_FUNDS"}))
+                self._fill(rec, price, self.taker_fee, now)
+            elif order.time_in_force in (TimeInForce.IMMEDIATE_OR_CANCEL, TimeInForce.FILL_OR_KILL):
+                rec.update(status="CLOSED", closedAt=now)
+            else:
+                if buy:
+                    amount = rec["ceiling"] or order.limit * order.quantity * (1 + self.maker_fee)
+                    self._reserve(quote, amount)
+                else:
+                    amount = order.quantity
+                    self._reserve(base, amount)
+                rec["_reserved"] = amount
+                buys, sells = self._books[order.market]
+                if buy:
+                    heapq.heappush(buys, (-order.limit, next(self._sequence), rec["id"]))
+                else:
+                    heapq.heappush(sells, (order.limit, next(self._sequence), rec["id"]))
+
+            self.orders[rec["id"]] = rec
+            self._client_ids[order.client_order_id] = rec["id"]
+            return self._response(rec)
+
+    def get_order(self, order_id: str) -> dict[str, str]:
+        with self._lock:
+            self._enter()
+            if order_id not in self.orders:
+                raise ApiError(404, json.dumps({"code": "NOT_FOUND"}))
+            rec = self.orders[order_id]
+            self._match(rec["marketSymbol"])
+            return self._response(rec)
+
+    def cancel_order(self, order_id: str) -> dict[str, str]:
+        with self._lock:
+            rec = self.orders.get(order_id)
+            if rec is None:
+                raise ApiError(404, json.dumps({"code": "NOT_FOUND"}))
+            self._enter(rec["marketSymbol"])
+            if rec["status"] != "OPEN":
+                raise ApiError(409, json.dumps({"code": "ORDER_NOT_OPEN"}))
+
+            base, quote = rec["marketSymbol"].split("-")
+            self._release(quote if rec["direction"] == OrderDirection.BUY.value else base, rec.pop("_reserved", 0))
+            now = self.now()
+            rec.update(status="CLOSED", updatedAt=now, closedAt=now)
+            return self._response(rec)
+
+    def get_orders(self, status: str = "open", market: str = None) -> list[dict[str, str]]:
+        with self._lock:
+            self._enter()
+            for name in ([market] if market else self.markets):
+                self._match(name)
+            status = status.upper()
+            return [self._response(rec) for rec in self.orders.values()
+                    if rec["status"] == status and (market is None or rec["marketSymbol"] == market)]
+
+    def find_order(self, order: Order) -> dict[str, str] or None:
+        with self._lock:
+            order_id = self._client_ids.get(order.client_order_id)
+            return None if order_id is None else self.get_order(order_id)
+
+    #### candles
+
+    def get_recent_candles(self, market: str, candleinterval: CandleInterval, since: int = None) -> dict[str, np.ndarray]:
+        with self._lock:
+            self._enter(market)
+            closed = self.closed(market, candleinterval)
+        candles = self.series(market, candleinterval)
+        start = max(0, closed - RECENT_CANDLES[candleinterval])
+        if since is not None:
+            start = max(start, int(np.searchsorted(candles["startsat"], since, side="right")))
+        return {col: values[start:closed] for col, values in candles.items()}
+
+    def get_candles(self, market: str, candleinterval: CandleInterval) -> pd.DataFrame:
+        candles = self.get_recent_candles(market, candleinterval)
+        df = pd.DataFrame({col: candles[col].astype(np.float32) for col in COLUMNS})
+        df.insert(0, "startsat", candles["startsat"].view("datetime64[ns]"))
+        return df
+
+    #### market history
+
+    def get_history_data(self, market: str, candleinterval: CandleInterval, start: dt.datetime, end: dt.datetime) -> pd.DataFrame:
+        """
+        Method to get the closed candles starting in ``[start, end)``
+
+        Raises:
+            HistoryGapError: if none of the candles have closed or the range is outside of the replayed candles
+
+        """
+        with self._lock:
+            self._enter(market)
+            closed = self.closed(market, candleinterval)
+        candles = self.series(market, candleinterval)
+        lo, hi = np.searchsorted(candles["startsat"][:closed], [to_timestamp(start).value, to_timestamp(end).value])
+        if lo == hi:
+            raise HistoryGapError(market, [(to_timestamp(start).date(), to_timestamp(end).date())])
+
+        df = CandleStore.to_frame({
+            CandleStore.TIME: candles["startsat"][lo:hi],
+            **{col: candles[col.lower()][lo:hi].astype(np.float32) for col in CandleStore.COLUMNS},
+        })
+        return df.rename(str.lower, axis='columns')
+
+    #### api
+
+    def api_request(self, url: str, method: str = None, params: dict = None, body: dict[str, any] or str = None,
+                    headers: dict[str, str] = None):
+        """
+        Method to answer a request of the BitTrex v3 api, for code that requests the api directly
+
+        Raises:
+            ApiError: ``404`` for endpoints the exchange does not know
+
+        """
+        method = method or "GET"
+        path = re.sub(r"^https?://[^/]+(/v3)?", "", url)
+        path = path if path.startswith("/") else f"/{path}"
+        params = params or {}
+        if isinstance(body, str):
+            body = json.loads(body)
+
+        for route_method, pattern, handler in ROUTES:
+            match = pattern.match(path)
+            if match and route_method == method:
+                return handler(self, params=params, body=body, **match.groupdict())
+        raise ApiError(404, json.dumps({"code": "NOT_FOUND"}))
+
+
+def _order_from_dict(body: dict[str, any]) -> Order:
+    return Order(body["marketSymbol"], OrderDirection(body["direction"]), OrderType(body["type"]),
+                 TimeInForce(body["timeInForce"]), float(body.get("quantity", 0)), float(body.get("ceiling", 0)),
+                 float(body.get("limit", 0)), body.get("useAwards", False), body.get("clientOrderId"))
+
+
+def _candle_response(candles: dict[str, np.ndarray]) -> list[dict[str, str]]:
+    return [{"startsAt": pd.Timestamp(int(t)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+             **{key: f"{candles[key.lower()][i]:.8f}" for key in ("open", "high", "low", "close", "volume", "quoteVolume")}}
+            for i, t in enumerate(candles["startsat"])]
+
+
+def _historical(exchange: SimulatedExchange, market: str, interval: str, year: str, month: str, day: str,
+                **kwargs) -> list[dict[str, str]]:
+    candleinterval = CandleInterval(interval)
+    days = {CandleInterval.HOUR_1: 31, CandleInterval.DAY_1: 366}.get(candleinterval, 1)
+    start = pd.Timestamp(int(year), int(month), int(day))
+    end = start + pd.Timedelta(days=days)
+    with exchange._lock:
+        exchange._enter(market)
+        closed = exchange.closed(market, candleinterval)
+    candles = exchange.series(market, candleinterval)
+    lo, hi = np.searchsorted(candles["startsat"][:closed], [start.value, end.value])
+    return _candle_response({col: values[lo:hi] for col, values in candles.items()})
+
+
+ROUTES = [(method, re.compile(pattern), handler) for method, pattern, handler in [
+    ("GET", r"^/account$", lambda ex, **kw: {"accountId": ex.get_account_id()}),
+    ("GET", r"^/balances$", lambda ex, **kw: ex.get_balances()),
+    ("GET", r"^/balances/(?P<currency>[^/]+)$",
+     lambda ex, currency, **kw: next((b for b in ex.get_balances() if b["currencySymbol"] == currency),
+                                     {"currencySymbol": currency, "total": "0", "available": "0"})),
+    ("GET", r"^/markets$", lambda ex, **kw: ex.get_all_markets()),
+    ("GET", r"^/markets/(?P<market>[^/]+)$", lambda ex, market, **kw: ex.get_market(market)),
+    ("GET", r"^/markets/(?P<market>[^/]+)/summary$", lambda ex, market, **kw: ex.get_market_summary(market)),
+    ("GET", r"^/markets/(?P<market>[^/]+)/ticker$", lambda ex, market, **kw: ex.get_market_ticker(market)),
+    ("GET", r"^/markets/(?P<market>[^/]+)/candles/(?P<interval>[^/]+)/recent$",
+     lambda ex, market, interval, **kw: _candle_response(ex.get_recent_candles(market, CandleInterval(interval)))),
+    ("GET", r"^/markets/(?P<market>[^/]+)/candles/(?P<interval>[^/]+)/historical/(?P<year>\d+)/(?P<month>\d+)/(?P<day>\d+)$",
+     _historical),
+    ("POST", r"^/orders$", lambda ex, body, **kw: ex.place_order(_order_from_dict(body))),
+    ("GET", r"^/orders/open$", lambda ex, params, **kw: ex.get_orders("open", params.get("marketSymbol"))),
+    ("GET", r"^/orders/closed$", lambda ex, params, **kw: ex.get_orders("closed", params.get("marketSymbol"))),
+    ("GET", r"^/orders/(?P<order_id>[^/]+)$", lambda ex, order_id, **kw: ex.get_order(order_id)),
+    ("DELETE", r"^/orders/(?P<order_id>[^/]+)$", lambda ex, order_id, **kw: ex.cancel_order(order_id)),
+]]
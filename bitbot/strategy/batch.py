@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+from bitbot.strategy import cache
+
+
+# Indicators of many markets at once. The closes are a 2-D array shaped [candle, market]: every column holds the
+# candles of one market from the first row on and is padded with ``nan`` after its last candle. Every column gets
+# the values ``ta`` calculates for the candles of its market alone; the values of the padding are undefined.
+
+
+def check_fillna(fillna: bool):
+    if fillna:
+        raise ValueError("fillna is not supported by the indicators of many markets")
+
+
+def rsi(close: np.ndarray, window: int = 14, fillna: bool = False) -> dict[str, np.ndarray]:
+    """
+    Relative Strength Index of every column, see ``ta.momentum.RSIIndicator``
+
+    Returns:
+        dict[str, numpy.ndarray]: the ``"rsi"`` column
+
+    """
+    check_fillna(fillna)
+    diff = np.empty_like(close)
+    diff[:1] = np.nan
+    np.subtract(close[1:], close[:-1], out=diff[1:])
+    up, down = (pd.DataFrame(np.where(mask, np.abs(diff), 0.0)).ewm(alpha=1 / window, min_periods=window, adjust=False)
+                .mean().to_numpy() for mask in (diff > 0, diff < 0))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return {"rsi": np.where(down == 0, 100, 100 - (100 / (1 + up / down)))}
+
+
+def macd(close: np.ndarray, window_slow: int = 26, window_fast: int = 12, window_sign: int = 9,
+         fillna: bool = False) -> dict[str, np.ndarray]:
+    """
+    Moving Average Convergence Divergence of every column, see ``ta.trend.MACD``
+
+    Returns:
+        dict[str, numpy.ndarray]: the ``"macd"``, ``"macd_signal"`` and ``"macd_diff"`` columns
+
+    """
+    check_fillna(fillna)
+    close = pd.DataFrame(close)
+    macd = (cache.ema(close, window_fast) - cache.ema(close, window_slow)).to_numpy()
+    macd_signal = cache.ema(pd.DataFrame(macd), window_sign).to_numpy()
+    return {"macd": macd, "macd_signal": macd_signal, "macd_diff": macd - macd_signal}
+
+
+def roc(close: np.ndarray, window: int = 12, fillna: bool = False) -> dict[str, np.ndarray]:
+    """
+    Rate of Change in percent of every column, see ``ta.momentum.ROCIndicator``
+
+    Returns:
+        dict[str, numpy.ndarray]: the ``"roc"`` column
+
+    """
+    check_fillna(fillna)
+    close = pd.DataFrame(close)
+    shifted = close.shift(window)
+    return {"roc": (((close - shifted) / shifted) * 100).to_numpy()}
+
+
+#: the indicators of many markets by the name of their ``ta_params`` entry
+INDICATORS = {
+    "rsi": rsi,
+    "macd": macd,
+    "roc": roc,
+}
@@ -0,0 +1,109 @@
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+
+def fingerprint(series: pd.Series) -> bytes:
+    """
+    Returns a digest of the values of a series. Series with equal values and dtype share their cached indicators,
+    regardless of their index.
+
+    Args:
+        series (pandas.Series): the series
+
+    Returns:
+        bytes
+
+    """
+    values = np.ascontiguousarray(series.to_numpy())
+    digest = hashlib.blake2b(values.view(np.uint8), digest_size=16)
+    digest.update(str(values.dtype).encode())
+    return digest.digest()
+
+
+def ema(series: pd.Series, window: int) -> pd.Series:
+    """
+    Exponential Moving Average as ``ta`` calculates it for its indicators
+
+    """
+    return series.ewm(span=window, min_periods=window, adjust=False).mean()
+
+
+class IndicatorCache:
+    """
+    Thread safe LRU cache of indicator values. Entries are keyed by the ``fingerprint`` of the data series, the
+    indicator name and its parameters, so the same indicator over the same candles is computed only once, no matter
+    how many bots or backtest variants ask for it.
+
+    Attributes:
+        maxsize (int): the maximum number of cached arrays
+
+    Args:
+        maxsize (int=64): the maximum number of cached arrays
+
+    """
+    def __init__(self, maxsize: int = 64):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple, compute: callable) -> np.ndarray:
+        """
+        Returns the cached values of ``key`` or computes and caches them
+
+        Args:
+            key (tuple): the key, starting with the fingerprint of the data series
+            compute (callable): computes the values if they are not cached; may return a series or an array
+
+        Returns:
+            numpy.ndarray: the values; read-only, as they are shared
+
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+        values = np.asarray(compute())
+        values.flags.writeable = False
+
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = values
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return values
+
+    def evict(self, fp: bytes) -> int:
+        """
+        Removes the cached values of a data series, e.g.: of a chunk of a backtest that is not evaluated again
+
+        Args:
+            fp (bytes): the ``fingerprint`` of the data series
+
+        Returns:
+            int: the number of removed entries
+
+        """
+        with self._lock:
+            keys = [key for key in self._entries if key[0] == fp]
+            for key in keys:
+                del self._entries[key]
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+#: the cache shared by all strategies of the process
+INDICATOR_CACHE = IndicatorCache()
@@ -0,0 +1,155 @@
+import math
+from collections import deque
+
+
+NAN = float("nan")
+
+
+class EMA:
+    """
+    Streaming Exponential Moving Average. Updates in O(1) per value and matches ``ta.trend.EMAIndicator``: the mean
+    starts with the first value and is ``nan`` until ``window`` values have been seen. Leading ``nan`` values are skipped.
+
+    Args:
+        window (int=14): the number of periods, ``alpha = 2 / (window + 1)``
+        alpha (float=None): the smoothing factor; overrides ``window``
+
+    """
+    __slots__ = ("window", "alpha", "count", "mean")
+
+    def __init__(self, window: int = 14, alpha: float = None):
+        self.window = window
+        self.alpha = alpha if alpha is not None else 2 / (window + 1)
+        self.count = 0
+        self.mean = NAN
+
+    @property
+    def value(self) -> float:
+        return self.mean if self.count >= self.window else NAN
+
+    def update(self, value: float) -> float:
+        if math.isnan(value):
+            return self.value
+        self.mean = value if self.count == 0 else self.mean + self.alpha * (value - self.mean)
+        self.count += 1
+        return self.value
+
+    def seed(self, values) -> float:
+        for value in values:
+            self.update(float(value))
+        return self.value
+
+
+class RSI:
+    """
+    Streaming Relative Strength Index with Wilder smoothing. Matches ``ta.momentum.RSIIndicator``.
+
+    Args:
+        window (int=14): the number of periods
+
+    """
+    __slots__ = ("window", "last", "up", "down")
+    columns = ("rsi",)
+
+    def __init__(self, window: int = 14):
+        self.window = window
+        self.last = NAN
+        self.up = EMA(window, alpha=1 / window)
+        self.down = EMA(window, alpha=1 / window)
+
+    @property
+    def value(self) -> float:
+        up, down = self.up.value, self.down.value
+        if down == 0:
+            return 100.0
+        return 100 - 100 / (1 + up / down)
+
+    def update(self, close: float) -> float:
+        # ta counts the first (undefined) difference as no movement
+        diff = 0.0 if math.isnan(self.last) else close - self.last
+        self.last = close
+        self.up.update(diff if diff > 0 else 0.0)
+        self.down.update(-diff if diff < 0 else 0.0)
+        return self.value
+
+    def seed(self, closes) -> float:
+        for close in closes:
+            self.update(float(close))
+        return self.value
+
+
+class MACD:
+    """
+    Streaming Moving Average Convergence Divergence. Matches ``ta.trend.MACD``.
+
+    Args:
+        window_slow (int=26): the number of periods of the slow EMA
+        window_fast (int=12): the number of periods of the fast EMA
+        window_sign (int=9): the number of periods of the signal EMA
+
+    """
+    __slots__ = ("fast", "slow", "signal")
+    columns = ("macd", "macd_signal", "macd_diff")
+
+    def __init__(self, window_slow: int = 26, window_fast: int = 12, window_sign: int = 9):
+        self.fast = EMA(window_fast)
+        self.slow = EMA(window_slow)
+        self.signal = EMA(window_sign)
+
+    @property
+    def value(self) -> tuple[float, float, float]:
+        """
+        tuple[float, float, float]: ``macd``, ``macd_signal`` and ``macd_diff``
+
+        """
+        macd = self.fast.value - self.slow.value
+        signal = self.signal.value
+        return macd, signal, macd - signal
+
+    def update(self, close: float) -> tuple[float, float, float]:
+        self.signal.update(self.fast.update(close) - self.slow.update(close))
+        return self.value
+
+    def seed(self, closes) -> tuple[float, float, float]:
+        for close in closes:
+            self.update(float(close))
+        return self.value
+
+
+class ROC:
+    """
+    Streaming Rate of Change in percent. Matches ``ta.momentum.ROCIndicator``.
+
+    Args:
+        window (int=12): the number of periods
+
+    """
+    __slots__ = ("window", "closes")
+    columns = ("roc",)
+
+    def __init__(self, window: int = 12):
+        self.window = window
+        self.closes = deque(maxlen=window + 1)
+
+    @property
+    def value(self) -> float:
+        if len(self.closes) <= self.window:
+            return NAN
+        return (self.closes[-1] - self.closes[0]) / self.closes[0] * 100
+
+    def update(self, close: float) -> float:
+        self.closes.append(close)
+        return self.value
+
+    def seed(self, closes) -> float:
+        for close in closes:
+            self.update(float(close))
+        return self.value
+
+
+#: the streaming indicators by the name of their ``ta_params`` entry
+INDICATORS = {
+    "rsi": RSI,
+    "macd": MACD,
+    "roc": ROC,
+}
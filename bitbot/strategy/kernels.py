@@ -0,0 +1,250 @@
+import numpy as np
+
+# Indicator kernels on plain float arrays, an alternative to ``ta`` for backtests and parameter sweeps. The time is
+# the first axis of the values, any further axes are independent series, e.g.: the markets of a portfolio. Window
+# parameters may be lists, which computes every window in one call; the results get a last axis with one entry per
+# window then. The values match ``ta`` up to a few units in the last place.
+#
+# The exponential smoothing ``y[t] = d * y[t-1] + a * x[t]`` is a recurrence, which ``ta`` computes candle by candle.
+# Here the series are cut into blocks of ``BLOCK`` values: within a block the smoothing is a product with a fixed
+# triangular matrix of the powers of ``d``, so all blocks of all series are one matrix product. The last values of
+# the blocks are a recurrence with the decay ``d ** BLOCK`` themselves, which is solved the same way, and added to
+# the blocks that follow them.
+
+#: the number of values smoothed by one matrix product
+BLOCK = 32
+
+
+def decay_matrix(decay: float, n: int, scale: float = 1.0) -> np.ndarray:
+    """
+    Returns the matrix ``m`` of a recurrence with ``x @ m == y``: ``m[j, i] = scale * decay ** (i - j)`` for
+    ``i >= j``, ``0`` otherwise
+
+    """
+    steps = np.arange(n)[None, :] - np.arange(n)[:, None]
+    return np.where(steps >= 0, scale * decay ** np.maximum(steps, 0), 0.0)
+
+
+def recurrence(x: np.ndarray, decay: float, scale: float = 1.0) -> np.ndarray:
+    """
+    Solves ``y[:, t] = decay * y[:, t-1] + scale * x[:, t]`` with ``y[:, -1] = 0`` for every row of ``x``
+
+    Args:
+        x (numpy.ndarray): float64 shaped [series, time]
+        decay (float): the decay per step
+        scale (float=1.0): the weight of the new values
+
+    Returns:
+        numpy.ndarray: float64 shaped [series, time]
+
+    """
+    series, n = x.shape
+    if n <= BLOCK:
+        return x @ decay_matrix(decay, n, scale)
+
+    blocks = -(-n // BLOCK)
+    if blocks * BLOCK != n:
+        x = np.concatenate((x, np.zeros((series, blocks * BLOCK - n))), axis=1)
+    y = (x.reshape(series * blocks, BLOCK) @ decay_matrix(decay, BLOCK, scale)).reshape(series, blocks, BLOCK)
+
+    # the blocks start with the last value of the block before them
+    carry = recurrence(y[:, :-1, -1], decay ** BLOCK)
+    y[:, 1:, :] += carry[:, :, None] * decay ** np.arange(1, BLOCK + 1)
+    return y.reshape(series, blocks * BLOCK)[:, :n]
+
+
+def series_first(values: np.ndarray) -> np.ndarray:
+    """
+    Returns the values as float64 shaped [series, time], the time in the last axis
+
+    """
+    values = np.asarray(values)
+    # always a copy, the kernels work in place
+    return np.array(values.reshape(len(values), -1).T, dtype=np.float64, order="C")
+
+
+def time_first(values: np.ndarray, shape: tuple[int, ...]) -> np.ndarray:
+    """
+    Inverse of ``series_first``: the values shaped [series, time] as an array shaped ``shape``, the time in the
+    first axis
+
+    """
+    return values.T.reshape(shape)
+
+
+def smooth(values: np.ndarray, alpha: float, min_periods: int = 0) -> np.ndarray:
+    """
+    Exponential smoothing of every series, as ``pandas.DataFrame.ewm(alpha=alpha, min_periods=min_periods, adjust=False).mean()``
+    calculates it. A series starts with its first value that is not ``nan``; values after it must not be ``nan``,
+    except for a padding at the end, whose results are ``nan``.
+
+    Args:
+        values (numpy.ndarray): the values, the time in the first axis
+        alpha (float): the smoothing factor
+        min_periods (int=0): the number of values before the first result
+
+    Returns:
+        numpy.ndarray: float64 shaped like ``values``
+
+    """
+    x = series_first(values)
+    missing = np.isnan(x)
+    gaps = missing.any()
+    if gaps:
+        first = np.where(missing.all(axis=1), x.shape[1], missing.argmin(axis=1))
+        x[missing] = 0.0
+    else:
+        first = np.zeros(len(x), dtype=np.int64)
+    # the first value is taken as it is
+    rows = np.flatnonzero(first < x.shape[1])
+    x[rows, first[rows]] /= alpha
+
+    y = recurrence(x, 1 - alpha, alpha)
+    if gaps:
+        y[missing] = np.nan
+    # no results before ``min_periods`` values
+    lead = first + max(min_periods, 1) - 1
+    if (lead == lead[0]).all():
+        y[:, :lead[0]] = np.nan
+    else:
+        y[np.arange(x.shape[1])[None, :] < lead[:, None]] = np.nan
+    return time_first(y, np.shape(values))
+
+
+def ema(values: np.ndarray, window: int, fillna: bool = False) -> np.ndarray:
+    """
+    Exponential Moving Average with ``alpha = 2 / (window + 1)``, as ``ta`` calculates it for its indicators
+
+    """
+    return smooth(values, 2 / (window + 1), 0 if fillna else window)
+
+
+def wilder(values: np.ndarray, window: int, fillna: bool = False) -> np.ndarray:
+    """
+    Wilder's smoothing, an Exponential Moving Average with ``alpha = 1 / window``, as ``ta`` calculates it for the RSI
+
+    """
+    return smooth(values, 1 / window, 0 if fillna else window)
+
+
+def batched(*params: int or list[int]) -> tuple[list[tuple[int, ...]], bool]:
+    """
+    Returns the combinations of window parameters, the lists among them zipped and the single values repeated, and
+    whether any of them was a list
+
+    """
+    lists = [p for p in params if isinstance(p, (list, tuple))]
+    if not lists:
+        return [params], False
+    if len({len(p) for p in lists}) != 1:
+        raise ValueError("the window lists of a kernel must have the same length")
+    n = len(lists[0])
+    return list(zip(*(p if isinstance(p, (list, tuple)) else [p] * n for p in params))), True
+
+
+def fill(values: np.ndarray, value: float) -> np.ndarray:
+    """
+    Fills the gaps of the results like ``ta`` with ``fillna``: infinite values are gaps, gaps take the last value
+    before them, leading gaps ``value``
+
+    """
+    values = np.where(np.isinf(values), np.nan, values)
+    shape = values.shape
+    values = values.reshape(len(values), -1)
+    rows = np.where(np.isnan(values), 0, np.arange(len(values))[:, None])
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    values = np.take_along_axis(values, rows, axis=0)
+    return np.where(np.isnan(values), value, values).reshape(shape)
+
+
+def stack(results: list[np.ndarray], batch: bool) -> np.ndarray:
+    return np.stack(results, axis=-1) if batch else results[0]
+
+
+def rsi(close: np.ndarray, window: int or list[int] = 14, fillna: bool = False) -> dict[str, np.ndarray]:
+    """
+    Relative Strength Index, see ``ta.momentum.RSIIndicator``. The differences of the closes are shared by all windows.
+
+    Returns:
+        dict[str, numpy.ndarray]: the ``"rsi"`` column
+
+    """
+    close = np.asarray(close)
+    # the differences in the precision of the closes, as ``ta`` takes them; the first one counts as no movement
+    diff = np.empty_like(close)
+    diff[:1] = 0.0
+    np.subtract(close[1:], close[:-1], out=diff[1:])
+    up = np.maximum(diff, 0.0)
+    down = np.maximum(np.negative(diff, out=diff), 0.0)
+
+    out = []
+    windows, batch = batched(window)
+    for (w,) in windows:
+        ema_up, ema_down = wilder(up, w, fillna), wilder(down, w, fillna)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            values = np.where(ema_down == 0, 100, 100 - (100 / (1 + ema_up / ema_down)))
+        if fillna:
+            values = fill(values, 50)
+        out.append(values)
+    return {"rsi": stack(out, batch)}
+
+
+def macd(close: np.ndarray, window_slow: int or list[int] = 26, window_fast: int or list[int] = 12,
+         window_sign: int or list[int] = 9, fillna: bool = False) -> dict[str, np.ndarray]:
+    """
+    Moving Average Convergence Divergence, see ``ta.trend.MACD``. Combinations with a common window share its EMA.
+
+    Returns:
+        dict[str, numpy.ndarray]: the ``"macd"``, ``"macd_signal"`` and ``"macd_diff"`` columns
+
+    """
+    emas = {}
+
+    def cached(key: tuple, compute: callable) -> np.ndarray:
+        if key not in emas:
+            emas[key] = compute()
+        return emas[key]
+
+    out = {"macd": [], "macd_signal": [], "macd_diff": []}
+    windows, batch = batched(window_slow, window_fast, window_sign)
+    for slow, fast, sign in windows:
+        macd = cached(("macd", slow, fast), lambda: cached(fast, lambda: ema(close, fast, fillna))
+                      - cached(slow, lambda: ema(close, slow, fillna)))
+        signal = cached(("signal", slow, fast, sign), lambda: ema(macd, sign, fillna))
+        diff = macd - signal
+        if fillna:
+            macd, signal, diff = (fill(v, 0) for v in (macd, signal, diff))
+        out["macd"].append(macd)
+        out["macd_signal"].append(signal)
+        out["macd_diff"].append(diff)
+    return {col: stack(values, batch) for col, values in out.items()}
+
+
+def roc(close: np.ndarray, window: int or list[int] = 12, fillna: bool = False) -> dict[str, np.ndarray]:
+    """
+    Rate of Change in percent, see ``ta.momentum.ROCIndicator``. Calculated in the precision of the closes, as ``ta``
+    does.
+
+    Returns:
+        dict[str, numpy.ndarray]: the ``"roc"`` column
+
+    """
+    close = np.asarray(close)
+    out = []
+    windows, batch = batched(window)
+    for (w,) in windows:
+        shifted = np.full_like(close, np.nan)
+        shifted[w:] = close[:max(len(close) - w, 0)]
+        values = ((close - shifted) / shifted) * 100
+        if fillna:
+            values = fill(values, 0)
+        out.append(values)
+    return {"roc": stack(out, batch)}
+
+
+#: the kernels by the name of their ``ta_params`` entry
+INDICATORS = {
+    "rsi": rsi,
+    "macd": macd,
+    "roc": roc,
+}
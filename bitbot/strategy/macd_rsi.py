@@ -2,17 +2,22 @@ from bitbot.strategy import TradingStrategyInterface
 import datetime as dt
 from bitbot import services
 import logging
+import numpy as np
 import pandas as pd
 
 class MacdRsiAlgorithm(TradingStrategyInterface):
+    required_indicators = ("macd", "rsi")
 
     def generate_signal(self, candles: pd.DataFrame, log: callable) -> services.OrderDirection:
         last_valid_index = candles.last_valid_index()
         if last_valid_index is None:
             return services.OrderDirection.NONE
-            
-        rsi = candles.loc[last_valid_index, "rsi"]
-        macd, signal, diff = candles.loc[last_valid_index, ["macd", "macd_signal", "macd_diff"]].to_list()
+
+        return self.evaluate(candles.loc[last_valid_index].to_dict(), log)
+
+    def evaluate(self, latest: dict[str, any], log: callable) -> services.OrderDirection:
+        rsi = latest["rsi"]
+        macd, signal, diff = latest["macd"], latest["macd_signal"], latest["macd_diff"]
 
         log(f"## {self.market} ## RSI: {rsi:.2f} MACD: {macd:.2f} SIGNAL: {signal:.2f} DIFF: {diff:.2f}")
         if self.next_action == services.OrderDirection.BUY:
@@ -28,3 +33,12 @@ class MacdRsiAlgorithm(TradingStrategyInterface):
                 
                 return services.OrderDirection.SELL
         return services.OrderDirection.NONE
+
+    def signal_masks(self, candles: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+        rsi = np.asarray(candles["rsi"], dtype=np.float64)
+        macd, signal, diff = (np.asarray(candles[col], dtype=np.float64) for col in ["macd", "macd_signal", "macd_diff"])
+
+        trigger_diff = self.trigger_params["macd_trigger_diff"]
+        macd_mask = (np.abs(diff) < trigger_diff) & (np.abs(macd) > trigger_diff) & (np.abs(signal) > trigger_diff)
+
+        return (rsi < self.trigger_params["rsi_buy"]) & macd_mask, (rsi > self.trigger_params["rsi_sell"]) & macd_mask
@@ -1,7 +1,8 @@
 from abc import abstractmethod
 import json
 from bitbot import services
-from ta import momentum, trend
+from bitbot.strategy import cache, indicators, kernels
+import numpy as np
 import pandas as pd
 
 
@@ -14,6 +15,9 @@ class TradingStrategyInterface:
         config (dict[str, any]): the strategy configuration
         market (str):
         trigger_params (dict[str, any]): the parameter used to trigger a sell or buy order
+        kernels (bool): whether the indicators of backtests are calculated by the NumPy ``kernels`` instead of ``ta``;
+            ``indicators: numpy`` in the strategy configuration
+        window (services.CandleWindow): the closed candles of the live loop, set by the bot running the strategy
 
     Args:
         service (services.ServiceInterface): the service to be used for requests
@@ -33,58 +37,179 @@ class TradingStrategyInterface:
         
         self.market = market        
         self.trigger_params = self.config["trigger_params"]
+
+        source = self.config.get("indicators", "ta")
+        if source not in ("ta", "numpy"):
+            raise ValueError(f"unknown indicators {source}, use ta or numpy")
+        self.kernels = source == "numpy"
          
         self.next_action = services.OrderDirection.BUY
+        self.live_indicators = {}
+        self.window = None
+
+    #: the ``ta_params`` entries the strategy needs; defaults to all configured entries
+    required_indicators = ()
+
+    #: number of candles after a buy in which no sell can be triggered by the vectorized path
+    min_hold = 0
     
     def calc_rsi(self, candles: pd.DataFrame, **kwargs) -> pd.DataFrame:
         """
-        Method to calulate the Relative Strength Index of the specified data. Accepts the same parameter as in :ref:`ta.momentum.RSIIndicator<https://technical-analysis-library-in-python.readthedocs.io/en/latest/ta.html#ta.momentum.RSIIndicator>`
+        Method to calulate the Relative Strength Index of the specified data. Accepts the same parameter as in :ref:`ta.momentum.RSIIndicator<https://technical-analysis-library-in-python.readthedocs.io/en/latest/ta.html#ta.momentum.RSIIndicator>`.
+        The values are memoized in the ``INDICATOR_CACHE``. Calculated by ``kernels.rsi`` if ``kernels`` is set.
 
         
         Args:
             candles (pd.Dataframe): the Dataframe to which the rsi should be applied to
 
         Returns:
-            pd.DataFrame: returns the same dataframe with a ``"rsi"`` column
+            pd.DataFrame: returns a copy of the dataframe with a ``"rsi"`` column
 
         """
-        ind = momentum.RSIIndicator(candles["close"], **kwargs)
-        candles["rsi"] = ind.rsi()
+        close = candles["close"]
+        key = (cache.fingerprint(close), "rsi", tuple(sorted(kwargs.items())))
+        if self.kernels:
+            rsi = cache.INDICATOR_CACHE.get(key + ("numpy",), lambda: kernels.rsi(close.to_numpy(), **kwargs)["rsi"])
+        else:
+            from ta import momentum
+
+            rsi = cache.INDICATOR_CACHE.get(key, lambda: momentum.RSIIndicator(close, **kwargs).rsi())
 
-        return candles
+        return candles.assign(rsi=pd.Series(rsi, index=candles.index, copy=True))
     
-    def calc_macd(self, candles: pd.DataFrame, **kwargs) -> pd.DataFrame:
+    def calc_macd(self, candles: pd.DataFrame, window_slow: int = 26, window_fast: int = 12, window_sign: int = 9,
+                  fillna: bool = False) -> pd.DataFrame:
         """
-        Method to calulate the Moving Average Convergence Divergence of the most recent data. Accepts the same parameter as in :ref:`ta.trend.MACD<https://technical-analysis-library-in-python.readthedocs.io/en/latest/ta.html#ta.trend.MACD>`
+        Method to calulate the Moving Average Convergence Divergence of the most recent data. Accepts the same parameter as in :ref:`ta.trend.MACD<https://technical-analysis-library-in-python.readthedocs.io/en/latest/ta.html#ta.trend.MACD>`.
+        The values and the EMAs they are based on are memoized in the ``INDICATOR_CACHE``, so MACDs with a common
+        window share their EMAs. Calculated by ``kernels.ema`` if ``kernels`` is set.
 
         Args:
             candles (pd.Dataframe): the Dataframe to which the macd should be applied to
 
         Returns:
-            pd.DataFrame: returns the same dataframe with ``"macd"``, ``"macd_signal"`` and ``"macd_diff"`` columns
+            pd.DataFrame: returns a copy of the dataframe with ``"macd"``, ``"macd_signal"`` and ``"macd_diff"`` columns
 
         """
-        obj = trend.MACD(candles["close"], **kwargs)
-        candles.loc[:, "macd"] = obj.macd()
-        candles.loc[:, "macd_signal"] = obj.macd_signal()
-        candles.loc[:, "macd_diff"] = obj.macd_diff()
-        return candles
+        close = candles["close"]
+        if fillna and self.kernels:
+            return candles.assign(**{col: pd.Series(values, index=candles.index) for col, values in
+                                     kernels.macd(close.to_numpy(), window_slow, window_fast, window_sign, fillna).items()})
+        if fillna:
+            from ta import trend
+
+            obj = trend.MACD(close, window_slow, window_fast, window_sign, fillna)
+            return candles.assign(macd=obj.macd(), macd_signal=obj.macd_signal(), macd_diff=obj.macd_diff())
+
+        fp = cache.fingerprint(close)
+        # the kernels are cached apart from ta
+        if self.kernels:
+            ema, tag = kernels.ema, ("numpy",)
+        else:
+            ema, tag = (lambda values, window: cache.ema(pd.Series(values), window)), ()
+        ema_fast = cache.INDICATOR_CACHE.get((fp, "ema", window_fast) + tag, lambda: ema(close.to_numpy(), window_fast))
+        ema_slow = cache.INDICATOR_CACHE.get((fp, "ema", window_slow) + tag, lambda: ema(close.to_numpy(), window_slow))
+        macd = cache.INDICATOR_CACHE.get((fp, "macd", window_slow, window_fast) + tag, lambda: ema_fast - ema_slow)
+        macd_signal = cache.INDICATOR_CACHE.get((fp, "macd_signal", window_slow, window_fast, window_sign) + tag,
+                                                lambda: ema(macd, window_sign))
+
+        return candles.assign(
+            macd=pd.Series(macd, index=candles.index, copy=True),
+            macd_signal=pd.Series(macd_signal, index=candles.index, copy=True),
+            macd_diff=pd.Series(macd - macd_signal, index=candles.index),
+        )
     
     def calc_roc(self, candles: pd.DataFrame, **kwargs) -> pd.DataFrame:
         """
-        Method to calulate the Rate of Change of the given data. Accepts the same parameter as in :ref:`ta.momentum.ROCIndicator<https://technical-analysis-library-in-python.readthedocs.io/en/latest/ta.html#ta.momentum.ROCIndicator>`
+        Method to calulate the Rate of Change of the given data. Accepts the same parameter as in :ref:`ta.momentum.ROCIndicator<https://technical-analysis-library-in-python.readthedocs.io/en/latest/ta.html#ta.momentum.ROCIndicator>`.
+        The values are memoized in the ``INDICATOR_CACHE``. Calculated by ``kernels.roc`` if ``kernels`` is set.
 
         Args:
             candles (pd.Dataframe): the Dataframe to which the macd should be applied to
 
         Returns:
-            pd.DataFrame: returns the same dataframe with a ``"roc"`` column
+            pd.DataFrame: returns a copy of the dataframe with a ``"roc"`` column
 
         """
-        obj = momentum.ROCIndicator(candles["close"], **kwargs)
-        candles.loc[:, "roc"] = obj.roc()
-        return candles
+        close = candles["close"]
+        key = (cache.fingerprint(close), "roc", tuple(sorted(kwargs.items())))
+        if self.kernels:
+            roc = cache.INDICATOR_CACHE.get(key + ("numpy",), lambda: kernels.roc(close.to_numpy(), **kwargs)["roc"])
+        else:
+            from ta import momentum
+
+            roc = cache.INDICATOR_CACHE.get(key, lambda: momentum.ROCIndicator(close, **kwargs).roc())
+
+        return candles.assign(roc=pd.Series(roc, index=candles.index, copy=True))
         
+    def indicator_params(self, ta_params: dict[str, dict[str, any]] = None) -> dict[str, dict[str, any]]:
+        """
+        Method to get the parameters of every indicator the strategy needs. Indicators the strategy does not declare
+        in ``required_indicators`` are left out.
+
+        Args:
+            ta_params (dict[str, dict[str, any]]=None): the parameters to use instead of the configured ``ta_params``
+
+        Returns:
+            dict[str, dict[str, any]]: the ``ta_params`` by indicator name
+
+        """
+        if ta_params is None:
+            ta_params = self.config.get("ta_params", {})
+        names = self.required_indicators or tuple(ta_params)
+        return {name: ta_params.get(name, {}) for name in names}
+
+    def latest_values(self, time: any, close: float) -> dict[str, any]:
+        """
+        Method to get the latest values of the streaming indicators
+
+        Args:
+            time (any): the start time of the latest candle
+            close (float): the close of the latest candle
+
+        Returns:
+            dict[str, any]: the values by column name, as in the last row of a DataFrame with all indicators applied
+
+        """
+        latest = {"startsat": time, "close": close}
+        for ind in self.live_indicators.values():
+            value = ind.value
+            latest.update(zip(ind.columns, value if isinstance(value, tuple) else (value,)))
+        return latest
+
+    def seed_indicators(self, candles: pd.DataFrame) -> dict[str, any]:
+        """
+        Method to (re)create the streaming indicators of the live loop and seed them with history candles
+
+        Args:
+            candles (pandas.DataFrame or services.CandleWindow): the candles to seed the indicators with
+
+        Returns:
+            dict[str, any]: the latest values, see ``latest_values``
+
+        """
+        self.live_indicators = {name: indicators.INDICATORS[name](**params) for name, params in self.indicator_params().items()}
+        closes = np.asarray(candles["close"], dtype=np.float64)
+        for ind in self.live_indicators.values():
+            ind.seed(closes)
+        return self.latest_values(pd.Timestamp(np.asarray(candles["startsat"])[-1]), closes[-1])
+
+    def update_indicators(self, time: any, close: float) -> dict[str, any]:
+        """
+        Method to update the streaming indicators with a new closed candle in O(1)
+
+        Args:
+            time (any): the start time of the candle
+            close (float): the close of the candle
+
+        Returns:
+            dict[str, any]: the latest values, see ``latest_values``
+
+        """
+        for ind in self.live_indicators.values():
+            ind.update(close)
+        return self.latest_values(time, close)
+
     @abstractmethod
     def generate_signal(self, candles: pd.DataFrame, log: callable) -> services.OrderDirection:
         """
@@ -100,5 +225,108 @@ class TradingStrategyInterface:
         """
         pass
 
-    
-    
\ No newline at end of file
+    @abstractmethod
+    def evaluate(self, latest: dict[str, any], log: callable) -> services.OrderDirection:
+        """
+        Method to generate a buying or selling signal from the latest indicator values. Used by the live loop, which
+        keeps streaming indicators instead of DataFrames.
+
+        Args:
+            latest (dict[str, any]): the latest values, see ``latest_values``
+            log (callable): A function to log any message to the console. Accepts only one parameter that is a str
+
+        Returns:
+            services.OrderDirection
+
+        """
+        pass
+
+    def signal_masks(self, candles: pd.DataFrame) -> tuple[np.ndarray, np.ndarray] or None:
+        """
+        Optional vectorized counterpart of ``generate_signal``. Computes the buy and sell conditions for every row
+        of ``candles`` in one pass, as if the row was the most recent candle handed to ``generate_signal``.
+        Strategies that do not implement it return ``None`` and are backtested row by row.
+        The portfolio backtest hands 2-D arrays shaped [candle, market] instead of columns, so implementations should
+        only use element-wise operations.
+
+        Args:
+            candles (pandas.DataFrame or dict[str, numpy.ndarray]): The candles with all needed technical Indicators applied
+
+        Returns:
+            tuple[numpy.ndarray, numpy.ndarray] or None: boolean buy and sell masks, shaped like the columns
+
+        """
+        return None
+
+    def signal_rows(self, candles: pd.DataFrame, window: int = 100) -> tuple[np.ndarray, np.ndarray] or None:
+        """
+        Method to get the rows of a whole backtest in which ``generate_signal`` would signal a buy or a sell, before
+        the alternation of buying and selling is resolved. Row ``i`` is based on ``candles.iloc[i-window:i]``.
+
+        Args:
+            candles (pandas.DataFrame): The candles with all needed technical Indicators applied
+            window (int): the number of candles the row by row backtest hands to ``generate_signal``
+
+        Returns:
+            tuple[numpy.ndarray, numpy.ndarray] or None: the sorted buy rows and sell rows. ``None`` if the strategy
+            has no vectorized implementation
+
+        """
+        masks = self.signal_masks(candles)
+        if masks is None:
+            return None
+
+        # the signal of row i is based on the candles up to row i-1
+        buy_mask, sell_mask = (np.concatenate(([False], np.asarray(mask, dtype=bool)[:-1])) for mask in masks)
+        buy_mask[:window] = False
+        sell_mask[:window] = False
+        if self.min_hold >= window:
+            # the candles since the buy never fill the window
+            sell_mask[:] = False
+
+        return np.flatnonzero(buy_mask), np.flatnonzero(sell_mask)
+
+    def generate_signals(self, candles: pd.DataFrame, window: int = 100) -> np.ndarray or None:
+        """
+        Method to generate the signals of a whole backtest at once. Each row ``i`` gets the signal ``generate_signal``
+        would return for ``candles.iloc[i-window:i]``, alternating between buying and selling starting with ``next_action``.
+
+        Args:
+            candles (pandas.DataFrame): The candles with all needed technical Indicators applied
+            window (int): the number of candles the row by row backtest hands to ``generate_signal``
+
+        Returns:
+            numpy.ndarray or None: ``1`` for buys, ``-1`` for sells and ``0`` otherwise. ``None`` if the strategy
+            has no vectorized implementation
+
+        """
+        rows = self.signal_rows(candles, window)
+        if rows is None:
+            return None
+
+        buys, sells = rows
+        orders = np.zeros(len(candles.index), dtype=np.int8)
+
+        # resolve the alternation of buying and selling
+        pos = 0
+        action = self.next_action
+        while True:
+            if action == services.OrderDirection.BUY:
+                k = np.searchsorted(buys, pos)
+                if k == len(buys):
+                    break
+                pos = buys[k]
+                orders[pos] = 1
+                pos += 1 + self.min_hold
+                action = services.OrderDirection.SELL
+            else:
+                k = np.searchsorted(sells, pos)
+                if k == len(sells):
+                    break
+                pos = sells[k]
+                orders[pos] = -1
+                pos += 1
+                action = services.OrderDirection.BUY
+
+        self.next_action = action
+        return orders
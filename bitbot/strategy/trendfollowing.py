@@ -2,34 +2,61 @@ from bitbot.strategy import TradingStrategyInterface
 from bitbot import services
 import datetime as dt
 import logging
+import numpy as np
 import pandas as pd
 
 
 class TrendFollowing(TradingStrategyInterface):
+    required_indicators = ("roc",)
+
+    #: number of candles the live loop has seen since the last buy
+    candles_since_buy = 0
+
+    @property
+    def min_hold(self) -> int:
+        # the return since buy needs ``window`` candles after the buy
+        return self.config["ta_params"]["roc"].get("window", 12)
+
     def generate_signal(self, candles: pd.DataFrame, log: callable) -> services.OrderDirection:
         last_valid_index = candles.last_valid_index()
         if last_valid_index is None:
             return services.OrderDirection.NONE
 
-        roc = candles.loc[last_valid_index, "roc"]
-        
+        latest = candles.loc[last_valid_index].to_dict()
+        if self.next_action == services.OrderDirection.SELL:
+            candles_since_buy = self.calc_roc(candles.loc[candles["startsat"] > self.buytime].copy(), **self.config["ta_params"]["roc"])
+            latest["roc_since_buy"] = candles_since_buy.loc[candles_since_buy.last_valid_index(), "roc"]
+
+        return self.evaluate(latest, log)
+
+    def update_indicators(self, time: any, close: float) -> dict[str, any]:
+        latest = super().update_indicators(time, close)
+        self.candles_since_buy += 1
+        # the rate of change over the candles since buy equals the regular one, once it spans only those candles
+        latest["roc_since_buy"] = latest["roc"] if self.candles_since_buy > self.min_hold else float("nan")
+        return latest
+
+    def evaluate(self, latest: dict[str, any], log: callable) -> services.OrderDirection:
+        roc = latest["roc"]
 
         if self.next_action == services.OrderDirection.BUY:
             log(f"## {self.market} ## change: {roc*100} %")
             if roc > self.trigger_params["buy_percentage"]:
-                self.buytime = candles.loc[last_valid_index, "startsat"]
+                self.buytime = latest["startsat"]
+                self.candles_since_buy = 0
                 return services.OrderDirection.BUY
         else:          
             # selling
-            candles_since_buy = self.calc_roc(candles.loc[candles["startsat"] > self.buytime].copy(), **self.config["ta_params"]["roc"])
-            roc_since_buy = candles_since_buy.loc[candles_since_buy.last_valid_index(), "roc"]
+            roc_since_buy = latest.get("roc_since_buy", float("nan"))
             
             log(f"## {self.market} ## return since buy: {roc_since_buy*100} %")
             if roc_since_buy > self.trigger_params["sell_high"] or roc_since_buy < self.trigger_params["sell_low"]:
                 return services.OrderDirection.SELL
 
         return services.OrderDirection.NONE
-        
-        
 
-        
+    def signal_masks(self, candles: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+        roc = np.asarray(candles["roc"], dtype=np.float64)
+        # past ``min_hold`` the return since buy equals the rate of change of the whole frame
+        return roc > self.trigger_params["buy_percentage"], \
+            (roc > self.trigger_params["sell_high"]) | (roc < self.trigger_params["sell_low"])
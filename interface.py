@@ -8,14 +8,12 @@ options = """
 Options:
 
 start [all | <BotName>]     Starts all or just a specific bot
+stop [all | <BotName>]      Stops all or just a specific bot
 quit                        Quits this application
 change [cfg]                Change the config file
 
 """
 
-def start_bot(bot_name: str):
-    subprocess.Popen(f"start /wait python main.py -b {bot_name}", shell=True)
-
 def main():
 
     print(NAME)
@@ -29,16 +27,19 @@ def main():
         cmd = args[0].lower()
         args = args[1:]
 
-        if cmd == "start":
-            if "all" in args:
-                for bot_name in bm.bots:
-                    start_bot(bot_name)
-            else:
-                for bot_name in args:
-                    start_bot(bot_name)
+        if cmd in ("start", "stop"):
+            # all bots run as tasks of one event loop in this process
+            action = bm.start_bot_background if cmd == "start" else bm.stop_bot
+            bot_names = list(bm.config if cmd == "start" else bm.tasks) if "all" in args else args
+            for bot_name in bot_names:
+                try:
+                    action(bot_name)
+                except ValueError as e:
+                    print(e)
         elif cmd == "help":
             print(options)
         elif cmd == "quit":
+            bm.stop_all()
             print("Bye Bye")
             return
         else:
@@ -1,5 +1,4 @@
 import logging
-from bitbot.strategy import *
 from bitbot import BotManager, NAME
 import sys
 import getopt
@@ -17,7 +16,7 @@ HELP_STR = f"""
 {'[-b, --bots]':<24} the bots from the config to start, seperated by ';'
 {24*' '}     e.g.: -b "MyFavBot;My2ndFavBot"
 
-{'[-t, --threaded]':<24} run the each bot in a seperate thread
+{'[-t, --threaded]':<24} run all bots as tasks of a single event loop in this process
 """
 
 
@@ -26,9 +25,10 @@ def main(argv: list[str]):
 
     config = r".\example_config.yml"
     bot_name = ""
+    threaded = False
 
     try:
-        opts, _ = getopt.getopt(argv, "hc:b:",["help", "config=","bots="])
+        opts, _ = getopt.getopt(argv, "hc:b:t",["help", "config=","bots=", "threaded"])
     except getopt.GetoptError as e:
         print(e)
         print(HELP_STR)
@@ -41,11 +41,16 @@ def main(argv: list[str]):
             config = arg
         elif opt in ("-b", "--bots"):
             bot_name = arg
+        elif opt in ("-t", "--threaded"):
+            threaded = True
         
     bm = BotManager(config)
     
-    if bot_name:
-        bm.start_bot(bot_name)
+    bot_names = [name for name in bot_name.split(";") if name]
+    if threaded or len(bot_names) > 1:
+        bm.run_bots(bot_names)
+    elif bot_names:
+        bm.start_bot(bot_names[0])
         
         
         
@@ -0,0 +1,82 @@
+import logging
+import json
+from bitbot import NAME, optimizer
+import sys
+import getopt
+import yaml
+
+logging.basicConfig(format='[%(asctime)s] [%(levelname)s]: %(message)s', level=logging.INFO)
+
+
+HELP_STR = f"""
+{'[-h, --help]':<24} this help page
+
+{'[-c, --config]':<24} the config file you want to use 
+{24*' '}     e.g.: -c "./myconfig.yml"
+
+{'[-b, --bot]':<24} the backtest bot from the config to optimize
+{24*' '}     e.g.: -b "MyFavBot"
+
+{'[-w, --workers]':<24} the number of worker processes, defaults to all cores
+
+{'[-n, --top]':<24} the number of best parameter sets to print, defaults to 10
+
+{'[-o, --output]':<24} a file to write all results to as JSON
+"""
+
+
+def main(argv: list[str]):
+    print(NAME)
+
+    config = r".\example_config.yml"
+    bot_name = ""
+    workers = None
+    top = 10
+    output = ""
+
+    try:
+        opts, _ = getopt.getopt(argv, "hc:b:w:n:o:", ["help", "config=", "bot=", "workers=", "top=", "output="])
+    except getopt.GetoptError as e:
+        print(e)
+        print(HELP_STR)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            print(HELP_STR)
+            sys.exit()
+        elif opt in ("-c", "--config"):
+            config = arg
+        elif opt in ("-b", "--bot"):
+            bot_name = arg
+        elif opt in ("-w", "--workers"):
+            workers = int(arg)
+        elif opt in ("-n", "--top"):
+            top = int(arg)
+        elif opt in ("-o", "--output"):
+            output = arg
+
+    with open(config, "r") as stream:
+        cfg = yaml.safe_load(stream)
+    if bot_name not in cfg:
+        print(f"{bot_name} not defined in config")
+        sys.exit(2)
+
+    results = optimizer.Optimizer(bot_name, cfg[bot_name], workers).run()
+
+    print(f"\n\n### Best parameters {bot_name} ###\n")
+    for res in results[:top]:
+        print(f"{'Profit:':<32}{res['profit']}\n"
+              f"{'Transactions made:':<32}{res['transactions']}\n"
+              f"{'Success rate:':<32}{round(res['success_rate']*100, 4)} %\n"
+              f"{'Profit increase:':<32}{round(res['profit_increase']*100, 4)} %\n"
+              f"{'Max drawdown:':<32}{round(res['max_drawdown']*100, 4)} %\n"
+              f"{'ta_params:':<32}{res['ta_params']}\n"
+              f"{'trigger_params:':<32}{res['trigger_params']}\n")
+
+    if output:
+        with open(output, "w", encoding="utf8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])